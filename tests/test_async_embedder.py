@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.embedding import MemoryEmbedder, close_async_sessions
+
+
+class TestAsyncEmbedder(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patcher = patch("trade_agents.memory.embedding.tiktoken")
+        tiktoken = patcher.start()
+        self.addCleanup(patcher.stop)
+        # one token per word
+        self.encode = tiktoken.get_encoding.return_value.encode
+        self.encode.side_effect = str.split
+
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = 0
+
+        app = web.Application()
+        app.router.add_post("/embed", self.embed)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/embed"
+
+    async def asyncTearDown(self):
+        await close_async_sessions()
+        await self.runner.cleanup()
+
+    async def embed(self, request):
+        if self.failures:
+            self.failures -= 1
+            return web.Response(status=503, text="loading model")
+        inputs = (await request.json())["inputs"]
+        self.batches.append(inputs)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        return web.json_response([[float(len(text)), 1.0] for text in inputs])
+
+    def make_embedder(self, **config) -> MemoryEmbedder:
+        config = MarketMemoryConfig(embedding_api_url=self.url, embedding_cache_size=0, retry_delay=0.01, **config)
+        return MemoryEmbedder(config)
+
+    async def test_batches_are_sent_concurrently_up_to_the_limit(self):
+        embedder = self.make_embedder(batch_size=2, embedding_concurrency=3)
+        texts = [f"text {i}" for i in range(12)]
+        embeddings = await embedder.aget_embeddings(texts)
+
+        self.assertEqual(embeddings, [[float(len(text)), 1.0] for text in texts])
+        self.assertEqual(len(self.batches), 6)
+        self.assertEqual(self.max_in_flight, 3)
+
+    async def test_batches_respect_the_token_budget(self):
+        embedder = self.make_embedder(batch_size=32, max_batch_tokens=5)
+        texts = ["one two three", "four five", "six", "seven eight nine ten eleven twelve"]
+        await embedder.aget_embeddings(texts)
+        self.assertEqual(sorted(self.batches), sorted([[texts[0], texts[1]], [texts[2]], [texts[3]]]))
+        # the token counts of truncation are reused for batching
+        self.assertEqual(self.encode.call_count, len(texts))
+
+    async def test_failed_requests_are_retried(self):
+        self.failures = 2
+        embedder = self.make_embedder(retry_attempts=3)
+        self.assertEqual(await embedder.aget_embeddings("bid 10"), [6.0, 1.0])
+
+        self.failures = 3
+        with self.assertRaises(Exception):
+            await embedder.aget_embeddings("ask 12")
+
+
+if __name__ == '__main__':
+    unittest.main()
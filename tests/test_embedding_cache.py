@@ -0,0 +1,116 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.embedding import MemoryEmbedder
+from trade_agents.memory.embedding_cache import EmbeddingCache, SQLiteEmbeddingStore, clear_embedding_caches, get_embedding_cache
+from trade_agents.inference.metrics import InferenceMetrics
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        clear_embedding_caches()
+        self.addCleanup(clear_embedding_caches)
+        patcher = patch("trade_agents.memory.embedding.tiktoken")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.requests = []
+
+    def fake_tei(self, texts, token_counts=None):
+        self.requests.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def make_embedder(self, **config) -> MemoryEmbedder:
+        embedder = MemoryEmbedder(MarketMemoryConfig(**config))
+        embedder._get_tei_embeddings = self.fake_tei
+        return embedder
+
+    def test_only_misses_are_sent_upstream(self):
+        first, second = self.make_embedder(), self.make_embedder()
+        self.assertIs(first.cache, second.cache)
+
+        state = "Task: trade apples\nEnvironment state: {'price': 10}"
+        state_embedding = [float(len(state)), 1.0]
+        self.assertEqual(first.get_embeddings([state, state, "bid 10"]), [state_embedding, state_embedding, [6.0, 1.0]])
+        self.assertEqual(second.get_embeddings(state), state_embedding)
+        second.get_embeddings([state, "ask 12"])
+
+        self.assertEqual(self.requests, [[state, "bid 10"], ["ask 12"]])
+        self.assertEqual((first.cache.hits, first.cache.misses), (2, 4))
+        self.assertIn('embedding_cache_lookups_total{result="hit",tier="memory"} 2', first.cache.to_prometheus_text())
+
+    def test_cache_is_keyed_by_model(self):
+        self.make_embedder(model="model-a").get_embeddings("same text")
+        self.make_embedder(model="model-b").get_embeddings("same text")
+        self.assertEqual(len(self.requests), 2)
+
+    def test_disabled_cache(self):
+        embedder = self.make_embedder(embedding_cache_size=0)
+        self.assertIsNone(embedder.cache)
+        embedder.get_embeddings(["a", "a"])
+        self.assertEqual(self.requests, [["a", "a"]])
+
+    def test_lru_and_persistent_tier(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = SQLiteEmbeddingStore(os.path.join(tmp_dir, "cache.sqlite"))
+            cache = EmbeddingCache(max_entries=2, store=store)
+            cache.put_many([("a", [1.0]), ("b", [2.0]), ("c", [3.0])])
+            self.assertEqual(len(cache), 2)
+
+            # evicted from memory, served by the store and promoted again
+            self.assertEqual(cache.get_many(["a", "c", "d"]), {"a": [1.0], "c": [3.0]})
+            self.assertEqual((cache.hits, cache.store_hits, cache.misses), (1, 1, 1))
+            self.assertEqual(EmbeddingCache(store=store).get_many(["b"]), {"b": [2.0]})
+            store.close()
+
+    def test_async_lookups_keep_the_store_off_the_event_loop(self):
+        class RecordingStore(dict):
+            def __init__(self):
+                super().__init__()
+                self.threads = []
+
+            def get_many(self, keys):
+                self.threads.append(threading.current_thread())
+                return {key: self[key] for key in keys if key in self}
+
+            def put_many(self, items):
+                self.threads.append(threading.current_thread())
+                self.update(items)
+
+        async def fake_aembed(texts, token_counts=None):
+            return self.fake_tei(texts)
+
+        embedder = self.make_embedder()
+        embedder.cache = EmbeddingCache(store=RecordingStore())
+        embedder._aembed = fake_aembed
+
+        async def embed():
+            await embedder.aget_embeddings(["bid 10", "ask 12"])
+            # served from memory, the store is not asked again
+            await embedder.aget_embeddings("bid 10")
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(embed())
+        self.assertEqual(len(embedder.cache.store.threads), 2)
+        self.assertNotIn(loop_thread, embedder.cache.store.threads)
+        self.assertEqual((embedder.cache.hits, embedder.cache.misses), (1, 2))
+
+    def test_entries_are_stored_as_float32(self):
+        cache = EmbeddingCache()
+        cache.put_many([("a", [0.5] * 768)])
+        self.assertEqual(cache._entries["a"].itemsize * len(cache._entries["a"]), 768 * 4)
+        self.assertEqual(cache.get_many(["a"]), {"a": [0.5] * 768})
+
+    def test_exported_with_inference_metrics(self):
+        metrics = InferenceMetrics()
+        cache = get_embedding_cache(MarketMemoryConfig())
+        metrics.register_collector(cache.to_prometheus_text)
+        self.assertIn("embedding_cache_entries 0", metrics.to_prometheus_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,10 @@
+def make_completion(content: str, model: str = "test-model") -> dict:
+    """An OpenAI chat completion payload with the given message content."""
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
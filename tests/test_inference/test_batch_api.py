@@ -0,0 +1,153 @@
+import json
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from trade_agents.inference.batch_api import BatchAPIClient, BatchApiFromFileConfig, assign_custom_ids
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+
+
+class MockBatchServer:
+    """Minimal OpenAI Batch / Anthropic Message Batches server that answers in reverse order."""
+
+    def __init__(self, polls_before_done: int = 2):
+        self.polls_before_done = polls_before_done
+        self.files = {}
+        self.batches = {}
+        self.polls = 0
+        app = web.Application()
+        app.router.add_post("/v1/files", self.upload_file)
+        app.router.add_post("/v1/batches", self.create_openai_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self.get_openai_batch)
+        app.router.add_get("/v1/files/{file_id}/content", self.get_file_content)
+        app.router.add_post("/v1/messages/batches", self.create_anthropic_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}", self.get_anthropic_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}/results", self.get_anthropic_results)
+        self.runner = web.AppRunner(app)
+
+    async def start(self) -> str:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        return self.base
+
+    async def upload_file(self, request):
+        form = await request.post()
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = form["file"].file.read().decode()
+        return web.json_response({"id": file_id, "purpose": form["purpose"]})
+
+    async def create_openai_batch(self, request):
+        body = await request.json()
+        lines = [json.loads(line) for line in self.files[body["input_file_id"]].splitlines() if line]
+        output = []
+        for line in reversed(lines):
+            content = line["body"]["messages"][-1]["content"]
+            completion = {
+                "id": "chatcmpl-batch", "object": "chat.completion", "created": 0, "model": line["body"]["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"echo: {content}"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+            output.append(json.dumps({"custom_id": line["custom_id"], "response": {"status_code": 200, "body": completion}, "error": None}))
+        self.files["file-output"] = "\n".join(output)
+        self.batches["batch_oai"] = {"id": "batch_oai", "status": "in_progress", "endpoint": body["endpoint"]}
+        return web.json_response(self.batches["batch_oai"])
+
+    async def get_openai_batch(self, request):
+        batch = self.batches[request.match_info["batch_id"]]
+        self.polls += 1
+        if self.polls >= self.polls_before_done:
+            batch.update(status="completed", output_file_id="file-output")
+        return web.json_response(batch)
+
+    async def get_file_content(self, request):
+        return web.Response(text=self.files[request.match_info["file_id"]])
+
+    async def create_anthropic_batch(self, request):
+        body = await request.json()
+        self.anthropic_requests = body["requests"]
+        self.batches["msgbatch_1"] = {"id": "msgbatch_1", "type": "message_batch", "processing_status": "in_progress", "results_url": None}
+        return web.json_response(self.batches["msgbatch_1"])
+
+    async def get_anthropic_batch(self, request):
+        batch = self.batches[request.match_info["batch_id"]]
+        self.polls += 1
+        if self.polls >= self.polls_before_done:
+            batch.update(processing_status="ended", results_url=f"{self.base}/v1/messages/batches/msgbatch_1/results")
+        return web.json_response(batch)
+
+    async def get_anthropic_results(self, request):
+        lines = []
+        for item in reversed(self.anthropic_requests):
+            if item["params"]["messages"][-1]["content"][0]["text"].startswith("fail"):
+                result = {"type": "errored", "error": {"type": "invalid_request_error", "message": "bad request"}}
+            else:
+                result = {"type": "succeeded", "message": {
+                    "id": "msg_1", "type": "message", "role": "assistant", "model": item["params"]["model"],
+                    "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 3, "output_tokens": 1},
+                }}
+            lines.append(json.dumps({"custom_id": item["custom_id"], "result": result}))
+        return web.Response(text="\n".join(lines))
+
+
+class TestBatchInference(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockBatchServer()
+        base = await self.server.start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.ai_utils = ParallelAIUtilities(cache_folder=self.cache_dir.name, inference_mode="batch", batch_poll_interval=0.01)
+        self.ai_utils.openai_key = "test-key"
+        self.ai_utils.anthropic_key = "test-key"
+        self.ai_utils.openai_batch_url = f"{base}/v1"
+        self.ai_utils.anthropic_batch_url = f"{base}/v1"
+
+    async def asyncTearDown(self):
+        await self.server.runner.cleanup()
+        self.cache_dir.cleanup()
+
+    def make_prompt(self, prompt_id, message, client="openai", model="gpt-4o-mini"):
+        return LLMPromptContext(id=prompt_id, new_message=message, llm_config=LLMConfig(client=client, model=model))
+
+    async def test_openai_batch_maps_results_by_prompt_context_id(self):
+        prompts = [self.make_prompt(f"agent-{i}", f"state {i}") for i in range(4)]
+
+        outputs = await self.ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+
+        self.assertGreaterEqual(self.server.polls, 2)
+        self.assertEqual(len(outputs), 4)
+        for output in outputs:
+            index = output.source_id.split("-")[1]
+            self.assertEqual(output.str_content, f"echo: state {index}")
+
+    async def test_anthropic_batch_reports_errored_requests(self):
+        prompts = [
+            self.make_prompt("agent-ok", "hello", client="anthropic", model="claude-3-5-sonnet-20240620"),
+            self.make_prompt("agent-bad", "fail please", client="anthropic", model="claude-3-5-sonnet-20240620"),
+        ]
+
+        outputs = {o.source_id: o for o in await self.ai_utils.run_parallel_ai_completion(prompts, update_history=False)}
+
+        self.assertEqual(outputs["agent-ok"].str_content, "ok")
+        self.assertIsNone(outputs["agent-ok"].error)
+        self.assertIn("bad request", outputs["agent-bad"].error)
+
+    def test_custom_ids_are_unique_and_valid(self):
+        entries = [({"prompt_context_id": "agent 1"}, {}), ({"prompt_context_id": "agent 1"}, {})]
+        self.assertEqual(list(assign_custom_ids(entries)), ["agent_1", "agent_1-1"])
+
+    def test_incomplete_clients_cannot_be_created(self):
+        class SubmitOnly(BatchAPIClient):
+            async def submit(self, requests):
+                return "batch_1"
+
+        cfg = BatchApiFromFileConfig(requests_filepath="requests.jsonl", save_filepath="results.jsonl", api_key="key")
+        with self.assertRaises(TypeError):
+            SubmitOnly(None, cfg)
+
+
+if __name__ == '__main__':
+    unittest.main()
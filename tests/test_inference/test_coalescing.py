@@ -0,0 +1,84 @@
+import asyncio
+import tempfile
+import time
+import unittest
+
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext, LLMOutput
+from tests.test_inference import make_completion
+
+
+class TestRequestCoalescing(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.ai_utils = ParallelAIUtilities(cache_folder=self.cache_dir.name)
+        self.dispatched = []
+
+        async def fake_dispatch(prompts, deadline=None):
+            self.dispatched.append([p.id for p in prompts])
+            await asyncio.sleep(0.01)
+            now = time.time()
+            return [
+                LLMOutput(raw_result=make_completion(p.new_message), completion_kwargs={}, start_time=now, end_time=now, source_id=p.id, client="openai")
+                for p in prompts
+            ]
+
+        self.ai_utils._run_provider_completions = fake_dispatch
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def make_prompt(self, prompt_id: str, message: str) -> LLMPromptContext:
+        return LLMPromptContext(
+            id=prompt_id,
+            system_string="You are a buyer in a double auction.",
+            new_message=message,
+            llm_config=LLMConfig(client="openai", model="gpt-4o-mini"),
+        )
+
+    async def test_identical_prompts_share_one_call(self):
+        prompts = [self.make_prompt(f"agent_{i}", "same state") for i in range(5)]
+        prompts.append(self.make_prompt("agent_5", "different state"))
+
+        outputs = await self.ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+
+        self.assertEqual(len(self.dispatched), 1)
+        self.assertEqual(len(self.dispatched[0]), 2)
+        self.assertEqual(sorted(o.source_id for o in outputs), sorted(p.id for p in prompts))
+        for output in outputs:
+            expected = "different state" if output.source_id == "agent_5" else "same state"
+            self.assertEqual(output.str_content, expected)
+
+    async def test_overlapping_batches_share_in_flight_call(self):
+        first = [self.make_prompt("agent_a", "round 1")]
+        second = [self.make_prompt("agent_b", "round 1")]
+
+        outputs_a, outputs_b = await asyncio.gather(
+            self.ai_utils.run_parallel_ai_completion(first, update_history=False),
+            self.ai_utils.run_parallel_ai_completion(second, update_history=False),
+        )
+
+        self.assertEqual(sum(len(batch) for batch in self.dispatched), 1)
+        self.assertEqual(outputs_a[0].source_id, "agent_a")
+        self.assertEqual(outputs_b[0].source_id, "agent_b")
+
+    async def test_history_is_updated_per_prompt(self):
+        prompts = [self.make_prompt("agent_a", "same"), self.make_prompt("agent_b", "same")]
+
+        await self.ai_utils.run_parallel_ai_completion(prompts)
+
+        for prompt in prompts:
+            self.assertEqual(len(prompt.history), 2)
+
+    async def test_coalescing_can_be_disabled(self):
+        self.ai_utils.coalescer = None
+        prompts = [self.make_prompt(f"agent_{i}", "same state") for i in range(3)]
+
+        outputs = await self.ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+
+        self.assertEqual(len(self.dispatched[0]), 3)
+        self.assertEqual(len(outputs), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.inference.message_models import LLMOutput
+from trade_agents.inference.oai_parallel import OAIApiFromFileConfig, RateLimiter, process_api_requests_from_file
+from trade_agents.inference.routing import InferenceRouter
+from tests.test_inference import make_completion
+
+
+class TestDeadlinesAndHedging(unittest.IsolatedAsyncioTestCase):
+    """Runs process_api_requests_from_file against a local server with configurable per-call delays."""
+
+    async def asyncSetUp(self):
+        self.delays = []
+        self.num_calls = 0
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.tmp_dir.cleanup()
+
+    async def handle_completion(self, request):
+        call = self.num_calls
+        self.num_calls += 1
+        delay = self.delays[call] if call < len(self.delays) else 0
+        await asyncio.sleep(delay)
+        return web.json_response(make_completion(f"call {call}"))
+
+    async def run_requests(self, num_requests: int = 1, router=None, rate_limiter=None, **config_kwargs):
+        requests_file = os.path.join(self.tmp_dir.name, "requests.jsonl")
+        results_file = os.path.join(self.tmp_dir.name, "results.jsonl")
+        with open(requests_file, "w") as f:
+            for i in range(num_requests):
+                request = {"model": "test-model", "messages": [{"role": "user", "content": f"agent {i}"}], "max_tokens": 10}
+                f.write(json.dumps([{"prompt_context_id": f"agent_{i}", "start_time": time.time()}, request]) + "\n")
+        config = OAIApiFromFileConfig(
+            requests_filepath=requests_file,
+            save_filepath=results_file,
+            request_url=self.request_url,
+            api_key="",
+            **config_kwargs,
+        )
+        start = time.monotonic()
+        with patch("trade_agents.inference.oai_parallel.num_tokens_consumed_from_request", return_value=100):
+            await process_api_requests_from_file(config, router=router, provider="openai", rate_limiter=rate_limiter)
+        elapsed = time.monotonic() - start
+        with open(results_file) as f:
+            results = [json.loads(line) for line in f]
+        return elapsed, results
+
+    async def test_hedged_request_takes_first_response(self):
+        self.delays = [1.5, 0.0]
+
+        elapsed, results = await self.run_requests(hedge=True, hedge_after=0.1)
+
+        self.assertLess(elapsed, 1.2)
+        self.assertEqual(self.num_calls, 2)
+        metadata, _, response = results[0]
+        self.assertTrue(metadata["hedged"])
+        self.assertTrue(metadata["hedge_won"])
+        self.assertEqual(response["choices"][0]["message"]["content"], "call 1")
+
+    async def test_hedges_are_charged_against_the_shared_budgets(self):
+        self.delays = [0.3, 0.0]
+        # one request per minute: the primary uses up the budget
+        rate_limiter = RateLimiter(max_requests_per_minute=1, max_tokens_per_minute=10_000)
+        elapsed, results = await self.run_requests(hedge=True, hedge_after=0.1, rate_limiter=rate_limiter)
+        self.assertEqual(self.num_calls, 1)
+        self.assertNotIn("hedged", results[0][0])
+
+        self.num_calls = 0
+        router = InferenceRouter(initial_concurrency=1)
+        await self.run_requests(hedge=True, hedge_after=0.1, router=router)
+        self.assertEqual(self.num_calls, 1)
+
+        self.num_calls = 0
+        router = InferenceRouter(initial_concurrency=2)
+        rate_limiter = RateLimiter(max_requests_per_minute=100, max_tokens_per_minute=10_000)
+        await self.run_requests(hedge=True, hedge_after=0.1, router=router, rate_limiter=rate_limiter)
+        self.assertEqual(self.num_calls, 2)
+        # primary and hedge were both charged
+        self.assertLess(rate_limiter.available_request_capacity, 99)
+        self.assertEqual(router.get_stats("openai", "test-model").in_flight, 0)
+        self.assertEqual(router.get_limiter("openai", "test-model").in_flight, 0)
+
+    async def test_fast_requests_are_not_hedged(self):
+        elapsed, results = await self.run_requests(hedge=True, hedge_after=1.0)
+
+        self.assertEqual(self.num_calls, 1)
+        self.assertNotIn("hedged", results[0][0])
+
+    async def test_deadline_abandons_slow_requests(self):
+        self.delays = [0.0, 1.5, 1.5]
+
+        elapsed, results = await self.run_requests(num_requests=3, deadline=time.time() + 0.5, max_attempts=3)
+
+        self.assertLess(elapsed, 1.2)
+        self.assertEqual(len(results), 3)
+        outputs = {
+            metadata["prompt_context_id"]: LLMOutput(raw_result=response, start_time=0, end_time=1, source_id=metadata["prompt_context_id"], client="vllm")
+            for metadata, _, response in results
+        }
+        expired = [source_id for source_id, output in outputs.items() if output.error]
+        self.assertEqual(len(expired), 2)
+        self.assertEqual(outputs[expired[0]].error, "deadline exceeded")
+        self.assertIsNone(outputs[expired[0]].json_object)
+        for metadata, _, _ in results:
+            if metadata["prompt_context_id"] in expired:
+                self.assertTrue(metadata["deadline_exceeded"])
+
+
+if __name__ == '__main__':
+    unittest.main()
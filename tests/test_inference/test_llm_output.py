@@ -0,0 +1,62 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from openai.types.chat import ChatCompletion
+
+from trade_agents.inference.message_models import LLMOutput
+from tests.test_inference import make_completion
+
+
+class TestLLMOutputParsing(unittest.TestCase):
+    def test_payload_is_parsed_once(self):
+        output = LLMOutput(raw_result=make_completion('{"price": 10}'), start_time=0, end_time=1, source_id="agent_0", client="openai")
+
+        with patch.object(ChatCompletion, "model_validate", wraps=ChatCompletion.model_validate) as validate:
+            for _ in range(3):
+                self.assertEqual(output.json_object.object, {"price": 10})
+                self.assertIsNone(output.str_content)
+                self.assertEqual(output.usage.total_tokens, 15)
+                self.assertTrue(output.contains_object)
+            copy = output.model_copy(update={"source_id": "agent_1"})
+            self.assertEqual(copy.json_object.object, {"price": 10})
+            output.model_dump()
+
+        self.assertEqual(validate.call_count, 1)
+
+    def test_copy_with_new_payload_is_reparsed(self):
+        output = LLMOutput(raw_result=make_completion("first"), start_time=0, end_time=1, source_id="agent_0", client="openai")
+        self.assertEqual(output.str_content, "first")
+        copy = output.model_copy(update={"raw_result": make_completion("second")})
+        self.assertEqual(copy.str_content, "second")
+
+    def test_provider_inferred_without_client(self):
+        output = LLMOutput(raw_result=make_completion("hi"), start_time=0, end_time=1, source_id="agent_0")
+        self.assertEqual(output.result_provider, "openai")
+        self.assertEqual(output.str_content, "hi")
+
+    def test_error_payload(self):
+        output = LLMOutput(raw_result={"error": "deadline exceeded"}, start_time=0, end_time=1, source_id="agent_0", client="openai")
+        self.assertEqual(output.error, "deadline exceeded")
+        self.assertIsNone(output.json_object)
+        self.assertIsNone(output.tool_calls)
+
+    def test_raw_bytes_are_decoded_lazily(self):
+        raw = json.dumps(make_completion("lazy")).encode()
+        output = LLMOutput(raw_result=raw, start_time=0, end_time=1, source_id="agent_0", client="openai")
+        self.assertEqual(output.raw_json, raw.decode())
+        self.assertEqual(output.str_content, "lazy")
+
+    def test_anthropic_tool_calls(self):
+        message = {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": "claude",
+            "content": [{"type": "tool_use", "id": "toolu_1", "name": "Bid", "input": {"price": 3}}],
+            "stop_reason": "tool_use", "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 1},
+        }
+        output = LLMOutput(raw_result=message, start_time=0, end_time=1, source_id="agent_0", client="anthropic")
+        self.assertEqual(output.json_object.object, {"price": 3})
+        self.assertEqual([call.name for call in output.tool_calls], ["Bid"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import random
+import tempfile
+import time
+import unittest
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+from trade_agents.inference.local_backend import LatencyModel, LocalBackend, ScriptedBackend, synthesize_from_schema
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext, StructuredTool
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+
+
+class Bid(BaseModel):
+    action: Literal["bid", "hold"]
+    price: float = Field(..., ge=1, le=20)
+    quantity: int = Field(..., gt=0, le=5)
+    reasons: List[str]
+
+
+class TestScriptedBackend(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def make_utils(self, backend) -> ParallelAIUtilities:
+        return ParallelAIUtilities(cache_folder=self.cache_dir.name, coalesce_requests=False, local_backend=backend)
+
+    def make_prompt(self, prompt_id: str, client: str, response_format: str) -> LLMPromptContext:
+        model = "claude-3-5-sonnet-20240620" if client == "anthropic" else "gpt-4o-mini"
+        return LLMPromptContext(
+            id=prompt_id,
+            system_string="You are a buyer.",
+            new_message=f"State for {prompt_id}",
+            structured_output=StructuredTool(json_schema=Bid.model_json_schema(), strict_schema=False),
+            llm_config=LLMConfig(client=client, model=model, response_format=response_format),
+        )
+
+    async def test_structured_outputs_in_every_wire_format(self):
+        ai_utils = self.make_utils(ScriptedBackend(seed=7))
+        prompts = [
+            self.make_prompt("openai_tool", "openai", "tool"),
+            self.make_prompt("openai_schema", "openai", "structured_output"),
+            self.make_prompt("anthropic_tool", "anthropic", "tool"),
+            self.make_prompt("anthropic_json", "anthropic", "json_beg"),
+        ]
+        outputs = {o.source_id: o for o in await ai_utils.run_parallel_ai_completion(prompts)}
+
+        self.assertEqual(set(outputs), {p.id for p in prompts})
+        for prompt_id in ("openai_tool", "openai_schema", "anthropic_tool"):
+            output = outputs[prompt_id]
+            self.assertIsNone(output.error)
+            Bid.model_validate(output.json_object.object)
+            self.assertGreater(output.usage.prompt_tokens, 0)
+        self.assertEqual(outputs["openai_tool"].tool_calls[0].name, "generate_structured_output")
+        self.assertEqual(outputs["anthropic_tool"].result_provider, "anthropic")
+        self.assertIsNotNone(outputs["anthropic_json"].json_object)
+        # the history was updated like with a remote provider
+        self.assertEqual(len(prompts[0].history), 2)
+
+    async def test_outputs_are_deterministic(self):
+        first = await self.make_utils(ScriptedBackend(seed=1)).run_parallel_ai_completion([self.make_prompt("a", "openai", "tool")], update_history=False)
+        second = await self.make_utils(ScriptedBackend(seed=1)).run_parallel_ai_completion([self.make_prompt("a", "openai", "tool")], update_history=False)
+        self.assertEqual(first[0].json_object.object, second[0].json_object.object)
+
+    async def test_script_and_latency(self):
+        backend = ScriptedBackend(
+            script=lambda request: {"action": "hold", "price": 5.0, "quantity": 1, "reasons": ["scripted"]},
+            latency=LatencyModel(distribution="constant", mean=0.05),
+            max_concurrency=10,
+        )
+        ai_utils = self.make_utils(backend)
+        prompts = [self.make_prompt(f"agent_{i}", "openai", "tool") for i in range(20)]
+
+        start = time.monotonic()
+        outputs = await ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+        elapsed = time.monotonic() - start
+
+        self.assertTrue(all(o.json_object.object["reasons"] == ["scripted"] for o in outputs))
+        # 20 requests, 10 at a time, 50ms each
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 1.0)
+
+    async def test_concurrency_limit_spans_batches(self):
+        backend = ScriptedBackend(latency=LatencyModel(distribution="constant", mean=0.05), max_concurrency=1)
+        ai_utils = self.make_utils(backend)
+
+        start = time.monotonic()
+        await asyncio.gather(*(
+            ai_utils.run_parallel_ai_completion([self.make_prompt(f"batch_{b}_agent_{i}", "openai", "tool") for i in range(2)], update_history=False)
+            for b in range(2)
+        ))
+        # four requests one at a time, not two batches of two in parallel
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_backends_must_implement_generate(self):
+        with self.assertRaises(TypeError):
+            LocalBackend()
+
+    async def test_deadline_and_injected_errors(self):
+        backend = ScriptedBackend(latency=LatencyModel(distribution="constant", mean=5.0))
+        outputs = await self.make_utils(backend).run_parallel_ai_completion(
+            [self.make_prompt("slow", "openai", "tool")], update_history=False, deadline=time.time() + 0.05
+        )
+        self.assertEqual(outputs[0].error, "deadline exceeded")
+
+        outputs = await self.make_utils(ScriptedBackend(error_rate=1.0)).run_parallel_ai_completion(
+            [self.make_prompt("failing", "anthropic", "tool")], update_history=False
+        )
+        self.assertIsNotNone(outputs[0].error)
+
+    def test_latency_distributions(self):
+        rng = random.Random(0)
+        lognormal = LatencyModel(distribution="lognormal", mean=0.5, stddev=0.2)
+        samples = [lognormal.sample(rng) for _ in range(5000)]
+        self.assertAlmostEqual(sum(samples) / len(samples), 0.5, delta=0.02)
+        bounded = LatencyModel(distribution="normal", mean=0.1, stddev=1.0, max_latency=0.3)
+        self.assertTrue(all(0 <= bounded.sample(rng) <= 0.3 for _ in range(100)))
+
+    def test_schema_synthesis_respects_bounds(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            Bid.model_validate(synthesize_from_schema(Bid.model_json_schema(), rng))
+
+
+if __name__ == '__main__':
+    unittest.main()
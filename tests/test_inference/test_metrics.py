@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+
+import aiohttp
+
+from trade_agents.inference.local_backend import LatencyModel, ScriptedBackend
+from trade_agents.inference.message_models import LLMConfig, LLMOutput, LLMPromptContext
+from trade_agents.inference.metrics import InferenceMetrics, LatencyReservoir
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+
+
+def make_output(source_id: str, latency: float, prompt_tokens: int = 100, error: bool = False, attempts: int = 1,
+                client: str = "openai", model: str = "gpt-4o-mini") -> LLMOutput:
+    if error:
+        raw_result = {"error": "server error"}
+    else:
+        raw_result = {
+            "id": f"chatcmpl-{source_id}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 10, "total_tokens": prompt_tokens + 10,
+                      "prompt_tokens_details": {"cached_tokens": prompt_tokens // 2}},
+        }
+    return LLMOutput(
+        raw_result=raw_result,
+        completion_kwargs={"model": model},
+        start_time=0.0,
+        end_time=latency,
+        source_id=source_id,
+        client=client,
+        request_metadata={"prompt_context_id": source_id, "attempts": attempts},
+    )
+
+
+class TestInferenceMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = InferenceMetrics()
+        labels = {"environment": "auction", "round": 1}
+        self.metrics.record_batch([make_output("a", 0.3), make_output("b", 0.7, attempts=3)], 1.0, {**labels, "phase": "perceive"})
+        self.metrics.record_batch([make_output("a", 2.0), make_output("b", 2.5, error=True)], 3.0, {**labels, "phase": "act"})
+
+    def test_phase_breakdown_and_dominant_phase(self):
+        rows = {row["phase"]: row for row in self.metrics.phase_breakdown(round_num=1)}
+        self.assertAlmostEqual(rows["perceive"]["share_of_round_time"], 0.25)
+        self.assertAlmostEqual(rows["act"]["share_of_round_time"], 0.75)
+        self.assertEqual(rows["perceive"]["retries"], 2)
+        self.assertEqual(rows["act"]["errors"], 1)
+        self.assertEqual(rows["perceive"]["input_tokens"], 200)
+        self.assertAlmostEqual(rows["perceive"]["cache_hit_rate"], 0.5)
+        self.assertEqual(self.metrics.dominant_phase(1, "auction"), "act")
+        self.assertEqual(self.metrics.phase_breakdown(round_num=2), [])
+
+    def test_model_and_agent_breakdown(self):
+        models = self.metrics.model_breakdown()
+        self.assertEqual(len(models), 1)
+        self.assertEqual(models[0]["requests"], 4)
+        agents = {(row["agent"], row["phase"]): row for row in self.metrics.agent_breakdown()}
+        self.assertAlmostEqual(agents[("a", "act")]["mean_latency"], 2.0)
+        self.assertEqual(agents[("b", "perceive")]["retries"], 2)
+
+    def test_latency_percentiles_use_bounded_memory(self):
+        reservoir, other = LatencyReservoir(size=100), LatencyReservoir(size=100)
+        for i in range(10_000):
+            reservoir.observe(i / 10_000)
+            other.observe(1 + i / 10_000)
+        self.assertEqual(len(reservoir.samples), 100)
+        self.assertAlmostEqual(reservoir.percentile(50), 0.5, delta=0.15)
+        reservoir.merge(other)
+        self.assertEqual((len(reservoir.samples), reservoir.count), (100, 20_000))
+        self.assertAlmostEqual(reservoir.percentile(50), 1.0, delta=0.3)
+
+        rows = {row["phase"]: row for row in self.metrics.phase_breakdown(round_num=1)}
+        self.assertEqual((rows["perceive"]["latency_p50"], rows["perceive"]["latency_p95"]), (0.3, 0.7))
+
+    def test_prometheus_text(self):
+        text = self.metrics.to_prometheus_text()
+        self.assertIn("# TYPE inference_requests_total counter", text)
+        self.assertIn('inference_requests_total{client="openai",environment="auction",model="gpt-4o-mini",phase="act",status="error"} 1', text)
+        self.assertIn('inference_retries_total{client="openai",environment="auction",model="gpt-4o-mini",phase="perceive"} 2', text)
+        self.assertIn("# TYPE inference_request_latency_seconds histogram", text)
+        # buckets are cumulative: 0.3 and 0.7 are both below 1s, one of them below 0.5s
+        self.assertIn('inference_request_latency_seconds_bucket{client="openai",model="gpt-4o-mini",phase="perceive",le="0.5"} 1', text)
+        self.assertIn('inference_request_latency_seconds_bucket{client="openai",model="gpt-4o-mini",phase="perceive",le="1"} 2', text)
+        self.assertIn('inference_request_latency_seconds_bucket{client="openai",model="gpt-4o-mini",phase="perceive",le="+Inf"} 2', text)
+        self.assertIn('inference_phase_duration_seconds_sum{environment="auction",phase="act"} 3', text)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "inference.prom")
+            self.metrics.write_prometheus_file(filepath)
+            with open(filepath) as f:
+                self.assertEqual(f.read(), text)
+
+
+class TestMetricsCollection(unittest.IsolatedAsyncioTestCase):
+    async def test_batches_are_recorded_and_served(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            backend = ScriptedBackend(latency=LatencyModel(distribution="constant", mean=0.01))
+            ai_utils = ParallelAIUtilities(cache_folder=cache_dir, coalesce_requests=False, local_backend=backend)
+            prompts = [
+                LLMPromptContext(id=f"agent_{i}", system_string="You are a buyer.", new_message="Bid.", llm_config=LLMConfig(client="openai", model="gpt-4o-mini"))
+                for i in range(3)
+            ]
+            await ai_utils.run_parallel_ai_completion(prompts, update_history=False, labels={"environment": "auction", "phase": "act", "round": 2})
+
+        rows = ai_utils.metrics.phase_breakdown(round_num=2)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["requests"], 3)
+        self.assertGreater(rows[0]["wall_time"], 0)
+        self.assertEqual(rows[0]["share_of_round_time"], 1.0)
+
+        runner = await ai_utils.metrics.serve(port=0)
+        try:
+            port = runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    body = await response.text()
+            self.assertEqual(response.status, 200)
+            self.assertIn('inference_requests_total{client="openai",environment="auction",model="gpt-4o-mini",phase="act",status="ok"} 3', body)
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import tempfile
+import unittest
+
+from trade_agents.inference.local_backend import ScriptedBackend
+from trade_agents.inference.message_models import LLMConfig, LLMOutput, LLMPromptContext
+from trade_agents.inference.micro_batching import MicroBatcher
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+
+
+def make_prompt(prompt_id: str) -> LLMPromptContext:
+    return LLMPromptContext(id=prompt_id, system_string="You are a buyer.", new_message=f"Task of {prompt_id}",
+                            llm_config=LLMConfig(client="openai", model="gpt-4o-mini"))
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+
+    async def run_batch(self, prompts, update_history):
+        self.batches.append([p.id for p in prompts])
+        await asyncio.sleep(0.01)
+        return [LLMOutput(raw_result={"error": "unused"}, start_time=0, end_time=0, source_id=p.id) for p in prompts]
+
+    async def test_concurrent_submissions_share_a_batch(self):
+        batcher = MicroBatcher(self.run_batch, window=0.02)
+        outputs = await asyncio.gather(*(batcher.submit(make_prompt(f"agent_{i}")) for i in range(10)))
+
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual([o.source_id for o in outputs], [f"agent_{i}" for i in range(10)])
+        await asyncio.sleep(0)
+        self.assertEqual(batcher._tasks, set())
+
+    async def test_size_limit_and_duplicate_ids_split_batches(self):
+        batcher = MicroBatcher(self.run_batch, window=0.02, max_batch_size=4)
+        await asyncio.gather(*(batcher.submit(make_prompt(f"agent_{i}")) for i in range(6)))
+        self.assertEqual([len(b) for b in self.batches], [4, 2])
+
+        self.batches.clear()
+        await asyncio.gather(batcher.submit(make_prompt("same")), batcher.submit(make_prompt("same")))
+        self.assertEqual(self.batches, [["same"], ["same"]])
+
+    async def test_errors_reach_every_caller(self):
+        async def failing(prompts, update_history):
+            raise RuntimeError("provider down")
+
+        batcher = MicroBatcher(failing, window=0.01)
+        results = await asyncio.gather(*(batcher.submit(make_prompt(f"agent_{i}")) for i in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    async def test_cancelled_dispatch_releases_every_caller(self):
+        async def hanging(prompts, update_history):
+            await asyncio.Event().wait()
+
+        batcher = MicroBatcher(hanging, window=0.01)
+        submissions = asyncio.gather(*(batcher.submit(make_prompt(f"agent_{i}")) for i in range(3)), return_exceptions=True)
+        await asyncio.sleep(0.05)
+        for task in list(batcher._tasks):
+            task.cancel()
+        results = await asyncio.wait_for(submissions, timeout=1)
+        self.assertTrue(all(isinstance(r, asyncio.CancelledError) for r in results))
+
+    async def test_direct_completions_are_batched(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ai_utils = ParallelAIUtilities(cache_folder=cache_dir, coalesce_requests=False, local_backend=ScriptedBackend(seed=0))
+            outputs = await asyncio.gather(*(ai_utils.run_ai_completion(make_prompt(f"agent_{i}"), update_history=False) for i in range(5)))
+
+        self.assertEqual(ai_utils.micro_batcher.num_batches, 1)
+        self.assertTrue(all(o is not None and o.error is None for o in outputs))
+
+
+if __name__ == '__main__':
+    unittest.main()
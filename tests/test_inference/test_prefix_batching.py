@@ -0,0 +1,111 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext
+from trade_agents.inference.parallel_inference import PREFIX_BATCH_STATS_WINDOW, ParallelAIUtilities
+from trade_agents.inference.prefix_batching import group_by_shared_prefix, request_prefix_text
+
+AUCTION_RULES = "You trade strawberries in a double auction. " * 20
+CHAT_RULES = "You discuss the strawberry market with other agents. " * 20
+
+
+class MockPrefixCachingServer:
+    """Chat completions server that records the arrival order and reports prefix cache hits like vLLM."""
+
+    def __init__(self):
+        self.arrivals = []
+        self.completed_prompts = []
+
+    async def handle(self, request):
+        body = await request.json()
+        prompt = request_prefix_text(body)
+        self.arrivals.append(body["messages"][-1]["content"])
+        cached = max((len(os.path.commonprefix([prompt, done])) for done in self.completed_prompts), default=0)
+        await asyncio.sleep(0.01)
+        self.completed_prompts.append(prompt)
+        return web.json_response({
+            "id": "cmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "qwen",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": 1, "total_tokens": len(prompt) + 1,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        })
+
+
+class TestPrefixBatching(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockPrefixCachingServer()
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.server.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.ai_utils = ParallelAIUtilities(cache_folder=self.cache_dir.name, coalesce_requests=False, vllm_prefix_batching=True)
+        self.ai_utils.vllm_endpoint = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.cache_dir.cleanup()
+
+    def make_prompt(self, prompt_id: str, rules: str) -> LLMPromptContext:
+        return LLMPromptContext(
+            id=prompt_id,
+            system_string=rules,
+            new_message=prompt_id,
+            llm_config=LLMConfig(client="vllm", model="qwen"),
+        )
+
+    async def test_group_leaders_are_sent_before_their_followers(self):
+        # interleave the two prompt families the way agents of two environments arrive
+        prompts = []
+        for i in range(4):
+            prompts.append(self.make_prompt(f"auction_{i}", AUCTION_RULES))
+            prompts.append(self.make_prompt(f"chat_{i}", CHAT_RULES))
+        prompts.append(self.make_prompt("loner", "Short prompt."))
+
+        with patch("trade_agents.inference.oai_parallel.num_tokens_consumed_from_request", return_value=100):
+            outputs = await self.ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+
+        self.assertEqual(sorted(o.source_id for o in outputs), sorted(p.id for p in prompts))
+        arrivals = self.server.arrivals
+        leaders = arrivals[:3]
+        self.assertEqual(sorted(a.split("_")[0] for a in leaders), ["auction", "chat", "loner"])
+        followers = arrivals[3:]
+        # followers are sent after every leader, grouped by prefix family
+        families = [a.split("_")[0] for a in followers]
+        self.assertIn(families, [["auction"] * 3 + ["chat"] * 3, ["chat"] * 3 + ["auction"] * 3])
+
+        # only the statistics of the most recent batches are kept
+        self.assertEqual(self.ai_utils.prefix_batch_stats.maxlen, PREFIX_BATCH_STATS_WINDOW)
+        stats = self.ai_utils.prefix_batch_stats[-1]
+        self.assertEqual(stats.num_requests, 9)
+        self.assertEqual(stats.num_groups, 3)
+        self.assertGreater(stats.estimated_hit_rate, 0.5)
+        self.assertGreater(stats.measured_hit_rate, 0.5)
+
+    def test_grouping_threshold(self):
+        entries = [
+            ({"prompt_context_id": "a"}, {"messages": [{"role": "system", "content": "x" * 300}, {"role": "user", "content": "a"}]}),
+            ({"prompt_context_id": "b"}, {"messages": [{"role": "system", "content": "y" * 300}, {"role": "user", "content": "b"}]}),
+            ({"prompt_context_id": "c"}, {"messages": [{"role": "system", "content": "x" * 300}, {"role": "user", "content": "c"}]}),
+        ]
+        groups, stats = group_by_shared_prefix(entries, min_prefix_chars=256)
+        self.assertEqual([[e[0]["prompt_context_id"] for e in g.entries] for g in groups], [["a", "c"], ["b"]])
+        self.assertGreaterEqual(groups[0].shared_prefix_chars, 300)
+
+        groups, _ = group_by_shared_prefix(entries, min_prefix_chars=1000)
+        self.assertEqual(len(groups), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
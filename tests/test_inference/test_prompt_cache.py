@@ -0,0 +1,129 @@
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import MagicMock
+
+from trade_agents.agents.base_agent.agent import Agent
+from trade_agents.agents.base_agent.prompter import PromptManager
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext, LLMOutput
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.utils import msg_dict_to_anthropic
+from trade_agents.orchestrators.auction_orchestrator import AuctionOrchestrator
+
+SCHEMA = {"type": "object", "properties": {"bid": {"type": "number"}}, "required": ["bid"]}
+
+
+class AuctionAgent(Agent):
+    economic_agent: Any = None
+
+
+def cached_blocks(messages):
+    return [i for i, message in enumerate(messages) if any("cache_control" in block for block in message["content"])]
+
+
+class TestCacheFriendlyLayout(unittest.TestCase):
+    def make_messages(self, task: str, layout: str):
+        manager = PromptManager(role="buyer", persona="A careful buyer", task=task, output_schema=SCHEMA, layout=layout)
+        return manager.generate_prompt_messages()["messages"]
+
+    def test_system_prompt_is_stable_across_rounds(self):
+        system_1, user_1 = self.make_messages("Bid in round 1", "cache_friendly")
+        system_2, user_2 = self.make_messages("Bid in round 2", "cache_friendly")
+
+        self.assertEqual(system_1["content"], system_2["content"])
+        self.assertIn('"bid"', system_1["content"])
+        self.assertNotIn('"bid"', user_1["content"])
+        self.assertIn("Current date and time:", user_1["content"])
+        self.assertNotEqual(user_1["content"], user_2["content"])
+
+    def test_default_layout_is_unchanged(self):
+        system, user = self.make_messages("Bid in round 1", "default")
+        self.assertNotIn('"bid"', system["content"])
+        self.assertIn('"bid"', user["content"])
+        self.assertNotIn("Current date and time:", user["content"])
+
+    def test_auction_rounds_share_the_system_prompt(self):
+        economic_agent = MagicMock()
+        economic_agent.endowment.current_basket.cash = 100.0
+        economic_agent.endowment.current_basket.get_good_quantity.return_value = 0
+        economic_agent.get_current_value.side_effect = [20.0, 18.0]
+        agent = AuctionAgent(role="buyer", persona="A careful buyer", economic_agent=economic_agent,
+                             llm_config=LLMConfig(client="anthropic", model="claude-3-5-sonnet-20240620", prompt_layout="cache_friendly"))
+        orchestrator = SimpleNamespace(agents=[agent])
+
+        prompts = []
+        for round_num in (1, 2):
+            AuctionOrchestrator.set_agent_system_messages(orchestrator, round_num, "apple")
+            prompts.append(agent._prepare_prompt_context(f"Bid in round {round_num}", SCHEMA))
+
+        self.assertEqual(prompts[0].system_string.encode(), prompts[1].system_string.encode())
+        self.assertIn("buying at 19.80 or lower", prompts[0].new_message)
+        self.assertIn("buying at 17.82 or lower", prompts[1].new_message)
+
+        agent.llm_config.prompt_layout = "default"
+        self.assertIn("buying at 17.82 or lower", agent._prepare_prompt_context("Bid", SCHEMA).system_string)
+
+    def test_anthropic_breakpoints_skip_the_volatile_tail(self):
+        messages = [
+            {"role": "system", "content": "persona"},
+            {"role": "user", "content": "round 1"},
+            {"role": "assistant", "content": "bid 1"},
+            {"role": "user", "content": "round 2"},
+            {"role": "assistant", "content": "prefill"},
+        ]
+        system, converted = msg_dict_to_anthropic(messages, use_cache=True, cache_tail=False)
+        self.assertIn("cache_control", system[0])
+        self.assertEqual(cached_blocks(converted), [1])
+
+        _, converted = msg_dict_to_anthropic(messages[:2], use_cache=True, cache_tail=False)
+        self.assertEqual(cached_blocks(converted), [])
+
+        _, converted = msg_dict_to_anthropic(messages, use_cache=True)
+        self.assertEqual(cached_blocks(converted), [1, 3])
+
+
+class TestUsageTotals(unittest.IsolatedAsyncioTestCase):
+    async def test_cache_tokens_are_surfaced(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        ai_utils = ParallelAIUtilities(cache_folder=cache_dir.name)
+        anthropic_result = {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": "claude-3-5-sonnet-20240620",
+            "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 10, "cache_read_input_tokens": 800, "cache_creation_input_tokens": 100},
+        }
+        openai_result = {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 2000, "completion_tokens": 10, "total_tokens": 2010, "prompt_tokens_details": {"cached_tokens": 1024}},
+        }
+
+        async def fake_dispatch(prompts, deadline=None):
+            now = time.time()
+            return [
+                LLMOutput(raw_result=anthropic_result if p.llm_config.client == "anthropic" else openai_result,
+                          completion_kwargs={}, start_time=now, end_time=now, source_id=p.id, client=p.llm_config.client)
+                for p in prompts
+            ]
+
+        ai_utils._run_provider_completions = fake_dispatch
+        prompts = [
+            LLMPromptContext(id="a", new_message="same", llm_config=LLMConfig(client="anthropic", model="claude-3-5-sonnet-20240620")),
+            LLMPromptContext(id="b", new_message="same", llm_config=LLMConfig(client="anthropic", model="claude-3-5-sonnet-20240620")),
+            LLMPromptContext(id="c", new_message="other", llm_config=LLMConfig(client="openai", model="gpt-4o-mini")),
+        ]
+        await ai_utils.run_parallel_ai_completion(prompts, update_history=False)
+
+        usage = ai_utils.usage_summary()
+        # the two identical anthropic prompts were coalesced into one upstream call
+        self.assertEqual(usage["requests"], 2)
+        self.assertEqual(usage["input_tokens"], 1000 + 2000)
+        self.assertEqual(usage["cache_read_input_tokens"], 800 + 1024)
+        self.assertEqual(usage["cache_creation_input_tokens"], 100)
+        self.assertAlmostEqual(usage["cache_hit_rate"], 1824 / 3000)
+
+
+if __name__ == '__main__':
+    unittest.main()
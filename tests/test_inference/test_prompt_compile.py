@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext, LLMOutput, StructuredTool
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"price": {"type": "number"}, "quantity": {"type": "integer"}},
+    "required": ["price", "quantity"],
+}
+
+
+class TestPromptCompilation(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.ai_utils = ParallelAIUtilities(cache_folder=self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def make_prompt(self, prompt_id: str, client: str = "openai", model: str = "gpt-4o-mini") -> LLMPromptContext:
+        return LLMPromptContext(
+            id=prompt_id,
+            system_string="You are a buyer in a double auction.",
+            new_message="Submit your bid.",
+            structured_output=StructuredTool.shared(dict(SCHEMA), strict_schema=False),
+            llm_config=LLMConfig(client=client, model=model, response_format="tool"),
+        )
+
+    def test_request_is_compiled_once(self):
+        prompt = self.make_prompt("agent_a")
+        with patch.object(self.ai_utils, "_get_openai_request", wraps=self.ai_utils._get_openai_request) as build:
+            first = self.ai_utils._convert_prompt_to_request(prompt, "openai")
+            self.ai_utils._request_key(prompt)
+            second = self.ai_utils._convert_prompt_to_request(prompt, "openai")
+        self.assertEqual(build.call_count, 1)
+        self.assertIs(first, second)
+
+    def test_history_and_config_changes_recompile(self):
+        prompt = self.make_prompt("agent_a")
+        first = self.ai_utils._convert_prompt_to_request(prompt, "openai")
+
+        output = LLMOutput(raw_result={"error": "skip"}, completion_kwargs={}, start_time=0, end_time=0, source_id="agent_a", client="openai")
+        prompt.add_chat_turn_history(output)
+        second = self.ai_utils._convert_prompt_to_request(prompt, "openai")
+        self.assertIsNot(first, second)
+        self.assertEqual(len(second["messages"]), len(first["messages"]) + 2)
+
+        # the agent mutates its llm_config in place between executions
+        prompt.llm_config.max_tokens = 50
+        third = self.ai_utils._convert_prompt_to_request(prompt, "openai")
+        self.assertEqual(third["max_tokens"], 50)
+
+        prompt.new_message = "Submit your ask."
+        self.assertEqual(self.ai_utils._convert_prompt_to_request(prompt, "openai")["messages"][-1]["content"], "Submit your ask.")
+
+    def test_static_parts_are_shared_across_prompts(self):
+        requests = [self.ai_utils._convert_prompt_to_request(self.make_prompt(f"agent_{i}"), "openai") for i in range(3)]
+        for request in requests[1:]:
+            self.assertIs(request["tools"][0], requests[0]["tools"][0])
+
+        anthropic_prompts = [self.make_prompt(f"agent_{i}", client="anthropic", model="claude-3-5-sonnet-20240620") for i in range(2)]
+        anthropic_requests = [self.ai_utils._convert_prompt_to_request(p, "anthropic") for p in anthropic_prompts]
+        self.assertIs(anthropic_requests[0]["tools"][0], anthropic_requests[1]["tools"][0])
+
+    def test_model_copy_does_not_reuse_compiled_request(self):
+        prompt = self.make_prompt("agent_a")
+        self.ai_utils._convert_prompt_to_request(prompt, "openai")
+        copy = prompt.update_llm_config(LLMConfig(client="openai", model="gpt-4o", response_format="tool"))
+        self.assertEqual(self.ai_utils._convert_prompt_to_request(copy, "openai")["model"], "gpt-4o")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.agents.base_agent.agent import Agent
+from trade_agents.inference.message_models import LLMConfig
+from trade_agents.inference.oai_parallel import OAIApiFromFileConfig, RateLimiter, process_api_requests_from_file
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.registry import clear_ai_utilities, get_ai_utilities, register_ai_utilities
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        clear_ai_utilities()
+
+    def tearDown(self):
+        clear_ai_utilities()
+
+    def test_agents_share_one_client(self):
+        agents = [Agent(role="buyer", llm_config=LLMConfig(client="openai", model="gpt-4o-mini")) for _ in range(3)]
+        self.assertTrue(all(agent.ai_utilities is get_ai_utilities() for agent in agents))
+
+    def test_registered_client_is_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = register_ai_utilities(ParallelAIUtilities(cache_folder=cache_dir))
+            self.assertIs(Agent(role="seller", llm_config=LLMConfig(client="openai", model="gpt-4o-mini")).ai_utilities, client)
+            self.assertIsNot(get_ai_utilities("other", cache_folder=cache_dir), client)
+
+
+class TestSharedRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.tmp_dir.cleanup()
+
+    async def handle_completion(self, request):
+        return web.json_response({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test-model",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        })
+
+    def make_config(self, name: str, num_requests: int, deadline: float) -> OAIApiFromFileConfig:
+        requests_file = os.path.join(self.tmp_dir.name, f"{name}_requests.jsonl")
+        with open(requests_file, "w") as f:
+            for i in range(num_requests):
+                request = {"model": "test-model", "messages": [{"role": "user", "content": f"{name} {i}"}]}
+                f.write(json.dumps([{"prompt_context_id": f"{name}_{i}", "start_time": time.time()}, request]) + "\n")
+        return OAIApiFromFileConfig(
+            requests_filepath=requests_file,
+            save_filepath=os.path.join(self.tmp_dir.name, f"{name}_results.jsonl"),
+            request_url=self.request_url,
+            api_key="",
+            max_requests_per_minute=2,
+            deadline=deadline,
+        )
+
+    def count_errors(self, config: OAIApiFromFileConfig) -> int:
+        with open(config.save_filepath) as f:
+            return sum("error" in json.loads(line)[-1] for line in f)
+
+    async def test_concurrent_batches_share_the_budget(self):
+        limiter = RateLimiter(max_requests_per_minute=2, max_tokens_per_minute=100_000)
+        deadline = time.time() + 0.5
+        configs = [self.make_config(name, 2, deadline) for name in ("agent_a", "agent_b")]
+
+        with patch("trade_agents.inference.oai_parallel.num_tokens_consumed_from_request", return_value=100):
+            await asyncio.gather(*(process_api_requests_from_file(config, rate_limiter=limiter) for config in configs))
+
+        # two requests fit in the shared budget, the other two wait until the deadline
+        self.assertEqual(sum(self.count_errors(config) for config in configs), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
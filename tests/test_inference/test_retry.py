@@ -0,0 +1,143 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.inference.oai_parallel import OAIApiFromFileConfig, process_api_requests_from_file
+from trade_agents.inference.retry import RetryPolicy, RetryQueue, classify_error, parse_retry_after
+from tests.test_inference import make_completion
+
+
+class TestErrorClassification(unittest.TestCase):
+    def test_classes(self):
+        self.assertEqual(classify_error({"error": {"type": "invalid_request_error", "message": "bad schema"}}, 400), "validation")
+        self.assertEqual(classify_error({"error": {"message": "Rate limit reached"}}, 429), "rate_limit")
+        self.assertEqual(classify_error({"error": {"type": "rate_limit_error"}}), "rate_limit")
+        self.assertEqual(classify_error({"error": {"type": "overloaded_error"}}, 529), "overloaded")
+        self.assertEqual(classify_error({"error": {"message": "internal"}}, 500), "server")
+        self.assertEqual(classify_error({"error": {"type": "authentication_error"}}, 401), "auth")
+        self.assertEqual(classify_error(TimeoutError()), "timeout")
+        self.assertEqual(classify_error(ValueError("bad json")), "other")
+
+    def test_retry_after_and_backoff(self):
+        self.assertEqual(parse_retry_after({"Retry-After": "3"}), 3.0)
+        self.assertEqual(parse_retry_after({"retry-after-ms": "250"}), 0.25)
+        self.assertIsNone(parse_retry_after({}))
+
+        rng = random.Random(0)
+        policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+        delays = [policy.backoff(5, rng=rng) for _ in range(200)]
+        self.assertTrue(all(0 <= d <= 4.0 for d in delays))
+        self.assertGreater(max(delays) - min(delays), 1.0)  # jittered
+        honoring = RetryPolicy(base_delay=0.5, honor_retry_after=True)
+        self.assertGreaterEqual(honoring.backoff(1, retry_after=2.0, rng=rng), 2.0)
+
+    def test_queue_hands_out_ready_requests_in_order(self):
+        queue = RetryQueue()
+        queue.put("later", 10.0)
+        queue.put("now", 0.0)
+        self.assertEqual(queue.pop_ready(), "now")
+        self.assertIsNone(queue.pop_ready())
+        self.assertEqual(len(queue), 1)
+
+
+class TestRetries(unittest.IsolatedAsyncioTestCase):
+    """Runs process_api_requests_from_file against a local server answering with scripted errors."""
+
+    async def asyncSetUp(self):
+        self.failures = {}  # prompt content -> list of (status, body, headers) to answer before succeeding
+        self.calls = []
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.tmp_dir.cleanup()
+
+    async def handle_completion(self, request):
+        body = await request.json()
+        content = body["messages"][-1]["content"]
+        self.calls.append((time.monotonic(), content))
+        scripted = self.failures.get(content)
+        if scripted:
+            status, error, headers = scripted.pop(0)
+            return web.json_response({"error": error}, status=status, headers=headers)
+        return web.json_response(make_completion(content))
+
+    async def run_requests(self, contents, **config_kwargs):
+        requests_file = os.path.join(self.tmp_dir.name, "requests.jsonl")
+        results_file = os.path.join(self.tmp_dir.name, "results.jsonl")
+        with open(requests_file, "w") as f:
+            for content in contents:
+                request = {"model": "test-model", "messages": [{"role": "user", "content": content}], "max_tokens": 10}
+                f.write(json.dumps([{"prompt_context_id": content, "start_time": time.time()}, request]) + "\n")
+        config = OAIApiFromFileConfig(
+            requests_filepath=requests_file,
+            save_filepath=results_file,
+            request_url=self.request_url,
+            api_key="",
+            **config_kwargs,
+        )
+        with patch("trade_agents.inference.oai_parallel.num_tokens_consumed_from_request", return_value=100):
+            await process_api_requests_from_file(config)
+        with open(results_file) as f:
+            return {metadata["prompt_context_id"]: (metadata, response) for metadata, _, response in (json.loads(line) for line in f)}
+
+    async def test_validation_errors_are_not_retried(self):
+        self.failures["bad"] = [(400, {"type": "invalid_request_error", "message": "invalid schema"}, {})]
+
+        results = await self.run_requests(["bad"])
+
+        metadata, response = results["bad"]
+        self.assertIn("error", response)
+        self.assertEqual(metadata["attempts"], 1)
+        self.assertEqual(metadata["error_class"], "validation")
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_server_errors_are_retried_with_attempt_counts(self):
+        self.failures["flaky"] = [(500, {"message": "internal"}, {}), (502, {"message": "bad gateway"}, {})]
+
+        results = await self.run_requests(["flaky", "fine"])
+
+        metadata, response = results["flaky"]
+        self.assertNotIn("error", response)
+        self.assertEqual(metadata["attempts"], 3)
+        self.assertEqual(metadata["retry_errors"], ["server", "server"])
+        self.assertEqual(results["fine"][0]["attempts"], 1)
+
+    async def test_retry_after_is_honored(self):
+        self.failures["limited"] = [(429, {"type": "rate_limit_error", "message": "slow down"}, {"Retry-After": "0.5"})]
+
+        start = time.monotonic()
+        results = await self.run_requests(["limited"])
+
+        self.assertNotIn("error", results["limited"][1])
+        retry_time = self.calls[1][0]
+        self.assertGreaterEqual(retry_time - start, 0.5)
+        # no fixed 15 second cool down anymore
+        self.assertLess(time.monotonic() - start, 3.0)
+
+    async def test_waiting_retries_do_not_block_fresh_requests(self):
+        self.failures["slow_retry"] = [(503, {"message": "unavailable"}, {"Retry-After": "0.5"})]
+
+        await self.run_requests(["slow_retry"] + [f"fresh_{i}" for i in range(5)])
+
+        order = [content for _, content in self.calls]
+        self.assertEqual(order[-1], "slow_retry")
+        self.assertEqual(sorted(order[1:-1]), sorted(f"fresh_{i}" for i in range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext
+from trade_agents.inference.routing import AIMDConcurrencyLimiter, EndpointStats, InferenceRouter
+
+
+class TestEndpointStats(unittest.TestCase):
+    def test_percentiles_and_rates(self):
+        stats = EndpointStats(window=100)
+        for latency in range(1, 101):
+            stats.record(latency / 100)
+        self.assertAlmostEqual(stats.p50, 0.5, places=1)
+        self.assertAlmostEqual(stats.p95, 0.95, places=1)
+        stats.record(5.0, rate_limited=True)
+        self.assertEqual(stats.rate_limit_rate, 0.01)
+        self.assertEqual(stats.error_rate, 0.01)
+        self.assertLess(stats.p95, 1.0)
+
+
+class TestAIMDConcurrencyLimiter(unittest.TestCase):
+    def test_additive_increase_when_saturated(self):
+        limiter = AIMDConcurrencyLimiter(initial_limit=2, cooldown=0)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release(success=True)
+        self.assertAlmostEqual(limiter.limit, 2.5)
+
+    def test_multiplicative_decrease_on_overload(self):
+        limiter = AIMDConcurrencyLimiter(initial_limit=16, cooldown=60)
+        for _ in range(4):
+            limiter.try_acquire()
+        for _ in range(4):
+            limiter.release(success=False, overloaded=True)
+        # a burst of 429s from one window only halves the limit once
+        self.assertEqual(limiter.limit, 8)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestInferenceRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = InferenceRouter(min_samples=3)
+
+    def record(self, client, model, latency, n=10, **kwargs):
+        for _ in range(n):
+            self.router.try_acquire(client, model)
+            self.router.release(client, model, latency=latency, **kwargs)
+
+    def make_prompt(self, prompt_id, llm_config):
+        return LLMPromptContext(id=prompt_id, new_message="state", llm_config=llm_config)
+
+    def pooled_config(self, response_format="text"):
+        return LLMConfig(
+            client="openai",
+            model="gpt-4o-mini",
+            response_format=response_format,
+            fallback_pool=[LLMConfig(client="vllm", model="qwen"), LLMConfig(client="anthropic", model="claude")],
+        )
+
+    def test_routes_to_fastest_healthy_endpoint(self):
+        self.record("openai", "gpt-4o-mini", 8.0)
+        self.record("vllm", "qwen", 0.5)
+        self.record("anthropic", "claude", 0.2, rate_limited=True)
+
+        prompt = self.make_prompt("agent_0", self.pooled_config())
+        self.router.route([prompt])
+
+        self.assertEqual((prompt.llm_config.client, prompt.llm_config.model), ("vllm", "qwen"))
+        self.assertEqual(prompt.llm_config.response_format, "text")
+
+    def test_unexplored_endpoints_are_probed_and_load_is_spread(self):
+        self.record("openai", "gpt-4o-mini", 1.0)
+        self.record("vllm", "qwen", 1.0)
+        self.record("anthropic", "claude", 1.0)
+        self.router.initial_concurrency = 1
+        for key in list(self.router.limiters):
+            self.router.limiters[key].limit = 1
+
+        prompts = [self.make_prompt(f"agent_{i}", self.pooled_config()) for i in range(3)]
+        self.router.route(prompts)
+
+        self.assertEqual(len({p.llm_config.client for p in prompts}), 3)
+
+    def test_pool_members_that_cannot_serve_the_format_are_dropped(self):
+        self.record("openai", "gpt-4o-mini", 8.0)
+        self.record("vllm", "qwen", 0.5)
+
+        prompt = self.make_prompt("agent_0", self.pooled_config(response_format="json_object"))
+        self.router.route([prompt])
+
+        # vLLM and Anthropic do not support json_object, the primary is kept
+        self.assertEqual(prompt.llm_config.client, "openai")
+
+    def test_prompts_without_pool_are_untouched(self):
+        config = LLMConfig(client="openai", model="gpt-4o-mini")
+        prompt = self.make_prompt("agent_0", config)
+        self.router.route([prompt])
+        self.assertIs(prompt.llm_config, config)
+
+
+if __name__ == '__main__':
+    unittest.main()
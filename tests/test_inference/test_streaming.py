@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from trade_agents.inference.message_models import LLMOutput, UsageTotals
+from trade_agents.inference.metrics import InferenceMetrics
+from trade_agents.inference.oai_parallel import OAIApiFromFileConfig, process_api_requests_from_file
+from trade_agents.inference.streaming import (
+    AnthropicStreamAccumulator,
+    IncrementalJSONParser,
+    OpenAIStreamAccumulator,
+    required_fields_from_request,
+)
+
+ACTION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "Bid",
+        "parameters": {
+            "type": "object",
+            "properties": {"price": {"type": "number"}, "quantity": {"type": "integer"}, "reasoning": {"type": "string"}},
+            "required": ["price", "quantity"],
+        },
+    },
+}
+
+
+def tool_call_chunks(argument_parts):
+    chunks = [{
+        "id": "chatcmpl-stream-test",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "tool_calls": [
+            {"index": 0, "id": "call_0", "type": "function", "function": {"name": "Bid", "arguments": ""}}
+        ]}, "finish_reason": None}],
+    }]
+    for part in argument_parts:
+        chunks.append({
+            "id": "chatcmpl-stream-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "test-model",
+            "choices": [{"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {"arguments": part}}]}, "finish_reason": None}],
+        })
+    chunks.append({
+        "id": "chatcmpl-stream-test",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}],
+    })
+    return chunks
+
+
+class TestIncrementalJSONParser(unittest.TestCase):
+    def test_members_complete_across_chunk_boundaries(self):
+        parser = IncrementalJSONParser()
+        parser.feed('```json\n{"pri')
+        parser.feed('ce": 12')
+        self.assertEqual(parser.fields, {})
+        parser.feed('5.5, "quantity": 1')
+        self.assertEqual(parser.fields, {"price": 125.5})
+        parser.feed(', "reasoning": "a, {b}"}')
+        self.assertEqual(parser.fields, {"price": 125.5, "quantity": 1, "reasoning": "a, {b}"})
+        self.assertTrue(parser.closed)
+
+    def test_nested_values(self):
+        parser = IncrementalJSONParser()
+        parser.feed('{"orders": [{"price": 1}, {"price": 2}], "note": "x"}')
+        self.assertEqual(parser.fields["orders"], [{"price": 1}, {"price": 2}])
+        self.assertTrue(parser.has_fields(["orders", "note"]))
+        self.assertFalse(parser.has_fields([]))
+
+    def test_required_fields_from_forced_tool(self):
+        request = {"tools": [ACTION_TOOL], "tool_choice": {"type": "function", "function": {"name": "Bid"}}}
+        self.assertEqual(required_fields_from_request(request), ["price", "quantity"])
+        anthropic_request = {
+            "tools": [{"name": "Bid", "input_schema": {"required": ["price"]}}],
+            "tool_choice": {"type": "tool", "name": "Bid"},
+        }
+        self.assertEqual(required_fields_from_request(anthropic_request), ["price"])
+        self.assertIsNone(required_fields_from_request({"messages": []}))
+
+
+class TestStreamAccumulators(unittest.TestCase):
+    def test_openai_tool_call_stream_rebuilds_completion(self):
+        accumulator = OpenAIStreamAccumulator()
+        for chunk in tool_call_chunks(['{"price": 10', '0, "quantity"', ': 2}']):
+            accumulator.feed(chunk)
+        accumulator.feed({"id": "chatcmpl-stream-test", "choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}})
+
+        output = LLMOutput(raw_result=accumulator.to_response(), start_time=0, end_time=1, source_id="agent_0", client="openai")
+
+        self.assertEqual(output.json_object.name, "Bid")
+        self.assertEqual(output.json_object.object, {"price": 100, "quantity": 2})
+        self.assertEqual(output.usage.total_tokens, 15)
+
+    def test_anthropic_tool_use_stream_rebuilds_message(self):
+        accumulator = AnthropicStreamAccumulator()
+        events = [
+            {"type": "message_start", "message": {"id": "msg_1", "type": "message", "role": "assistant", "model": "claude", "content": [], "usage": {"input_tokens": 20, "output_tokens": 1}}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "tool_use", "id": "toolu_1", "name": "Bid", "input": {}}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "input_json_delta", "partial_json": '{"price": 5'}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "input_json_delta", "partial_json": ', "quantity": 3}'}},
+            {"type": "content_block_stop", "index": 0},
+            {"type": "message_delta", "delta": {"stop_reason": "tool_use"}, "usage": {"output_tokens": 12}},
+        ]
+        for event in events:
+            accumulator.feed(event)
+
+        output = LLMOutput(raw_result=accumulator.to_response(), start_time=0, end_time=1, source_id="agent_0", client="anthropic")
+
+        self.assertEqual(output.json_object.name, "Bid")
+        self.assertEqual(output.json_object.object, {"price": 5, "quantity": 3})
+        self.assertEqual(output.usage.completion_tokens, 12)
+        self.assertFalse(accumulator.fill_missing_usage(100, 100))
+
+    def test_anthropic_early_resolved_stream_keeps_the_input_usage(self):
+        accumulator = AnthropicStreamAccumulator()
+        accumulator.feed({"type": "message_start", "message": {"id": "msg_1", "type": "message", "role": "assistant", "model": "claude", "content": [],
+                                                               "stop_reason": None, "usage": {"input_tokens": 20, "cache_read_input_tokens": 15, "output_tokens": 1}}})
+        accumulator.feed({"type": "content_block_start", "index": 0, "content_block": {"type": "tool_use", "id": "toolu_1", "name": "Bid", "input": {}}})
+        accumulator.feed({"type": "content_block_delta", "index": 0, "delta": {"type": "input_json_delta", "partial_json": '{"price": 5, "quantity": 3,'}})
+
+        self.assertTrue(accumulator.fill_missing_usage(100, 8))
+        usage = accumulator.to_response(early_resolved=True)["usage"]
+        self.assertEqual(usage, {"input_tokens": 20, "cache_read_input_tokens": 15, "output_tokens": 8})
+
+
+class TestStreamingRequests(unittest.IsolatedAsyncioTestCase):
+    """Runs process_api_requests_from_file against a local server that streams slowly."""
+
+    async def asyncSetUp(self):
+        self.tail_delay = 2.0
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.received = []
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.tmp_dir.cleanup()
+
+    async def handle_completion(self, request):
+        body = await request.json()
+        self.received.append(body)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunks = tool_call_chunks(['{"price": 9', '9.5, "quantity": 4', ', "reasoning": "', 'long explanation', '"}'])
+        chunks.append({"id": "chatcmpl-stream-test", "choices": [], "usage": {"prompt_tokens": 20, "completion_tokens": 12, "total_tokens": 32}})
+        for i, chunk in enumerate(chunks):
+            if i == 4:
+                # the required fields are complete, the rest of the stream arrives late
+                await asyncio.sleep(self.tail_delay)
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    def write_requests(self) -> tuple:
+        requests_file = os.path.join(self.tmp_dir.name, "requests.jsonl")
+        results_file = os.path.join(self.tmp_dir.name, "results.jsonl")
+        request = {
+            "model": "test-model",
+            "messages": [{"role": "user", "content": "Place your bid"}],
+            "max_tokens": 50,
+            "tools": [ACTION_TOOL],
+            "tool_choice": {"type": "function", "function": {"name": "Bid"}},
+        }
+        with open(requests_file, "w") as f:
+            f.write(json.dumps([{"prompt_context_id": "agent_0", "start_time": time.time()}, request]) + "\n")
+        return requests_file, results_file
+
+    async def run_requests(self, early_resolve: bool):
+        requests_file, results_file = self.write_requests()
+        config = OAIApiFromFileConfig(
+            requests_filepath=requests_file,
+            save_filepath=results_file,
+            request_url=self.request_url,
+            api_key="",
+            stream=True,
+            early_resolve=early_resolve,
+        )
+        start = time.monotonic()
+        # token counting downloads the tiktoken encoding, which is irrelevant here
+        with patch("trade_agents.inference.oai_parallel.num_tokens_consumed_from_request", return_value=100):
+            await process_api_requests_from_file(config)
+        elapsed = time.monotonic() - start
+        with open(results_file) as f:
+            metadata, request_json, response = json.loads(f.readline())
+        return elapsed, metadata, request_json, response
+
+    async def test_early_resolution_returns_before_stream_ends(self):
+        elapsed, metadata, request_json, response = await self.run_requests(early_resolve=True)
+
+        self.assertLess(elapsed, self.tail_delay)
+        self.assertTrue(metadata["early_resolved"])
+        self.assertTrue(self.received[0]["stream"])
+        self.assertNotIn("stream", request_json)
+        output = LLMOutput(raw_result=response, start_time=0, end_time=1, source_id="agent_0", client="vllm",
+                           completion_kwargs={"model": "test-model"}, request_metadata=metadata)
+        self.assertEqual(output.json_object.object, {"price": 99.5, "quantity": 4})
+
+        # the usage chunk at the end of the stream was dropped, the usage is estimated
+        self.assertTrue(metadata["usage_estimated"])
+        usage = UsageTotals()
+        usage.add(output.usage, provider=output.result_provider, estimated=metadata["usage_estimated"])
+        self.assertGreater(usage.input_tokens, 0)
+        self.assertGreater(usage.output_tokens, 0)
+        self.assertEqual(usage.estimated_requests, 1)
+        metrics = InferenceMetrics()
+        metrics.record_batch([output], 1.0, {"phase": "act"})
+        self.assertIn('inference_estimated_usage_requests_total{client="vllm",model="test-model",phase="act"} 1', metrics.to_prometheus_text())
+
+    async def test_full_stream_without_early_resolution(self):
+        self.tail_delay = 0.05
+        _, metadata, _, response = await self.run_requests(early_resolve=False)
+
+        self.assertNotIn("early_resolved", metadata)
+        self.assertNotIn("usage_estimated", metadata)
+        output = LLMOutput(raw_result=response, start_time=0, end_time=1, source_id="agent_0", client="vllm")
+        self.assertEqual(output.usage.total_tokens, 32)
+        self.assertEqual(output.json_object.object, {"price": 99.5, "quantity": 4, "reasoning": "long explanation"})
+
+
+if __name__ == '__main__':
+    unittest.main()
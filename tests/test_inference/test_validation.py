@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from trade_agents.economics.econ_models import Ask, Bid
+from trade_agents.inference.local_backend import ScriptedBackend
+from trade_agents.inference.message_models import LLMConfig, LLMOutput, LLMPromptContext
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.validation import OutputValidator, repair_json_text, validate_output
+from trade_agents.orchestrators.agent_cognitive import AgentCognitiveProcessor
+
+
+def make_output(source_id: str, content: str) -> LLMOutput:
+    return LLMOutput(
+        raw_result={
+            "id": f"chatcmpl-{source_id}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        },
+        completion_kwargs={"model": "gpt-4o-mini"},
+        start_time=0.0,
+        end_time=1.0,
+        source_id=source_id,
+        client="openai",
+    )
+
+
+class TestRepair(unittest.TestCase):
+    def test_repair_json_text(self):
+        self.assertEqual(repair_json_text('```json\n{"price": 10, "quantity": 1,}\n```'), {"price": 10, "quantity": 1})
+        self.assertEqual(repair_json_text("Sure! {'price': 10.5, 'quantity': 1} hope that helps"), {"price": 10.5, "quantity": 1})
+        self.assertIsNone(repair_json_text("I would rather not bid."))
+
+    def test_cheap_failures_are_repaired(self):
+        result = validate_output('{"price": 12.5, "quantity": 1}', Bid)
+        self.assertTrue(result.ok)
+        self.assertFalse(result.repaired)
+
+        result = validate_output({"bid": {"price": "$12.50", "quantity": 3}}, Bid)
+        self.assertTrue(result.ok)
+        self.assertTrue(result.repaired)
+        self.assertEqual((result.value.price, result.value.quantity), (12.5, 1))
+
+        result = validate_output({"quantity": 1}, Ask)
+        self.assertFalse(result.ok)
+        self.assertIn("price", result.error)
+
+
+class TestValidationStage(unittest.IsolatedAsyncioTestCase):
+    async def test_validate_batch(self):
+        results = await OutputValidator(chunk_size=2).validate_batch([
+            ("a", make_output("a", '{"price": 10}'), Bid),
+            ("b", make_output("b", "price: ten"), Bid),
+            ("c", make_output("c", '```{"price": "9"}```'), Ask),
+        ])
+        self.assertTrue(results["a"].ok)
+        self.assertFalse(results["b"].ok)
+        self.assertIsInstance(results["c"].value, Ask)
+
+    async def test_failed_agents_are_reprompted_once(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            reprompted = []
+
+            def script(request):
+                reprompted.append(request["messages"][-1]["content"])
+                return json.dumps({"price": 11.0, "quantity": 1})
+
+            ai_utils = ParallelAIUtilities(cache_folder=cache_dir, coalesce_requests=False, local_backend=ScriptedBackend(script=script))
+            processor = AgentCognitiveProcessor(ai_utils, MagicMock(), logging.getLogger(__name__))
+            agents = [SimpleNamespace(id=agent_id, index=i, role="buyer") for i, agent_id in enumerate(["good", "broken"])]
+            prompts = [
+                LLMPromptContext(id=agent.id, system_string="You are a buyer.", new_message="Place your bid.", llm_config=LLMConfig(client="openai", model="gpt-4o-mini"))
+                for agent in agents
+            ]
+            outputs = [make_output("good", '{"price": 10}'), make_output("broken", "I bid ten dollars")]
+
+            valid = await processor._validate_outputs(agents, prompts, outputs, lambda agent: Bid, "auction", "act", deadline=None)
+
+        self.assertEqual(sorted(o.source_id for o in valid), ["broken", "good"])
+        self.assertEqual(len(reprompted), 1)
+        self.assertIn("could not be used", reprompted[0])
+        self.assertEqual(processor.validated_outputs["good"].price, 10)
+        self.assertEqual(processor.validated_outputs["broken"].price, 11.0)
+
+
+    async def test_concurrent_cohorts_keep_their_skipped_agents(self):
+        acted = []
+
+        async def run_parallel_ai_completion(prompts, update_history=True, deadline=None, labels=None):
+            if labels["phase"] == "act":
+                acted.extend(prompt.id for prompt in prompts)
+            # "late" misses the perception deadline
+            return [make_output(prompt.id, '{"price": 10}') for prompt in prompts if prompt.id != "late"]
+
+        ai_utils = MagicMock()
+        ai_utils.run_parallel_ai_completion = run_parallel_ai_completion
+        processor = AgentCognitiveProcessor(ai_utils, MagicMock(), logging.getLogger(__name__))
+        processor._retrieve_perception_memories = lambda agents, environment_name: asyncio.sleep(0, {agent.id: ([], []) for agent in agents})
+
+        def make_agent(agent_id, index):
+            agent = SimpleNamespace(id=agent_id, index=index, persona="buyer", short_term_memory=None, last_perception=None)
+            agent.perceive = lambda *args, **kwargs: asyncio.sleep(0, LLMPromptContext(
+                id=agent_id, system_string="You are a buyer.", new_message="Perceive.", llm_config=LLMConfig(client="openai", model="gpt-4o-mini")))
+            agent.generate_action = lambda *args, **kwargs: asyncio.sleep(0, LLMPromptContext(
+                id=agent_id, system_string="You are a buyer.", new_message="Act.", llm_config=LLMConfig(client="openai", model="gpt-4o-mini")))
+            return agent
+
+        first, second = [make_agent("on_time", 0), make_agent("late", 1)], [make_agent("other", 2)]
+        first_perceived, second_perceived = asyncio.Event(), asyncio.Event()
+
+        async def run_first():
+            await processor.run_parallel_perceive(first, "auction")
+            first_perceived.set()
+            await second_perceived.wait()
+            await processor.run_parallel_action(first, "auction")
+
+        async def run_second():
+            # perceives while the first cohort sits between its perceive and act steps
+            await first_perceived.wait()
+            await processor.run_parallel_perceive(second, "auction")
+            second_perceived.set()
+            await processor.run_parallel_action(second, "auction")
+
+        with patch("trade_agents.orchestrators.agent_cognitive.ShortTermMemory.store_memories_bulk"):
+            await asyncio.gather(run_first(), run_second())
+
+        self.assertEqual(sorted(acted), ["on_time", "other"])
+        self.assertEqual(processor.skipped_agents, {"late"})
+
+
+if __name__ == '__main__':
+    unittest.main()
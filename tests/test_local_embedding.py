@@ -0,0 +1,60 @@
+import math
+import unittest
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.embedding import MemoryEmbedder, get_embedder
+from trade_agents.memory.embedding_cache import clear_embedding_caches
+from trade_agents.memory.local_embedding import HashingVectorizer
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+class TestLocalEmbedding(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        clear_embedding_caches()
+        self.addCleanup(clear_embedding_caches)
+        self.config = MarketMemoryConfig(embedding_provider="local", vector_dim=256, batch_size=4)
+
+    def test_hashing_vectors_are_deterministic_and_normalized(self):
+        vectorizer = HashingVectorizer(256)
+        vector = vectorizer.embed_one("Bid 10 for apples")
+        self.assertEqual(len(vector), 256)
+        self.assertAlmostEqual(math.sqrt(sum(v * v for v in vector)), 1.0)
+        self.assertEqual(vector, HashingVectorizer(256).embed_one("bid 10 for apples"))
+        self.assertEqual(sum(vectorizer.embed_one("")), 1.0)
+
+        related = cosine(vector, vectorizer.embed_one("bid 12 for apples"))
+        unrelated = cosine(vector, vectorizer.embed_one("the auction closed without trades"))
+        self.assertGreater(related, unrelated)
+
+    def test_embedder_runs_offline(self):
+        embedder = MemoryEmbedder(self.config)
+        texts = [f"ask {i} for oranges" for i in range(10)]
+        embeddings = embedder.get_embeddings(texts)
+
+        self.assertEqual(embeddings, HashingVectorizer(256).embed(texts))
+        # cached embeddings come back with float32 precision
+        for cached, embedded in zip(embedder.get_embeddings(texts[0]), embeddings[0]):
+            self.assertAlmostEqual(cached, embedded, places=6)
+        self.assertEqual(embedder.cache.hits, 1)
+
+    async def test_async_embedder_matches_sync(self):
+        config = self.config.model_copy(update={"embedding_cache_size": 0})
+        embedder = MemoryEmbedder(config)
+        texts = [f"perceived price {i}" for i in range(9)]
+        self.assertEqual(await embedder.aget_embeddings(texts), embedder.get_embeddings(texts))
+
+    def test_memories_share_one_embedder_per_config(self):
+        embedder = get_embedder(self.config)
+        self.assertIs(get_embedder(MarketMemoryConfig(embedding_provider="local", vector_dim=256, batch_size=4)), embedder)
+        self.assertIsNot(get_embedder(self.config.model_copy(update={"batch_size": 8})), embedder)
+
+        # a cleared cache is not kept alive by the shared embedder
+        clear_embedding_caches()
+        self.assertIsNot(get_embedder(self.config).cache, embedder.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
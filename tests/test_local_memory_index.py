@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.local_index import LocalMemoryIndex
+from trade_agents.memory.memory import MemoryObject, ShortTermMemory
+from trade_agents.memory.setup_db import DatabaseConnection
+from tests.test_memory_pool import FakePool
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def memory_object(i: int, step: str = "action", embedding=None, **metadata) -> MemoryObject:
+    return MemoryObject(agent_id="agent-0", cognitive_step=step, content=f"memory {i}",
+                        embedding=embedding or [1.0, float(i)], created_at=START + timedelta(seconds=i),
+                        metadata=metadata or None)
+
+
+class TestLocalMemoryIndex(unittest.TestCase):
+    def test_recent_applies_the_filters_oldest_first(self):
+        index = LocalMemoryIndex()
+        index.add([memory_object(3, "reflection"), memory_object(1), memory_object(2, round=2), memory_object(0, round=1)])
+
+        self.assertEqual([m.content for m in index.recent(2)], ["memory 2", "memory 3"])
+        self.assertEqual([m.content for m in index.recent(5, cognitive_step=["action"])], ["memory 0", "memory 1", "memory 2"])
+        self.assertEqual([m.content for m in index.recent(5, metadata_filters={"round": 2})], ["memory 2"])
+        self.assertEqual([m.content for m in index.recent(5, start_time=START + timedelta(seconds=2))], ["memory 2", "memory 3"])
+
+    def test_search_ranks_by_cosine_similarity(self):
+        index = LocalMemoryIndex()
+        index.add([memory_object(0, embedding=[1.0, 0.0]), memory_object(1, embedding=[0.0, 1.0]),
+                   memory_object(2, "reflection", embedding=[1.0, 1.0])])
+
+        results = index.search([2.0, 0.1], top_k=2)
+        self.assertEqual([m.content for m, _ in results], ["memory 0", "memory 2"])
+        self.assertAlmostEqual(results[0][1], 2.0 / (2.0 ** 2 + 0.1 ** 2) ** 0.5, places=5)
+        self.assertEqual([m.content for m, _ in index.search([2.0, 0.1], top_k=2, cognitive_step="reflection")], ["memory 2"])
+
+    def test_evicted_index_defers_to_the_database(self):
+        index = LocalMemoryIndex(max_items=3)
+        index.add([memory_object(i) for i in range(5)])
+
+        self.assertEqual([m.content for m in index.recent(3)], ["memory 2", "memory 3", "memory 4"])
+        self.assertIsNone(index.recent(4))
+        self.assertIsNone(index.search([1.0, 0.0], top_k=1))
+
+
+class TestShortTermMemoryLocalIndex(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patcher = patch("trade_agents.memory.setup_db.ThreadedConnectionPool", FakePool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = DatabaseConnection(MarketMemoryConfig(local_memory_index=True))
+        self.addCleanup(self.db.close)
+
+        with patch.object(DatabaseConnection, "connect"), \
+                patch.object(DatabaseConnection, "create_agent_cognitive_memory_table"), \
+                patch("trade_agents.memory.memory.get_embedder"):
+            self.memory = ShortTermMemory(self.db.config, self.db, "agent-0")
+        self.memory.cognitive_memory.embedder.aget_embeddings = AsyncMock(return_value=[1.0, 0.0])
+
+    async def test_lookups_are_answered_locally_and_writes_flushed_behind(self):
+        with patch("trade_agents.memory.memory.execute_values"):
+            await asyncio.gather(*(self.memory.store_memory(memory_object(i)) for i in range(3)))
+            await ShortTermMemory.store_memories_bulk([(self.memory, memory_object(3, "perception"))])
+
+            recent = await self.memory.retrieve_recent_memories(limit=2)
+            similar = await self.memory.search_memories("bid", top_k=1)
+            batch = await ShortTermMemory.retrieve_recent_memories_batch([self.memory], limit=1)
+            self.assertEqual([m.content for m in recent], ["memory 2", "memory 3"])
+            self.assertEqual(similar[0][0].content, "memory 0")
+            self.assertEqual([m.content for m in batch["agent-0"]], ["memory 3"])
+            # nothing has reached the database yet, the writes wait for their round-trips
+            self.assertEqual(len(self.memory.pending_writes), 4)
+
+            await self.memory.flush()
+            self.assertEqual(self.memory.pending_writes, set())
+            self.assertEqual(sum(conn.commits for conn in self.db.pool.connections), 4)
+
+    async def test_failed_write_is_raised_by_flush(self):
+        await self.memory.store_memory(MemoryObject(agent_id="agent-0", cognitive_step="action", content="fail", embedding=[1.0, 0.0]))
+        with self.assertRaises(ValueError):
+            await self.memory.flush()
+        self.assertEqual(self.memory.pending_writes, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
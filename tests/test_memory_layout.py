@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.memory import LongTermMemory, MemoryObject, ShortTermMemory
+from trade_agents.memory.migrate_memory import agent_id_from_table
+from trade_agents.memory.setup_db import COGNITIVE_MEMORY_TABLE, DatabaseConnection
+from tests.test_memory_pool import FakeCursor, FakePool
+
+
+class TestSharedMemoryLayout(unittest.IsolatedAsyncioTestCase):
+    def make_memory(self, layout: str, agent_id: str, memory_class=ShortTermMemory, db=None):
+        if db is None:
+            db = DatabaseConnection(MarketMemoryConfig(memory_layout=layout))
+            self.addCleanup(db.close)
+            db.conn, db.cursor = MagicMock(), MagicMock()
+        with patch.object(DatabaseConnection, "connect"), \
+                patch.object(DatabaseConnection, "create_shared_memory_tables") as create_shared, \
+                patch("trade_agents.memory.memory.get_embedder"):
+            memory = memory_class(db.config, db, agent_id)
+        self.shared_tables_created = create_shared.called
+        return memory
+
+    async def asyncSetUp(self):
+        patcher = patch("trade_agents.memory.setup_db.ThreadedConnectionPool", FakePool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_shared_layout_scopes_queries_by_agent(self):
+        agent_id = "0b9c1a52-7d1e-4f7a-9a0e-5d2f1c3b4a10"
+        memory = self.make_memory("shared", agent_id)
+        self.assertTrue(self.shared_tables_created)
+        self.assertEqual(memory.cognitive_memory.cognitive_table, COGNITIVE_MEMORY_TABLE)
+
+        await memory.store_memory(MemoryObject(agent_id=agent_id, cognitive_step="action", content="bid", embedding=[0.0]))
+        await memory.retrieve_recent_memories(limit=3, cognitive_step="action")
+
+        pool = memory.cognitive_memory.db.pool
+        (insert, insert_params), = pool.connections[0].queries
+        (select, select_params), = pool.connections[1].queries
+        self.assertIn(f"INSERT INTO {COGNITIVE_MEMORY_TABLE} (agent_id, memory_id,", insert)
+        self.assertEqual(insert_params[0], agent_id)
+        self.assertIn("WHERE agent_id = %s AND cognitive_step = %s", select)
+        self.assertEqual(select_params, (agent_id, "action", 3))
+
+    async def test_shared_layout_bulk_write_is_one_statement(self):
+        memories = [self.make_memory("shared", f"agent-{i}") for i in range(3)]
+        db = memories[0].cognitive_memory.db
+        for memory in memories:
+            memory.cognitive_memory.db = db
+        items = [(memory, MemoryObject(agent_id=f"agent-{i}", cognitive_step="action", content="ask 12", embedding=[0.0]))
+                 for i, memory in enumerate(memories)]
+
+        with patch("trade_agents.memory.memory.execute_values") as execute_values:
+            await ShortTermMemory.store_memories_bulk(items)
+
+        (cursor, query, rows), kwargs = execute_values.call_args
+        self.assertEqual(execute_values.call_count, 1)
+        self.assertIn(f"INSERT INTO {COGNITIVE_MEMORY_TABLE} (agent_id, memory_id,", query)
+        self.assertEqual([row[0] for row in rows], ["agent-0", "agent-1", "agent-2"])
+
+    async def test_episodic_retrieval_of_many_agents_is_one_statement(self):
+        first = self.make_memory("shared", "agent-0", LongTermMemory)
+        memories = [first] + [self.make_memory("shared", f"agent-{i}", LongTermMemory, db=first.episodic_store.db) for i in (1, 2)]
+        embedder = first.memory_retriever.embedding_service
+        embedder.get_embeddings.side_effect = lambda texts: [[0.5] * 4 for _ in texts]
+        created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rows = [
+            ("agent-2", "6f1c2a52-7d1e-4f7a-9a0e-5d2f1c3b4a10", "sell apples", [], 0.4, [], {}, created_at, 0.7),
+            ("agent-0", "7a1c2a52-7d1e-4f7a-9a0e-5d2f1c3b4a10", "buy apples", [], 0.9, [], {}, created_at, 0.6),
+            ("agent-0", "8b1c2a52-7d1e-4f7a-9a0e-5d2f1c3b4a10", "buy pears", [], 0.1, [], {}, created_at, 0.8),
+        ]
+
+        with patch.object(FakeCursor, "fetchall", return_value=rows):
+            episodes = await LongTermMemory.retrieve_episodic_memories_batch(
+                [(memory, f"market state {i}") for i, memory in enumerate(memories)], top_k=2
+            )
+
+        embedder.get_embeddings.assert_called_once_with(["market state 0", "market state 1", "market state 2"])
+        *settings, (query, params) = first.episodic_store.db.pool.connections[0].queries
+        self.assertIn("SET LOCAL hnsw.ef_search = 40;", [q for q, _ in settings])
+        self.assertIn("CROSS JOIN LATERAL", query)
+        self.assertEqual(params[0::2][:3], ("agent-0", "agent-1", "agent-2"))
+        self.assertEqual([e.task_query for e in episodes["agent-0"]], ["buy pears", "buy apples"])
+        self.assertEqual(episodes["agent-1"], [])
+        self.assertEqual(len(episodes["agent-2"]), 1)
+
+    async def test_recent_memories_of_many_agents_per_agent_layout(self):
+        first = self.make_memory("per_agent", "agent-0")
+        memories = [first] + [self.make_memory("per_agent", f"agent-{i}", db=first.cognitive_memory.db) for i in (1, 2)]
+
+        recent = await ShortTermMemory.retrieve_recent_memories_batch(memories, limit=5)
+
+        (query, params), = first.cognitive_memory.db.pool.connections[0].queries
+        self.assertEqual(query.count("UNION ALL"), 2)
+        self.assertIn("FROM agent_agent_2_cognitive", query)
+        self.assertEqual(recent, {"agent-0": [], "agent-1": [], "agent-2": []})
+
+    async def test_per_agent_layout_is_unchanged(self):
+        memory = self.make_memory("per_agent", "agent-7")
+        self.assertFalse(self.shared_tables_created)
+        self.assertEqual(memory.cognitive_memory.cognitive_table, "agent_agent_7_cognitive")
+
+    def test_agent_id_from_table(self):
+        self.assertEqual(
+            agent_id_from_table("agent_0b9c1a52_7d1e_4f7a_9a0e_5d2f1c3b4a10_episodic"),
+            "0b9c1a52-7d1e-4f7a-9a0e-5d2f1c3b4a10"
+        )
+        self.assertEqual(agent_id_from_table("agent_market_agent_123_cognitive"), "market_agent_123")
+        self.assertIsNone(agent_id_from_table("agent_cognitive_memory"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.memory import MemoryObject, ShortTermMemory
+from trade_agents.memory.setup_db import DatabaseConnection
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((" ".join(query.split()), params))
+        if "fail" in str(params):
+            raise ValueError("bad row")
+        # a round-trip to the database
+        time.sleep(0.05)
+
+    def fetchone(self):
+        return (datetime.now(timezone.utc),)
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.maxconn = maxconn
+        self.closed = False
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+        self.connections = []
+
+    def getconn(self):
+        with self.lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            self.in_use -= 1
+
+    def closeall(self):
+        self.closed = True
+
+
+class TestMemoryPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patcher = patch("trade_agents.memory.setup_db.ThreadedConnectionPool", FakePool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = DatabaseConnection(MarketMemoryConfig(pool_max_size=4))
+        self.addCleanup(self.db.close)
+
+        with patch.object(DatabaseConnection, "connect"), \
+                patch.object(DatabaseConnection, "create_agent_cognitive_memory_table"), \
+                patch("trade_agents.memory.memory.get_embedder"):
+            self.memories = [ShortTermMemory(self.db.config, self.db, f"agent-{i}") for i in range(8)]
+
+    def memory_object(self, agent_id: str, content: str = "bid 10") -> MemoryObject:
+        return MemoryObject(agent_id=agent_id, cognitive_step="action", content=content, embedding=[0.0] * 4)
+
+    async def test_operations_run_concurrently_on_their_own_connections(self):
+        start = time.monotonic()
+        await asyncio.gather(*(
+            memory.store_memory(self.memory_object(memory.cognitive_memory.agent_id)) for memory in self.memories
+        ))
+        elapsed = time.monotonic() - start
+
+        pool = self.db.pool
+        self.assertEqual(len(pool.connections), 8)
+        self.assertEqual(pool.max_in_use, 4)
+        self.assertEqual(pool.in_use, 0)
+        self.assertTrue(all(conn.commits == 1 for conn in pool.connections))
+        # two waves of four instead of eight sequential round-trips
+        self.assertLess(elapsed, 0.3)
+
+    async def test_failed_operation_rolls_back_and_releases_its_connection(self):
+        memory = self.memories[0]
+        with self.assertRaises(ValueError):
+            await memory.store_memory(self.memory_object("agent-0", content="fail"))
+
+        conn = self.db.pool.connections[0]
+        self.assertEqual((conn.commits, conn.rollbacks), (0, 1))
+        self.assertEqual(self.db.pool.in_use, 0)
+        self.assertEqual(await memory.retrieve_recent_memories(limit=5), [])
+
+    async def test_bulk_write_embeds_once_in_one_transaction(self):
+        embedder = self.memories[0].cognitive_memory.embedder
+        embedder.aget_embeddings = AsyncMock(side_effect=lambda texts: [[0.1] * 4 for _ in texts])
+        items = [
+            (memory, MemoryObject(agent_id=memory.cognitive_memory.agent_id, cognitive_step="perception", content="market is calm"))
+            for memory in self.memories
+        ]
+        with patch("trade_agents.memory.memory.execute_values") as execute_values:
+            await ShortTermMemory.store_memories_bulk(items)
+
+        embedder.aget_embeddings.assert_awaited_once()
+        embedder.get_embeddings.assert_not_called()
+        self.assertEqual(len(self.db.pool.connections), 1)
+        self.assertEqual(self.db.pool.connections[0].commits, 1)
+        # one statement per agent table in the per-agent layout
+        self.assertEqual(execute_values.call_count, 8)
+        self.assertTrue(all(len(memory.items_cache) == 1 for memory in self.memories))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+from trade_agents.memory.benchmark_index import percentile, recall_at_k
+from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.setup_db import DatabaseConnection
+
+
+class TestVectorIndexOptions(unittest.TestCase):
+    def make_db(self, **config) -> DatabaseConnection:
+        db = DatabaseConnection(MarketMemoryConfig(**config))
+        db.conn, db.cursor = MagicMock(), MagicMock()
+        return db
+
+    def executed(self, db: DatabaseConnection) -> str:
+        return "\n".join(" ".join(c.args[0].split()) for c in db.cursor.execute.call_args_list)
+
+    def test_index_clause_follows_the_config(self):
+        db = self.make_db(index_method="hnsw", hnsw_m=24, hnsw_ef_construction=128)
+        self.assertEqual(db.vector_index_clause(),
+                         "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 128)")
+        self.assertIn("WITH (lists = 100)", db.vector_index_clause("ivfflat"))
+        with self.assertRaises(ValueError):
+            db.vector_index_clause("flat")
+
+        with patch.object(DatabaseConnection, "connect"):
+            db.create_agent_cognitive_memory_table("agent-1")
+        self.assertIn("CREATE INDEX IF NOT EXISTS agent_agent_1_cognitive_index ON agent_agent_1_cognitive USING hnsw", self.executed(db))
+
+    def test_deferred_index_build(self):
+        db = self.make_db(defer_index_build=True)
+        with patch.object(DatabaseConnection, "connect"):
+            db.create_knowledge_base_tables("market_news")
+            self.assertNotIn("CREATE INDEX", self.executed(db))
+            self.assertEqual(list(db.deferred_indexes), ["market_news_chunks_index"])
+
+            self.assertEqual(db.build_deferred_indexes(), ["market_news_chunks_index"])
+        self.assertIn("CREATE INDEX IF NOT EXISTS market_news_chunks_index ON market_news_knowledge_chunks USING ivfflat", self.executed(db))
+        self.assertEqual(db.deferred_indexes, {})
+
+    def test_agent_memory_indexes_are_not_deferred(self):
+        db = self.make_db(defer_index_build=True)
+        with patch.object(DatabaseConnection, "connect"):
+            db.create_agent_cognitive_memory_table("agent-1")
+            db.create_agent_episodic_memory_table("agent-1")
+        self.assertIn("CREATE INDEX IF NOT EXISTS agent_agent_1_cognitive_index ON agent_agent_1_cognitive", self.executed(db))
+        self.assertIn("CREATE INDEX IF NOT EXISTS agent_agent_1_episodic_index ON agent_agent_1_episodic", self.executed(db))
+        self.assertEqual(db.deferred_indexes, {})
+
+    def test_shared_memory_tables_have_no_vector_index(self):
+        db = self.make_db(memory_layout="shared", memory_partitions=2)
+        with patch.object(DatabaseConnection, "connect"):
+            db.create_shared_memory_tables()
+        executed = self.executed(db)
+        self.assertNotIn("USING hnsw", executed)
+        self.assertIn("DROP INDEX IF EXISTS agent_cognitive_memory_embedding_index;", executed)
+        self.assertIn("CREATE INDEX IF NOT EXISTS agent_cognitive_memory_recent_index", executed)
+
+    def test_search_settings(self):
+        db = self.make_db(hnsw_ef_search=100, ivfflat_probes=20)
+        cursor = MagicMock()
+        db.apply_search_settings(cursor)
+        self.assertEqual(cursor.execute.call_args_list, [
+            call("SET LOCAL hnsw.ef_search = 100;"),
+            call("SET LOCAL ivfflat.probes = 20;"),
+        ])
+
+    def test_recall_at_k(self):
+        self.assertEqual(recall_at_k([[1, 2, 3, 4], [5, 6]], [[1, 2, 9, 4], [6, 7]]), 4 / 6)
+        self.assertEqual(percentile([5.0, 1.0, 3.0, 2.0], 0.5), 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import os
+import random
+import unittest
+
+import psycopg2
+
+from trade_agents.memory.config import load_config_from_yaml
+from trade_agents.memory.setup_db import EPISODIC_MEMORY_TABLE, DatabaseConnection
+from trade_agents.memory.vector_search import EPISODIC_COLUMNS, MemoryRetriever, agent_memory_query, knowledge_base_query
+
+AGENT_ID = "explain-test-agent"
+KNOWLEDGE_BASE = "explain_test"
+
+
+class TestIndexUsage(unittest.TestCase):
+    """The similarity queries must be answerable by the vector index (needs Postgres with pgvector)."""
+
+    @classmethod
+    def setUpClass(cls):
+        config = load_config_from_yaml(os.path.join(os.path.dirname(__file__), "../trade_agents/memory/memory_config.yaml"))
+        cls.config = config.model_copy(update={"vector_dim": 8, "lists": 10})
+        cls.db = DatabaseConnection(cls.config)
+        try:
+            cls.db._ensure_database_exists()
+        except psycopg2.Error as e:
+            raise unittest.SkipTest(f"memory database not available: {e}")
+
+        cls.db.create_knowledge_base_tables(KNOWLEDGE_BASE)
+        cls.db.create_agent_episodic_memory_table(AGENT_ID)
+        cls.episodic_table = cls.db.episodic_memory_table(AGENT_ID)
+        rng = random.Random(0)
+        cls.db.cursor.execute(f"""
+            INSERT INTO {KNOWLEDGE_BASE}_knowledge_objects (knowledge_id, content)
+            VALUES ('00000000-0000-0000-0000-000000000001', 'document')
+            ON CONFLICT DO NOTHING;
+        """)
+        for i in range(500):
+            vector = [rng.random() for _ in range(8)]
+            cls.db.cursor.execute(f"""
+                INSERT INTO {KNOWLEDGE_BASE}_knowledge_chunks (knowledge_id, text, start_pos, end_pos, embedding)
+                VALUES ('00000000-0000-0000-0000-000000000001', %s, 0, 1, %s);
+            """, (f"chunk {i}", vector))
+            cls.db.cursor.execute(f"""
+                INSERT INTO {cls.episodic_table} (memory_id, task_query, embedding)
+                VALUES (gen_random_uuid(), %s, %s);
+            """, (f"episode {i}", vector))
+        cls.db.cursor.execute(f"ANALYZE {KNOWLEDGE_BASE}_knowledge_chunks; ANALYZE {cls.episodic_table};")
+        cls.db.conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.cursor.execute(f"DROP TABLE IF EXISTS {KNOWLEDGE_BASE}_knowledge_chunks, {KNOWLEDGE_BASE}_knowledge_objects, {cls.episodic_table};")
+        cls.db.conn.commit()
+        cls.db.close()
+
+    def explain(self, query: str, params: tuple) -> str:
+        # with sequential scans priced out, a plan can only avoid them through the index
+        self.db.cursor.execute("SET LOCAL enable_seqscan = off;")
+        self.db.cursor.execute(f"EXPLAIN {query}", params)
+        plan = "\n".join(row[0] for row in self.db.cursor.fetchall())
+        self.db.conn.rollback()
+        return plan
+
+    def test_knowledge_base_query_uses_the_index(self):
+        query_embedding = [0.5] * 8
+        plan = self.explain(
+            knowledge_base_query(f"{KNOWLEDGE_BASE}_knowledge_chunks", f"{KNOWLEDGE_BASE}_knowledge_objects"),
+            (query_embedding, query_embedding, 12, 0.7, 3)
+        )
+        self.assertIn(f"Index Scan using {KNOWLEDGE_BASE}_chunks_index", plan)
+
+    def test_agent_memory_query_uses_the_index(self):
+        query_embedding = [0.5] * 8
+        plan = self.explain(agent_memory_query(self.episodic_table, EPISODIC_COLUMNS, "TRUE"), (query_embedding, query_embedding, 2))
+        self.assertIn(f"Index Scan using {self.episodic_table}_index", plan)
+
+
+class FixedEmbedder:
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+    def get_embeddings(self, texts):
+        return self.embedding if isinstance(texts, str) else [self.embedding for _ in texts]
+
+
+class TestSharedLayoutSearch(unittest.TestCase):
+    """
+    In the shared layout a partition holds the memories of many agents; an agent's search
+    must still return its exact top_k (needs Postgres with pgvector).
+    """
+
+    AGENTS = [f"shared-search-agent-{i}" for i in range(40)]
+
+    @classmethod
+    def setUpClass(cls):
+        config = load_config_from_yaml(os.path.join(os.path.dirname(__file__), "../trade_agents/memory/memory_config.yaml"))
+        # one partition: all agents share it
+        cls.config = config.model_copy(update={"memory_layout": "shared", "memory_partitions": 1, "top_k": 5})
+        cls.db = DatabaseConnection(cls.config)
+        try:
+            cls.db._ensure_database_exists()
+        except psycopg2.Error as e:
+            raise unittest.SkipTest(f"memory database not available: {e}")
+
+        cls.db.create_shared_memory_tables()
+        rng = random.Random(0)
+        for agent_id in cls.AGENTS:
+            for i in range(25):
+                cls.db.cursor.execute(f"""
+                    INSERT INTO {EPISODIC_MEMORY_TABLE} (agent_id, memory_id, task_query, embedding, created_at)
+                    VALUES (%s, gen_random_uuid(), %s, %s, CURRENT_TIMESTAMP);
+                """, (agent_id, f"{agent_id} episode {i}", [rng.random() for _ in range(cls.config.vector_dim)]))
+        cls.db.cursor.execute(f"ANALYZE {EPISODIC_MEMORY_TABLE};")
+        cls.db.conn.commit()
+        cls.query_embedding = [rng.random() for _ in range(cls.config.vector_dim)]
+        cls.retriever = MemoryRetriever(cls.config, cls.db, FixedEmbedder(cls.query_embedding))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.cursor.execute(f"DELETE FROM {EPISODIC_MEMORY_TABLE} WHERE agent_id = ANY(%s);", (cls.AGENTS,))
+        cls.db.conn.commit()
+        cls.db.close()
+
+    def exact_top_k(self, agent_id: str):
+        self.db.cursor.execute(f"""
+            SELECT task_query FROM {EPISODIC_MEMORY_TABLE}
+            WHERE agent_id = %s
+            ORDER BY (embedding <=> %s::vector) + 0
+            LIMIT %s;
+        """, (agent_id, self.query_embedding, self.config.top_k))
+        rows = [row[0] for row in self.db.cursor.fetchall()]
+        self.db.conn.rollback()
+        return rows
+
+    def test_agent_search_returns_its_exact_top_k(self):
+        for agent_id in self.AGENTS[:5]:
+            results = self.retriever.search_agent_episodic_memory(agent_id, "query")
+            self.assertEqual(len(results), self.config.top_k)
+            self.assertEqual([json.loads(r.text)["task_query"] for r in results], self.exact_top_k(agent_id))
+
+    def test_batch_search_returns_every_agents_top_k(self):
+        results = self.retriever.search_agent_episodic_memory_batch([(agent_id, "query") for agent_id in self.AGENTS])
+        self.assertEqual({agent_id: len(r) for agent_id, r in results.items()}, {agent_id: self.config.top_k for agent_id in self.AGENTS})
+        self.assertEqual([json.loads(r.text)["task_query"] for r in results[self.AGENTS[0]]], self.exact_top_k(self.AGENTS[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
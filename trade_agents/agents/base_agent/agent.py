@@ -2,21 +2,28 @@ import uuid
 import json
 import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Callable, Dict, List, Optional, Type, Union
 
 from trade_agents.agents.tool_caller.engine import Engine
 from pydantic import BaseModel, Field
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
-from trade_agents.inference.parallel_inference import ParallelAIUtilities
+from trade_agents.inference.registry import get_ai_utilities
 from trade_agents.inference.message_models import StructuredTool, LLMConfig, LLMPromptContext, LLMOutput
 from trade_agents.agents.base_agent.prompter import PromptManager
-from trade_agents.agents.base_agent.utils import extract_json_from_response
+from trade_agents.inference.validation import repair_json_text
 from trade_agents.agents.base_agent.schemas import *
 
 agent_logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _model_json_schema(schema_class: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema of an output model, generated once and shared by every agent using it."""
+    return schema_class.model_json_schema()
+
+
 class Agent(BaseModel):
     """Base class for all agents in the multi-agent system.
 
@@ -63,7 +70,8 @@ class Agent(BaseModel):
 
     def __init__(self, **data: Any):
         super().__init__(**data)
-        self.ai_utilities = ParallelAIUtilities()
+        # process-wide client, agents share its rate limiters and caches
+        self.ai_utilities = get_ai_utilities()
 
     async def execute(self, task: Optional[str] = None, output_format: Optional[Union[Dict[str, Any], str, Type[BaseModel]]] = None, json_tool: bool = False, return_prompt: bool = False) -> Union[str, Dict[str, Any], LLMPromptContext]:
         """Execute a task and return the result or the prompt context."""
@@ -105,7 +113,7 @@ class Agent(BaseModel):
             try:
                 schema_class = globals().get(output_format)
                 if schema_class and issubclass(schema_class, BaseModel):
-                    return schema_class.model_json_schema()
+                    return _model_json_schema(schema_class)
                 else:
                     raise ValueError(f"Invalid schema: {output_format}")
             except (AttributeError, ValueError) as e:
@@ -114,7 +122,7 @@ class Agent(BaseModel):
         elif isinstance(output_format, dict):
             return output_format
         elif isinstance(output_format, type) and issubclass(output_format, BaseModel):
-            return output_format.model_json_schema()
+            return _model_json_schema(output_format)
         else:
             return None
 
@@ -126,18 +134,23 @@ class Agent(BaseModel):
             task=task if task is not None else [],
             resources=None,
             output_schema=output_format,
-            char_limit=1000
+            char_limit=1000,
+            layout=self.llm_config.prompt_layout
         )
 
         prompt_messages = prompt_manager.generate_prompt_messages()
         system_message = prompt_messages["messages"][0]["content"]
-        if self.system:
-            system_message += f"\n{self.system}"
         user_message = prompt_messages["messages"][1]["content"]
+        if self.system:
+            if self.llm_config.prompt_layout == "cache_friendly":
+                # orchestrators rewrite `system` every round, it goes with the task to keep the prefix stable
+                user_message = f"{self.system}\n{user_message}"
+            else:
+                system_message += f"\n{self.system}"
        
         structured_output = None
         if output_format and isinstance(output_format, dict):
-            structured_output = StructuredTool(json_schema=output_format, strict_schema=False)
+            structured_output = StructuredTool.shared(output_format, strict_schema=False)
 
         return LLMPromptContext(
             id=self.id,
@@ -156,31 +169,24 @@ class Agent(BaseModel):
     )
     async def _run_ai_inference(self, prompt_context: LLMPromptContext) -> Any:
         try:
-            llm_output = await self.ai_utilities.run_parallel_ai_completion([prompt_context])
+            # concurrent execute() calls are dispatched together as one micro-batch
+            llm_output = await self.ai_utilities.run_ai_completion(prompt_context)
             
             if not llm_output:
                 raise ValueError("No output received from AI inference")
             
-            llm_output = llm_output[0]
-            
             if prompt_context.llm_config.response_format == "text":
                 return llm_output.str_content or str(llm_output.raw_result)
             elif prompt_context.llm_config.response_format in ["json_beg", "json_object", "structured_output"]:
                 if llm_output.json_object:
                     return llm_output.json_object.object
                 elif llm_output.str_content:
-                    try:
-                        return json.loads(llm_output.str_content)
-                    except json.JSONDecodeError:
-                        return extract_json_from_response(llm_output.str_content)
+                    return repair_json_text(llm_output.str_content)
             elif prompt_context.llm_config.response_format == "tool" and prompt_context.structured_output:
                 if llm_output.json_object:
                     return llm_output.json_object.object
                 elif llm_output.str_content:
-                    try:
-                        return json.loads(llm_output.str_content)
-                    except json.JSONDecodeError:
-                        return extract_json_from_response(llm_output.str_content)
+                    return repair_json_text(llm_output.str_content)
             elif prompt_context.llm_config.response_format == "tool" and llm_output.tool_calls:
                 print(str(llm_output.raw_result))
                 engine = Engine(tools=prompt_context.tools)
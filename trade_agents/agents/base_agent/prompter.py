@@ -1,9 +1,17 @@
-from typing import Union, List, Dict, Optional, Any, Tuple
+from typing import Union, List, Dict, Literal, Optional, Any, Tuple
 from datetime import datetime
 from pydantic import BaseModel
 import yaml
 import json
 import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _load_yaml_file(file_path: str) -> Dict[str, Any]:
+    """Parse a prompt template once; every agent of a role shares the parsed template."""
+    with open(file_path, 'r') as file:
+        return yaml.safe_load(file)
 
 class SystemPromptSchema(BaseModel):
     """Schema for system prompts."""
@@ -38,7 +46,7 @@ class PromptManager:
 
     def __init__(self, role: str, task: Union[str, List[str]], persona: Optional[str] = None, objectives: Optional[str] = None, 
                  resources: Optional[Any] = None, output_schema: Optional[Union[str, Dict[str, Any]]] = None, 
-                 char_limit: Optional[int] = None):
+                 char_limit: Optional[int] = None, layout: Literal["default", "cache_friendly"] = "default"):
         """
         Initialize the PromptManager.
 
@@ -50,12 +58,16 @@ class PromptManager:
             resources (Optional[Any]): Additional resources for prompt generation.
             output_schema (Optional[Union[str, Dict[str, Any]]]): The schema for the expected output or output format.
             char_limit (Optional[int]): Character limit for the prompts.
+            layout (str): "cache_friendly" moves the output schema into the system prompt and the
+                current date and time to the end of the task prompt, so the system prompt stays
+                byte-identical across rounds and provider prompt caches can reuse it.
         """
         self.role = role
         self.persona = persona
         self.objectives = objectives
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         self.char_limit = char_limit
+        self.layout = layout
         self.prompt_vars = self._create_prompt_vars_dict(task, resources, output_schema)
         self.prompt_path = os.path.join(self.script_dir, '..', 'configs', 'prompts', f"{self.role}_prompt.yaml")
         self.default_prompt_path = os.path.join(self.script_dir, '..', 'configs', 'prompts', "default_prompt.yaml")
@@ -92,12 +104,10 @@ class PromptManager:
             ValueError: If there's an error parsing the YAML file.
         """
         try:
-            with open(file_path, 'r') as file:
-                yaml_content = yaml.safe_load(file)
+            yaml_content = _load_yaml_file(file_path)
         except FileNotFoundError:
             try:
-                with open(self.default_prompt_path, 'r') as file:
-                    yaml_content = yaml.safe_load(file)
+                yaml_content = _load_yaml_file(self.default_prompt_path)
             except FileNotFoundError:
                 raise FileNotFoundError(f"Neither the role-specific prompt file at {file_path} "
                                         f"nor the default prompt file at {self.default_prompt_path} were found.")
@@ -153,13 +163,19 @@ class PromptManager:
         Returns:
             str: Formatted system prompt.
         """
-        system_content = f"Role: {self.system_prompt_schema.Role.format(**self.prompt_vars.dict())}\n"
+        prompt_vars = self.prompt_vars.dict()
+        if self.layout == "cache_friendly":
+            prompt_vars["datetime"] = "given at the end of each task"
+        system_content = f"Role: {self.system_prompt_schema.Role.format(**prompt_vars)}\n"
         
         if self.persona and self.system_prompt_schema.Persona:
-            system_content += f"Persona: {self.system_prompt_schema.Persona.format(**self.prompt_vars.dict())}\n"
+            system_content += f"Persona: {self.system_prompt_schema.Persona.format(**prompt_vars)}\n"
         
         if self.objectives and self.system_prompt_schema.Objectives:
-            system_content += f"Objectives: {self.system_prompt_schema.Objectives.format(**self.prompt_vars.dict())}\n"
+            system_content += f"Objectives: {self.system_prompt_schema.Objectives.format(**prompt_vars)}\n"
+
+        if self.layout == "cache_friendly" and self.prompt_vars.pydantic_schema and self.task_prompt_schema.Output_schema:
+            system_content += f"Output_schema: {self.task_prompt_schema.Output_schema.format(**prompt_vars)}\n"
         
         return system_content
 
@@ -173,9 +189,13 @@ class PromptManager:
         user_content = f"Tasks: {self.task_prompt_schema.Tasks.format(**self.prompt_vars.dict())}\n"
         
         if self.prompt_vars.pydantic_schema and self.task_prompt_schema.Output_schema:
-            user_content += f"Output_schema: {self.task_prompt_schema.Output_schema.format(**self.prompt_vars.dict())}\n"
+            if self.layout != "cache_friendly":
+                user_content += f"Output_schema: {self.task_prompt_schema.Output_schema.format(**self.prompt_vars.dict())}\n"
         else:
             user_content += f"Output_format: {self.prompt_vars.output_format}\n"
+
+        if self.layout == "cache_friendly":
+            user_content += f"Current date and time: {self.prompt_vars.datetime}\n"
         
         if self.task_prompt_schema.Assistant:
             user_content += f"Assistant: {self.task_prompt_schema.Assistant.format(**self.prompt_vars.dict())}"
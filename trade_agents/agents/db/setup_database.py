@@ -248,8 +248,32 @@ def create_tables(db_params):
     )
     """)
 
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS inference_phase_metrics (
+        id SERIAL PRIMARY KEY,
+        round INTEGER,
+        environment_name TEXT,
+        phase TEXT,
+        client TEXT,
+        model TEXT,
+        requests INTEGER,
+        errors INTEGER,
+        retries INTEGER,
+        wall_time FLOAT,
+        share_of_round_time FLOAT,
+        latency_p50 FLOAT,
+        latency_p95 FLOAT,
+        input_tokens INTEGER,
+        output_tokens INTEGER,
+        cache_read_input_tokens INTEGER,
+        cache_creation_input_tokens INTEGER,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
     # Create indexes
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_requests_prompt_context_id ON requests(prompt_context_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inference_phase_metrics_round ON inference_phase_metrics(round)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_memory_embeddings_embedding ON memory_embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_auction_id ON trades(id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_agent_id ON orders(agent_id)")
@@ -2,7 +2,7 @@ import json
 import asyncio
 
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional, Type, Union, List
+from typing import Dict, Any, Optional, Tuple, Type, Union, List
 
 from pydantic import Field
 
@@ -16,7 +16,7 @@ from trade_agents.environments.environment import MultiAgentEnvironment, LocalOb
 from trade_agents.inference.message_models import LLMConfig, LLMPromptContext
 from trade_agents.memory.config import MarketMemoryConfig
 from trade_agents.memory.knowledge_base_agent import KnowledgeBaseAgent
-from trade_agents.memory.memory import MemoryObject, ShortTermMemory, LongTermMemory
+from trade_agents.memory.memory import EpisodicMemoryObject, MemoryObject, ShortTermMemory, LongTermMemory
 
 class MarketAgent(LLMAgent):
     short_term_memory: ShortTermMemory = None
@@ -63,17 +63,32 @@ class MarketAgent(LLMAgent):
         )
         return agent
 
+    def perception_query(self, environment_name: str) -> str:
+        """Query of the episodic memory search when perceiving an environment."""
+        environment_info = self.environments[environment_name].get_global_state()
+        task_str = f"Task: {self.task}" if self.task else ""
+        env_state_str = f"Environment state: {str(environment_info)}" if environment_info else ""
+        return (task_str + "\n" + env_state_str).strip()
+
     async def perceive(
         self,
         environment_name: str,
         return_prompt: bool = False,
-        structured_tool: bool = False
+        structured_tool: bool = False,
+        memories: Optional[Tuple[List[MemoryObject], List[EpisodicMemoryObject]]] = None
     ) -> Union[str, LLMPromptContext]:
+        """
+        Perceive an environment. `memories` are the recent and episodic memories of the agent
+        when they were already retrieved for many agents at once; they are queried otherwise.
+        """
         if environment_name not in self.environments:
             raise ValueError(f"Environment {environment_name} not found")
 
         environment_info = self.environments[environment_name].get_global_state()
-        stm_cognitive = await self.short_term_memory.retrieve_recent_memories(limit=5)
+        if memories is not None:
+            stm_cognitive, ltm_episodes = memories
+        else:
+            stm_cognitive = await self.short_term_memory.retrieve_recent_memories(limit=5)
         short_term_memories = []
         for mem in stm_cognitive:
             short_term_memories.append({
@@ -85,15 +100,13 @@ class MarketAgent(LLMAgent):
         memory_strings = [f"Memory {i+1}:\n{mem}" for i, mem in enumerate(short_term_memories)]
         print("\033[94m" + "\n\n".join(memory_strings) + "\033[0m")
 
-        task_str = f"Task: {self.task}" if self.task else ""
-        env_state_str = f"Environment state: {str(environment_info)}" if environment_info else ""
-        query_str = (task_str + "\n" + env_state_str).strip()
-
-        ltm_episodes = await self.long_term_memory.retrieve_episodic_memories(
-             agent_id=self.id,
-             query=query_str,
-             top_k=2
-        )
+        query_str = self.perception_query(environment_name)
+        if memories is None:
+            ltm_episodes = await self.long_term_memory.retrieve_episodic_memories(
+                agent_id=self.id,
+                query=query_str,
+                top_k=2
+            )
         retrieved_documents = []
         if self.knowledge_agent:
             kb_table_prefix = self.knowledge_agent.market_kb.table_prefix
@@ -1,9 +1,13 @@
-from typing import Callable, List, Dict, Any
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, List, Dict, Any
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 
 from trade_agents.agents.tool_caller.utils import function_to_json
-from trade_agents.inference.message_models import GeneratedJsonObject
+
+if TYPE_CHECKING:
+    from trade_agents.inference.message_models import GeneratedJsonObject
 
 class Engine:
     """
@@ -0,0 +1,239 @@
+"""
+Provider batch endpoints (OpenAI Batch API, Anthropic Message Batches) for offline runs.
+
+Batches trade latency (results within the provider's completion window, typically
+minutes to hours) for lower cost and much higher throughput limits. The entry point
+mirrors `process_api_requests_from_file`: it reads the same `[metadata, request]`
+JSONL requests file and writes the same `[metadata, request, response]` results
+file, so the results are parsed into LLMOutputs exactly like online results.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+import aiohttp
+from pydantic import BaseModel, Field
+
+TERMINAL_OPENAI_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchApiFromFileConfig(BaseModel):
+    requests_filepath: str
+    save_filepath: str
+    api_key: str
+    provider: Literal["openai", "anthropic"] = Field("openai", description="Which batch API to submit to")
+    base_url: str = Field("https://api.openai.com/v1", description="Base url of the provider API")
+    endpoint: str = Field("/v1/chat/completions", description="Endpoint the batched requests target (OpenAI only)")
+    completion_window: str = Field("24h", description="Completion window requested from OpenAI")
+    poll_interval: float = Field(30.0, description="Seconds between two batch status polls")
+    max_wait: Optional[float] = Field(None, description="Seconds after which a batch still running is cancelled, None waits for the provider's window")
+    logging_level: int = Field(20, description="The logging level to use for the batch")
+
+
+class BatchAPIClient(ABC):
+    """Submits a list of requests as one provider batch, polls it and collects the responses by custom_id."""
+
+    def __init__(self, session: aiohttp.ClientSession, cfg: BatchApiFromFileConfig):
+        self.session = session
+        self.cfg = cfg
+        self.base_url = cfg.base_url.rstrip("/")
+
+    @property
+    @abstractmethod
+    def headers(self) -> Dict[str, str]:
+        """Authentication and version headers of the provider."""
+
+    @abstractmethod
+    async def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        """Create the batch and return its id."""
+
+    @abstractmethod
+    async def poll(self, batch_id: str) -> Tuple[bool, Dict[str, Any]]:
+        """Return whether the batch has ended and its latest status payload."""
+
+    @abstractmethod
+    async def cancel(self, batch_id: str):
+        """Cancel a batch that is still running."""
+
+    @abstractmethod
+    async def fetch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Responses of an ended batch by custom_id."""
+
+    async def _get_json(self, url: str) -> Dict[str, Any]:
+        async with self.session.get(url, headers=self.headers) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _get_jsonl(self, url: str) -> List[Dict[str, Any]]:
+        async with self.session.get(url, headers=self.headers) as response:
+            response.raise_for_status()
+            text = await response.text()
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class OpenAIBatchClient(BatchAPIClient):
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.cfg.api_key}"}
+
+    async def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": self.cfg.endpoint, "body": request})
+            for custom_id, request in requests.items()
+        ]
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field("file", ("\n".join(lines) + "\n").encode("utf-8"), filename="batch_requests.jsonl", content_type="application/jsonl")
+        async with self.session.post(f"{self.base_url}/files", headers=self.headers, data=form) as response:
+            response.raise_for_status()
+            input_file = await response.json()
+        payload = {
+            "input_file_id": input_file["id"],
+            "endpoint": self.cfg.endpoint,
+            "completion_window": self.cfg.completion_window,
+        }
+        async with self.session.post(f"{self.base_url}/batches", headers=self.headers, json=payload) as response:
+            response.raise_for_status()
+            batch = await response.json()
+        return batch["id"]
+
+    async def poll(self, batch_id: str) -> Tuple[bool, Dict[str, Any]]:
+        batch = await self._get_json(f"{self.base_url}/batches/{batch_id}")
+        return batch.get("status") in TERMINAL_OPENAI_STATUSES, batch
+
+    async def cancel(self, batch_id: str):
+        async with self.session.post(f"{self.base_url}/batches/{batch_id}/cancel", headers=self.headers) as response:
+            response.raise_for_status()
+
+    async def fetch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        # expired and cancelled batches may still have a partial output file
+        for file_key in ("error_file_id", "output_file_id"):
+            if not batch.get(file_key):
+                continue
+            for line in await self._get_jsonl(f"{self.base_url}/files/{batch[file_key]}/content"):
+                response = line.get("response") or {}
+                if line.get("error"):
+                    results[line["custom_id"]] = {"error": line["error"]}
+                elif response.get("status_code", 200) >= 400:
+                    body = response.get("body") or {}
+                    results[line["custom_id"]] = body if "error" in body else {"error": body}
+                else:
+                    results[line["custom_id"]] = response.get("body", {})
+        return results
+
+
+class AnthropicBatchClient(BatchAPIClient):
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.cfg.api_key,
+            "anthropic-version": "2023-06-01",
+            "anthropic-beta": "message-batches-2024-09-24,prompt-caching-2024-07-31",
+            "content-type": "application/json",
+        }
+
+    async def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        payload = {"requests": [{"custom_id": custom_id, "params": request} for custom_id, request in requests.items()]}
+        async with self.session.post(f"{self.base_url}/messages/batches", headers=self.headers, json=payload) as response:
+            response.raise_for_status()
+            batch = await response.json()
+        return batch["id"]
+
+    async def poll(self, batch_id: str) -> Tuple[bool, Dict[str, Any]]:
+        batch = await self._get_json(f"{self.base_url}/messages/batches/{batch_id}")
+        return batch.get("processing_status") == "ended", batch
+
+    async def cancel(self, batch_id: str):
+        async with self.session.post(f"{self.base_url}/messages/batches/{batch_id}/cancel", headers=self.headers) as response:
+            response.raise_for_status()
+
+    async def fetch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        if not batch.get("results_url"):
+            return results
+        for line in await self._get_jsonl(batch["results_url"]):
+            result = line.get("result") or {}
+            if result.get("type") == "succeeded":
+                results[line["custom_id"]] = result["message"]
+            elif result.get("type") == "errored":
+                results[line["custom_id"]] = {"error": result.get("error")}
+            else:
+                results[line["custom_id"]] = {"error": f"request {result.get('type', 'failed')}"}
+        return results
+
+
+def create_batch_client(session: aiohttp.ClientSession, cfg: BatchApiFromFileConfig) -> BatchAPIClient:
+    if cfg.provider == "anthropic":
+        return AnthropicBatchClient(session, cfg)
+    return OpenAIBatchClient(session, cfg)
+
+
+def assign_custom_ids(entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Key each [metadata, request] entry by a batch custom_id derived from its prompt_context_id.
+
+    Custom ids must be unique within a batch and Anthropic only accepts [a-zA-Z0-9_-]{1,64},
+    so ids are sanitized and suffixed when a prompt context appears more than once.
+    """
+    by_custom_id = {}
+    for metadata, request in entries:
+        base_id = re.sub(r"[^a-zA-Z0-9_-]", "_", str(metadata["prompt_context_id"]))[:56] or "request"
+        custom_id = base_id
+        n = 1
+        while custom_id in by_custom_id:
+            custom_id = f"{base_id}-{n}"
+            n += 1
+        by_custom_id[custom_id] = (metadata, request)
+    return by_custom_id
+
+
+async def process_batch_requests_from_file(batch_cfg: BatchApiFromFileConfig):
+    """
+    Runs a requests file through the provider's batch API and writes the results file.
+
+    Every request of the file gets exactly one result line, mapped back through its
+    custom_id to the original `prompt_context_id` metadata; requests the batch did not
+    answer (failed, expired or cancelled batch) are saved with an error payload.
+    """
+    logging.basicConfig(level=batch_cfg.logging_level)
+    with open(batch_cfg.requests_filepath) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        return
+    by_custom_id = assign_custom_ids(entries)
+
+    start = time.time()
+    async with aiohttp.ClientSession() as session:
+        client = create_batch_client(session, batch_cfg)
+        batch_id = await client.submit({custom_id: request for custom_id, (_, request) in by_custom_id.items()})
+        logging.info(f"Submitted {batch_cfg.provider} batch {batch_id} with {len(by_custom_id)} requests")
+
+        cancelled = False
+        while True:
+            ended, batch = await client.poll(batch_id)
+            if ended:
+                break
+            if not cancelled and batch_cfg.max_wait is not None and time.time() - start >= batch_cfg.max_wait:
+                # keep polling, cancelled batches still return the results completed so far
+                logging.warning(f"Batch {batch_id} still running after {batch_cfg.max_wait}s, cancelling it")
+                await client.cancel(batch_id)
+                cancelled = True
+            await asyncio.sleep(batch_cfg.poll_interval)
+
+        results = await client.fetch_results(batch)
+        status = batch.get("status") or batch.get("processing_status")
+        logging.info(f"Batch {batch_id} ended with status {status}, {len(results)} / {len(by_custom_id)} results")
+
+    end_time = time.time()
+    with open(batch_cfg.save_filepath, "a") as f:
+        for custom_id, (metadata, request) in by_custom_id.items():
+            response = results.get(custom_id, {"error": f"no result in batch {batch_id} (status {status})"})
+            metadata = {**metadata, "batch_id": batch_id, "end_time": end_time}
+            metadata["total_time"] = end_time - metadata["start_time"]
+            f.write(json.dumps([metadata, request, response]) + "\n")
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from trade_agents.inference.message_models import LLMPromptContext, LLMOutput
+
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication of identical completion requests.
+
+    Prompts whose canonicalized provider request is identical share one upstream
+    call, both inside a batch and across batches that overlap in time. The shared
+    result is fanned out so that every prompt still receives its own LLMOutput
+    carrying its own source_id.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.num_requests = 0
+        self.num_coalesced = 0
+
+    @staticmethod
+    def canonical_key(client: str, request: Dict[str, Any]) -> str:
+        """Hash a provider request so that semantically identical requests collide."""
+        payload = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{client}:{payload}".encode("utf-8")).hexdigest()
+
+    async def run(
+        self,
+        prompts: List[LLMPromptContext],
+        key_fn: Callable[[LLMPromptContext], Optional[str]],
+        dispatch: Callable[[List[LLMPromptContext]], Awaitable[List[LLMOutput]]],
+    ) -> List[LLMOutput]:
+        """
+        Dispatch one leader prompt per distinct request and fan the results out.
+
+        Args:
+            prompts: Prompt contexts of the batch.
+            key_fn: Returns the canonical request key of a prompt, or None to opt it out.
+            dispatch: Coroutine that sends a list of prompts upstream.
+
+        Returns:
+            One LLMOutput per prompt that received a result, with the prompt's own source_id.
+        """
+        loop = asyncio.get_running_loop()
+        prompt_keys: List[Optional[str]] = []
+        leaders: List[LLMPromptContext] = []
+        owned: Dict[str, asyncio.Future] = {}
+        shared: Dict[str, asyncio.Future] = {}
+        leader_keys: Dict[str, str] = {}
+
+        for prompt in prompts:
+            key = key_fn(prompt)
+            prompt_keys.append(key)
+            self.num_requests += 1
+            if key is None:
+                leaders.append(prompt)
+            elif key in shared:
+                self.num_coalesced += 1
+            elif key in self._in_flight:
+                # Another batch is already waiting on this exact request.
+                shared[key] = self._in_flight[key]
+                self.num_coalesced += 1
+            else:
+                future = loop.create_future()
+                self._in_flight[key] = future
+                owned[key] = future
+                shared[key] = future
+                leader_keys[prompt.id] = key
+                leaders.append(prompt)
+
+        passthrough: List[LLMOutput] = []
+        try:
+            results = await dispatch(leaders) if leaders else []
+            results_by_key: Dict[str, LLMOutput] = {}
+            for output in results:
+                key = leader_keys.get(output.source_id)
+                if key is None:
+                    passthrough.append(output)
+                else:
+                    results_by_key[key] = output
+            for key, future in owned.items():
+                future.set_result(results_by_key.get(key))
+        except BaseException as e:
+            for future in owned.values():
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Mark as retrieved, the exception is re-raised to our own caller below.
+                    future.exception()
+            raise
+        finally:
+            for key in owned:
+                self._in_flight.pop(key, None)
+
+        fanned_out: List[LLMOutput] = []
+        for prompt, key in zip(prompts, prompt_keys):
+            if key is None:
+                continue
+            output = await asyncio.shield(shared[key])
+            if output is None:
+                continue
+            if output.source_id != prompt.id:
+                output = output.model_copy(update={"source_id": prompt.id})
+            fanned_out.append(output)
+
+        return fanned_out + passthrough
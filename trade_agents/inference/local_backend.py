@@ -0,0 +1,301 @@
+"""
+In-process inference backends for running simulations without network access.
+
+A backend receives the same provider request dicts that would be written to the
+requests file and returns the provider's wire-format response (an OpenAI
+`chat.completion` or an Anthropic `message`), so LLMOutput parsing, tool calls,
+JSON content and usage accounting behave exactly as with a remote provider.
+
+`ScriptedBackend` is deterministic: structured outputs are synthesized from the
+requested JSON schema with a generator seeded by the request, optionally replaced
+by a user script. `LocalModelBackend` runs a small GGUF model in process through
+llama-cpp-python when it is installed. Both sleep for a latency drawn from a
+configurable distribution so orchestrator throughput can be benchmarked offline.
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field
+
+
+class LatencyModel(BaseModel):
+    distribution: Literal["constant", "uniform", "normal", "lognormal"] = Field("lognormal", description="Distribution of the simulated request latency")
+    mean: float = Field(0.5, description="Mean latency in seconds")
+    stddev: float = Field(0.2, description="Standard deviation in seconds, uniform samples mean ± stddev")
+    min_latency: float = Field(0.0, description="Lower bound of a sample in seconds")
+    max_latency: Optional[float] = Field(None, description="Upper bound of a sample in seconds")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            latency = self.mean
+        elif self.distribution == "uniform":
+            latency = rng.uniform(self.mean - self.stddev, self.mean + self.stddev)
+        elif self.distribution == "normal":
+            latency = rng.gauss(self.mean, self.stddev)
+        elif self.mean > 0:
+            # parameterized by the mean and stddev of the latency itself, not of its log
+            sigma2 = math.log(1 + (self.stddev / self.mean) ** 2)
+            latency = rng.lognormvariate(math.log(self.mean) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            latency = 0.0
+        latency = max(self.min_latency, latency)
+        if self.max_latency is not None:
+            latency = min(self.max_latency, latency)
+        return latency
+
+
+def structured_output_spec(request: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Return the forced tool name (None for a JSON response format) and the JSON schema a request asks for."""
+    tool_choice = request.get("tool_choice")
+    tool_name = None
+    if isinstance(tool_choice, dict):
+        tool_name = tool_choice.get("function", {}).get("name") or tool_choice.get("name")
+    if tool_name:
+        for tool in request.get("tools") or []:
+            if "function" in tool and tool["function"].get("name") == tool_name:
+                return tool_name, tool["function"].get("parameters") or {}
+            if tool.get("name") == tool_name:
+                return tool_name, tool.get("input_schema") or {}
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return None, response_format.get("json_schema", {}).get("schema") or {}
+    if response_format.get("type") == "json_object":
+        return None, {}
+    messages = request.get("messages") or []
+    if messages and messages[-1].get("role") == "assistant" and "json" in json.dumps(messages[-1].get("content")).lower():
+        # json_beg prefill, the assistant turn is continued with a JSON object
+        return None, {}
+    return None, None
+
+
+def anthropic_to_openai_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an Anthropic messages request into the equivalent chat completions request."""
+
+    def text_of(content: Union[str, List[Any], None]) -> str:
+        if isinstance(content, list):
+            return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+        return content or ""
+
+    messages = []
+    if request.get("system"):
+        messages.append({"role": "system", "content": text_of(request["system"])})
+    messages += [{"role": m["role"], "content": text_of(m.get("content"))} for m in request.get("messages") or []]
+    converted = {k: request[k] for k in ("model", "max_tokens", "temperature") if k in request}
+    converted["messages"] = messages
+    if request.get("tools"):
+        converted["tools"] = [
+            {"type": "function", "function": {"name": t["name"], "description": t.get("description", ""), "parameters": t.get("input_schema", {})}}
+            for t in request["tools"]
+        ]
+        tool_choice = request.get("tool_choice") or {}
+        if tool_choice.get("type") == "tool":
+            converted["tool_choice"] = {"type": "function", "function": {"name": tool_choice["name"]}}
+    return converted
+
+
+def openai_to_anthropic_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a chat completion into the Anthropic message a messages request would have returned."""
+    if "error" in response:
+        return response
+    message = response["choices"][0]["message"]
+    content = []
+    if message.get("content"):
+        content.append({"type": "text", "text": message["content"]})
+    for tool_call in message.get("tool_calls") or []:
+        content.append({
+            "type": "tool_use",
+            "id": tool_call["id"].replace("call_", "toolu_", 1),
+            "name": tool_call["function"]["name"],
+            "input": json.loads(tool_call["function"]["arguments"] or "{}"),
+        })
+    usage = response.get("usage") or {}
+    return {
+        "id": f"msg_{response['id']}",
+        "type": "message",
+        "role": "assistant",
+        "model": response.get("model", ""),
+        "content": content,
+        "stop_reason": "tool_use" if message.get("tool_calls") else "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)},
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (4 characters per token) used for the usage of offline completions."""
+    return max(1, len(text) // 4)
+
+
+class LocalBackend(ABC):
+    """
+    Base class of in-process backends.
+
+    Subclasses implement `generate`, which maps an OpenAI-format request to an
+    OpenAI-format response; `complete` adds latency, failure injection and the
+    conversion from and to the Anthropic wire format. At most `max_concurrency`
+    requests are completed at once, across all the batches using the backend.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None, seed: int = 0, error_rate: float = 0.0, max_concurrency: int = 256):
+        self.latency = latency if latency is not None else LatencyModel(distribution="constant", mean=0.0)
+        self.seed = seed
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self._rng = random.Random(seed)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.num_requests = 0
+
+    @abstractmethod
+    async def generate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """OpenAI-format response to an OpenAI-format request."""
+
+    def _concurrency_limit(self) -> asyncio.Semaphore:
+        """Semaphore of the running event loop, shared by every batch using this backend."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore, self._semaphore_loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._semaphore
+
+    async def complete(self, request: Dict[str, Any], client: str) -> Dict[str, Any]:
+        async with self._concurrency_limit():
+            self.num_requests += 1
+            await asyncio.sleep(self.latency.sample(self._rng))
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return {"error": {"type": "server_error", "message": "injected local backend failure"}}
+            if client == "anthropic":
+                return openai_to_anthropic_response(await self.generate(anthropic_to_openai_request(request)))
+            return await self.generate(request)
+
+
+class ScriptedBackend(LocalBackend):
+    """
+    Deterministic mock model.
+
+    Structured outputs are synthesized from the requested schema, free text echoes a
+    short canned answer. A `script` callable receiving the request can return a dict
+    (structured output) or a string (content) to replace the synthesized answer, or
+    None to keep it.
+    """
+
+    def __init__(self, script: Optional[Callable[[Dict[str, Any]], Any]] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.script = script
+
+    def _request_rng(self, request: Dict[str, Any]) -> random.Random:
+        payload = json.dumps(request.get("messages"), sort_keys=True, default=str)
+        return random.Random(zlib.crc32(payload.encode("utf-8")) ^ self.seed)
+
+    async def generate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tool_name, schema = structured_output_spec(request)
+        scripted = self.script(request) if self.script else None
+        rng = self._request_rng(request)
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if schema is not None:
+            obj = scripted if isinstance(scripted, dict) else synthesize_from_schema(schema, rng)
+            arguments = json.dumps(obj)
+            if tool_name:
+                message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": {"name": tool_name, "arguments": arguments}}]
+            else:
+                message["content"] = arguments
+            completion_text = arguments
+        else:
+            message["content"] = scripted if isinstance(scripted, str) else f"Scripted response {rng.randint(0, 9999)}."
+            completion_text = message["content"]
+
+        prompt_tokens = estimate_tokens(json.dumps(request.get("messages"), default=str))
+        completion_tokens = min(estimate_tokens(completion_text), request.get("max_tokens") or 1 << 30)
+        return {
+            "id": f"chatcmpl-local-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model") or "scripted",
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_name else "stop", "logprobs": None}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+class LocalModelBackend(LocalBackend):
+    """Runs a small GGUF chat model in process with llama-cpp-python (optional dependency)."""
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, max_concurrency: int = 1, **kwargs: Any):
+        llama_kwargs = {k: kwargs.pop(k) for k in list(kwargs) if k not in ("latency", "seed", "error_rate")}
+        super().__init__(max_concurrency=max_concurrency, **kwargs)
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise ImportError("LocalModelBackend requires llama-cpp-python, install it with `pip install llama-cpp-python`") from e
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, seed=self.seed, verbose=False, **llama_kwargs)
+
+    async def generate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = {k: request[k] for k in ("messages", "max_tokens", "temperature", "tools", "tool_choice") if k in request}
+        tool_name, schema = structured_output_spec(request)
+        if schema is not None and not tool_name:
+            kwargs["response_format"] = {"type": "json_object", "schema": schema} if schema else {"type": "json_object"}
+        return await asyncio.to_thread(self.llm.create_chat_completion, **kwargs)
+
+
+def synthesize_from_schema(schema: Dict[str, Any], rng: random.Random, root: Optional[Dict[str, Any]] = None,
+                           name: str = "value", depth: int = 0) -> Any:
+    """Generate a value valid for a (pydantic generated) JSON schema, honouring enums, bounds and $refs."""
+    root = root if root is not None else schema
+    if "$ref" in schema:
+        ref = schema["$ref"].split("/")[-1]
+        return synthesize_from_schema(root.get("$defs", root.get("definitions", {})).get(ref, {}), rng, root, name, depth)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return synthesize_from_schema(options[0], rng, root, name, depth)
+    if "default" in schema and rng.random() < 0.5:
+        return schema["default"]
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if schema_type is None:
+        schema_type = "object" if "properties" in schema or not schema else "string"
+
+    if schema_type == "object":
+        if depth > 5:
+            return {}
+        properties = schema.get("properties")
+        if properties is None:
+            return {"response": f"Scripted response {rng.randint(0, 9999)}."}
+        return {key: synthesize_from_schema(sub, rng, root, key, depth + 1) for key, sub in properties.items()}
+    if schema_type == "array":
+        min_items = schema.get("minItems", 1)
+        max_items = max(min_items, schema.get("maxItems", min_items + 2))
+        count = rng.randint(min_items, max_items) if depth <= 5 else min_items
+        return [synthesize_from_schema(schema.get("items", {}), rng, root, name, depth + 1) for _ in range(count)]
+    if schema_type in ("number", "integer"):
+        step = 1 if schema_type == "integer" else 0.01
+        low = schema["minimum"] if "minimum" in schema else schema.get("exclusiveMinimum", -step) + step
+        high = schema["maximum"] if "maximum" in schema else schema.get("exclusiveMaximum", low + 100 + step) - step
+        high = max(low, high)
+        if schema_type == "integer":
+            return rng.randint(math.ceil(low), max(math.ceil(low), math.floor(high)))
+        return min(high, max(low, round(rng.uniform(low, high), 2)))
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    if schema_type == "null":
+        return None
+    return f"{name.replace('_', ' ')} {rng.randint(0, 999)}"
+
+
+def create_local_backend(backend: Literal["scripted", "local_model"] = "scripted", **kwargs: Any) -> LocalBackend:
+    if backend == "local_model":
+        return LocalModelBackend(**kwargs)
+    kwargs.pop("model_path", None)
+    return ScriptedBackend(**kwargs)
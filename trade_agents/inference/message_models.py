@@ -1,5 +1,6 @@
 from trade_agents.agents.tool_caller.utils import function_to_json
-from pydantic import BaseModel, Field, computed_field, ValidationError, model_validator
+from pydantic import BaseModel, Field, PrivateAttr, computed_field, ValidationError, model_validator
+from dataclasses import dataclass
 from typing import Callable, Literal, Optional, Union, Dict, Any, List, Iterable, Tuple
 import json
 import time
@@ -63,39 +64,77 @@ class StructuredTool(BaseModel):
     instruction_string: str = Field(default = "Please follow this JSON schema for your response:")
     strict_schema: bool = True
 
+    _parts: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self._parts.clear()
+
+    @classmethod
+    def shared(cls, json_schema: Optional[Dict[str, Any]], **kwargs: Any) -> "StructuredTool":
+        """
+        Return the StructuredTool of a schema, one instance per distinct schema and options.
+
+        Agents with the same output schema then reuse the same tool, response format and
+        schema dicts by reference instead of rebuilding them for every request.
+        """
+        key = json.dumps([json_schema, kwargs], sort_keys=True, default=str)
+        tool = _SHARED_STRUCTURED_TOOLS.get(key)
+        if tool is None:
+            if len(_SHARED_STRUCTURED_TOOLS) >= MAX_SHARED_STRUCTURED_TOOLS:
+                _SHARED_STRUCTURED_TOOLS.clear()
+            tool = cls(json_schema=json_schema, **kwargs)
+            _SHARED_STRUCTURED_TOOLS[key] = tool
+        return tool
+
     @computed_field
     @property
     def schema_instruction(self) -> str:
-        return f"{self.instruction_string}: {self.json_schema}"
+        if "schema_instruction" not in self._parts:
+            self._parts["schema_instruction"] = f"{self.instruction_string}: {self.json_schema}"
+        return self._parts["schema_instruction"]
 
-    def get_openai_tool(self) -> Optional[ChatCompletionToolParam]:
-        if self.json_schema:
-            return ChatCompletionToolParam(
-                type="function",
-                function=FunctionDefinition(
-                    name=self.schema_name,
-                    description=self.schema_description,
-                    parameters=self.json_schema
-                )
-            )
-        return None
+    def model_copy(self, *, update: Optional[Dict[str, Any]] = None, deep: bool = False) -> Self:
+        copy = super().model_copy(update=update, deep=deep)
+        copy._parts = {}
+        return copy
 
-    def get_anthropic_tool(self) -> Optional[PromptCachingBetaToolParam]:
-        if self.json_schema:
-            return PromptCachingBetaToolParam(
+    def _part(self, kind: str, build: Callable[[], Any]) -> Any:
+        """Build a provider definition of the schema once; callers must treat it as read-only."""
+        if kind not in self._parts:
+            self._parts[kind] = build() if self.json_schema else None
+        return self._parts[kind]
+
+    def get_openai_tool(self) -> Optional[ChatCompletionToolParam]:
+        return self._part("openai_tool", lambda: ChatCompletionToolParam(
+            type="function",
+            function=FunctionDefinition(
                 name=self.schema_name,
                 description=self.schema_description,
-                input_schema=self.json_schema,
-                cache_control=PromptCachingBetaCacheControlEphemeralParam(type='ephemeral')
+                parameters=self.json_schema
             )
-        return None
+        ))
+
+    def get_anthropic_tool(self) -> Optional[PromptCachingBetaToolParam]:
+        return self._part("anthropic_tool", lambda: PromptCachingBetaToolParam(
+            name=self.schema_name,
+            description=self.schema_description,
+            input_schema=self.json_schema,
+            cache_control=PromptCachingBetaCacheControlEphemeralParam(type='ephemeral')
+        ))
+
     def get_openai_json_schema_response(self) -> Optional[ResponseFormatJSONSchema]:
+        return self._part("openai_json_schema", lambda: ResponseFormatJSONSchema(
+            type="json_schema",
+            json_schema=JSONSchema(name=self.schema_name, description=self.schema_description, schema=self.json_schema, strict=self.strict_schema)
+        ))
+
+
+MAX_SHARED_STRUCTURED_TOOLS = 256
+_SHARED_STRUCTURED_TOOLS: Dict[str, StructuredTool] = {}
+
 
-        if self.json_schema:
-            schema = JSONSchema(name=self.schema_name,description=self.schema_description,schema=self.json_schema,strict=self.strict_schema)
-            return ResponseFormatJSONSchema(type="json_schema", json_schema=schema)
-        return None
-    
 class LLMConfig(BaseModel):
     client: Literal["openai", "azure_openai", "anthropic", "vllm", "litellm"]
     model: Optional[str] = None
@@ -103,6 +142,8 @@ class LLMConfig(BaseModel):
     temperature: float = 0
     response_format: Literal["json_beg", "text","json_object","structured_output","tool"] = "text"
     use_cache: bool = True
+    fallback_pool: Optional[List["LLMConfig"]] = Field(default=None, description="Alternative endpoints the router may send this agent's requests to")
+    prompt_layout: Literal["default", "cache_friendly"] = Field(default="default", description="cache_friendly puts the stable persona and schema first and per-round content last, so provider prompt caches can hit")
 
     @model_validator(mode="after")
     def validate_response_format(self) -> Self:
@@ -127,6 +168,54 @@ class LLMPromptContext(BaseModel):
     tools: Optional[List[Callable]] = None
     llm_config: LLMConfig
     use_history: bool = Field(default=True, description="Whether to use the history")
+
+    # memoized message lists and provider requests, keyed by the state they were built from
+    _messages_cache: Dict[str, Tuple[Tuple, Any]] = PrivateAttr(default_factory=dict)
+    _compiled_requests: Dict[str, Tuple[Tuple, Dict[str, Any]]] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self.invalidate_compiled()
+
+    def model_copy(self, *, update: Optional[Dict[str, Any]] = None, deep: bool = False) -> Self:
+        copy = super().model_copy(update=update, deep=deep)
+        copy._messages_cache = {}
+        copy._compiled_requests = {}
+        return copy
+
+    def invalidate_compiled(self):
+        """Drop the memoized messages and requests, needed after mutating a field in place."""
+        self._messages_cache.clear()
+        self._compiled_requests.clear()
+
+    def _state_key(self) -> Tuple:
+        # llm_config is shared with the agent and mutated in place, so its values are part of the key
+        config = self.llm_config
+        return (config.client, config.model, config.max_tokens, config.temperature, config.response_format,
+                config.use_cache, config.prompt_layout, len(self.history) if self.history else 0)
+
+    def _memoized(self, kind: str, build: Callable[[], Any]) -> Any:
+        key = self._state_key()
+        cached = self._messages_cache.get(kind)
+        if cached is None or cached[0] != key:
+            cached = (key, build())
+            self._messages_cache[kind] = cached
+        return cached[1]
+
+    def compile_request(self, client: str, build: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the provider request of this prompt, building and validating it only once.
+
+        The request is rebuilt after the llm_config, the history or any other field changes.
+        It is shared by every caller (coalescing key, requests file) and must not be mutated.
+        """
+        key = self._state_key()
+        cached = self._compiled_requests.get(client)
+        if cached is None or cached[0] != key:
+            cached = (key, build())
+            self._compiled_requests[client] = cached
+        return cached[1]
     
     @computed_field
     @property
@@ -171,6 +260,9 @@ class LLMPromptContext(BaseModel):
     @computed_field
     @property
     def messages(self)-> List[Dict[str, Any]]:
+        return self._memoized("messages", self._build_messages)
+
+    def _build_messages(self) -> List[Dict[str, Any]]:
         messages = [self.system_message] if self.system_message is not None else []
         if  self.use_history and self.history:
             messages+=self.history
@@ -185,17 +277,19 @@ class LLMPromptContext(BaseModel):
     @computed_field
     @property
     def oai_messages(self)-> List[ChatCompletionMessageParam]:
-        return msg_dict_to_oai(self.messages)
+        return self._memoized("oai_messages", lambda: msg_dict_to_oai(self.messages))
     
     @computed_field
     @property
     def anthropic_messages(self) -> Tuple[List[PromptCachingBetaTextBlockParam],List[MessageParam]]:
-        return msg_dict_to_anthropic(self.messages, use_cache=self.llm_config.use_cache)
+        # with the cache friendly layout the volatile new message is never a cache breakpoint
+        cache_tail = self.llm_config.prompt_layout != "cache_friendly"
+        return self._memoized("anthropic_messages", lambda: msg_dict_to_anthropic(self.messages, use_cache=self.llm_config.use_cache, cache_tail=cache_tail))
     
     @computed_field
     @property
     def vllm_messages(self) -> List[ChatCompletionMessageParam]:
-        return msg_dict_to_oai(self.messages)
+        return self._memoized("oai_messages", lambda: msg_dict_to_oai(self.messages))
         
     def update_llm_config(self,llm_config:LLMConfig) -> 'LLMPromptContext':
         
@@ -212,6 +306,7 @@ class LLMPromptContext(BaseModel):
             self.history = []
         self.history.append({"role": "user", "content": self.new_message})
         self.history.append({"role": "assistant", "content": llm_output.str_content or json.dumps(llm_output.json_object.object) if llm_output.json_object else "{}"})
+        self.invalidate_compiled()
     
     def get_tool(self) -> Union[ChatCompletionToolParam, PromptCachingBetaToolParam, None]:
         if not self.structured_output:
@@ -236,51 +331,125 @@ class Usage(BaseModel):
     cache_creation_input_tokens: Optional[int] = None
     cache_read_input_tokens: Optional[int] = None
 
+    def token_counts(self, provider: Optional[str] = None) -> Dict[str, int]:
+        """Input (cached tokens included), output and cache read / creation tokens."""
+        cache_read = self.cache_read_input_tokens or 0
+        cache_creation = self.cache_creation_input_tokens or 0
+        input_tokens = self.prompt_tokens
+        if provider == "anthropic":
+            # Anthropic reports cached tokens separately from input_tokens, OpenAI includes them
+            input_tokens += cache_read + cache_creation
+        return {"input": input_tokens, "output": self.completion_tokens, "cache_read": cache_read, "cache_creation": cache_creation}
+
+class UsageTotals(BaseModel):
+    """Token usage summed over a run, including the provider prompt cache reads and writes."""
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    # requests whose usage was estimated, e.g. streams closed before their usage chunk
+    estimated_requests: int = 0
+
+    def add(self, usage: Optional[Usage], provider: Optional[str] = None, estimated: bool = False):
+        if usage is None:
+            return
+        counts = usage.token_counts(provider)
+        self.requests += 1
+        self.estimated_requests += int(estimated)
+        self.input_tokens += counts["input"]
+        self.output_tokens += counts["output"]
+        self.cache_read_input_tokens += counts["cache_read"]
+        self.cache_creation_input_tokens += counts["cache_creation"]
+
+    @computed_field
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of the input tokens that were read from the provider prompt cache."""
+        return self.cache_read_input_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
 class GeneratedJsonObject(BaseModel):
     name: str
     object: Dict[str, Any]
 
+@dataclass(frozen=True, slots=True)
+class ParsedLLMOutput:
+    """Fields extracted from a provider payload, computed once per LLMOutput."""
+    str_content: Optional[str]
+    json_object: Optional[GeneratedJsonObject]
+    usage: Optional[Usage]
+    error: Optional[str]
+    tool_calls: Optional[List[GeneratedJsonObject]]
+
+
 class LLMOutput(BaseModel):
-    raw_result: Union[str, dict, ChatCompletion, AnthropicMessage, PromptCachingBetaMessage]
+    raw_result: Union[str, bytes, dict, ChatCompletion, AnthropicMessage, PromptCachingBetaMessage]
     completion_kwargs: Optional[Dict[str, Any]] = None
     start_time: float
     end_time: float
     source_id: str
     client: Optional[Literal["openai", "anthropic","vllm","litellm"]] = Field(default=None)
+    request_metadata: Optional[Dict[str, Any]] = None
+
+    # Parse caches. The payload is validated and parsed at most once; raw_json is only
+    # serialized when persistence asks for it. model_copy keeps them unless the payload changes.
+    _parsed: Optional[ParsedLLMOutput] = PrivateAttr(default=None)
+    _provider: Optional[str] = PrivateAttr(default=None)
+    _validated: Any = PrivateAttr(default=None)
+    _raw_json: Optional[str] = PrivateAttr(default=None)
 
     @property
     def time_taken(self) -> float:
         return self.end_time - self.start_time
 
+    @property
+    def parsed(self) -> ParsedLLMOutput:
+        if self._parsed is None:
+            self._parsed = ParsedLLMOutput(*self._parse_result())
+        return self._parsed
+
+    @property
+    def raw_json(self) -> str:
+        """The raw provider payload as a JSON string, serialized once for persistence."""
+        if self._raw_json is None:
+            if isinstance(self.raw_result, bytes):
+                self._raw_json = self.raw_result.decode("utf-8")
+            elif isinstance(self.raw_result, BaseModel):
+                self._raw_json = self.raw_result.model_dump_json()
+            else:
+                self._raw_json = json.dumps(self.raw_result)
+        return self._raw_json
+
     @computed_field
     @property
     def str_content(self) -> Optional[str]:
-        return self._parse_result()[0]
+        return self.parsed.str_content
 
     @computed_field
     @property
     def json_object(self) -> Optional[GeneratedJsonObject]:
-        return self._parse_result()[1]
+        return self.parsed.json_object
     
     @computed_field
     @property
     def tool_calls(self) -> Optional[List[GeneratedJsonObject]]:
-        return self._parse_result()[4]
+        return self.parsed.tool_calls
     
     @computed_field
     @property
     def error(self) -> Optional[str]:
-        return self._parse_result()[3]
+        return self.parsed.error
 
     @computed_field
     @property
     def contains_object(self) -> bool:
-        return self._parse_result()[1] is not None
+        return self.parsed.json_object is not None
     
     @computed_field
     @property
     def usage(self) -> Optional[Usage]:
-        return self._parse_result()[2]
+        return self.parsed.usage
 
     @computed_field
     @property
@@ -292,29 +461,38 @@ class LLMOutput(BaseModel):
         if self.client is not None and self.result_provider != self.client:
             raise ValueError(f"The inferred result provider '{self.result_provider}' does not match the specified client '{self.client}'")
         return self
-    
+
+    def model_copy(self, *, update: Optional[Dict[str, Any]] = None, deep: bool = False) -> Self:
+        copy = super().model_copy(update=update, deep=deep)
+        if update and any(key in update for key in ("raw_result", "client", "completion_kwargs")):
+            copy._parsed = copy._provider = copy._validated = copy._raw_json = None
+        return copy
+
+    def _payload(self) -> Any:
+        # raw JSON bytes are only decoded when a parsed field is needed
+        if isinstance(self.raw_result, bytes):
+            return json.loads(self.raw_result)
+        return self.raw_result
     
     def search_result_provider(self) -> Optional[Literal["openai", "anthropic"]]:
-        try:
-            oai_completion = ChatCompletion.model_validate(self.raw_result)
-            return "openai"
-        except ValidationError:
+        if self._provider is not None:
+            return self._provider
+        payload = self._payload()
+        for provider, model in (("openai", ChatCompletion), ("anthropic", AnthropicMessage), ("anthropic", PromptCachingBetaMessage)):
             try:
-                anthropic_completion = AnthropicMessage.model_validate(self.raw_result)
-                return "anthropic"
+                self._validated = model.model_validate(payload)
+                self._provider = provider
+                return provider
             except ValidationError:
-                try:
-                    antrhopic_beta_completion = PromptCachingBetaMessage.model_validate(self.raw_result)
-                    return "anthropic"
-                except ValidationError:
-                    return None
+                continue
+        return None
 
     def _parse_json_string(self, content: str) -> Optional[Dict[str, Any]]:
         return parse_json_string(content)
     
     
 
-    def _parse_oai_completion(self,chat_completion:ChatCompletion) -> Tuple[Optional[str], Optional[List[GeneratedJsonObject]], Optional[Usage], None]:
+    def _parse_oai_completion(self,chat_completion:ChatCompletion) -> Tuple[Optional[str], Optional[GeneratedJsonObject], Optional[Usage], None, List[GeneratedJsonObject]]:
         message = chat_completion.choices[0].message
         content = message.content
 
@@ -347,18 +525,24 @@ class LLMOutput(BaseModel):
                 content = None  # Set content to None when we have a parsed JSON object
                 #print(f"parsed_json: {parsed_json} with name")
         if chat_completion.usage:
+            prompt_tokens_details = getattr(chat_completion.usage, 'prompt_tokens_details', None)
             usage = Usage(
                 prompt_tokens=chat_completion.usage.prompt_tokens,
                 completion_tokens=chat_completion.usage.completion_tokens,
-                total_tokens=chat_completion.usage.total_tokens
+                total_tokens=chat_completion.usage.total_tokens,
+                cache_read_input_tokens=getattr(prompt_tokens_details, 'cached_tokens', None)
             )
 
         return content, json_object, usage, None, tool_calls
 
-    def _parse_anthropic_message(self, message: Union[AnthropicMessage, PromptCachingBetaMessage]) -> Tuple[Optional[str], Optional[GeneratedJsonObject], Optional[Usage],None]:
+    def _parse_anthropic_message(self, message: Union[AnthropicMessage, PromptCachingBetaMessage]) -> Tuple[Optional[str], Optional[GeneratedJsonObject], Optional[Usage], None, List[GeneratedJsonObject]]:
         content = None
         json_object = None
         usage = None
+        tool_calls = [
+            GeneratedJsonObject(name=block.name, object=block.input)  # type: ignore  # .input is typed as object
+            for block in message.content if isinstance(block, ToolUseBlock)
+        ]
 
         if message.content:
             first_content = message.content[0]
@@ -382,24 +566,27 @@ class LLMOutput(BaseModel):
                 cache_read_input_tokens=getattr(message.usage, 'cache_read_input_tokens', None)
             )
 
-        return content, json_object, usage, None
+        return content, json_object, usage, None, tool_calls
     
 
-    def _parse_result(self) -> Tuple[Optional[str], Optional[GeneratedJsonObject], Optional[Usage],Optional[str]]:
+    def _parse_result(self) -> Tuple[Optional[str], Optional[GeneratedJsonObject], Optional[Usage], Optional[str], Optional[List[GeneratedJsonObject]]]:
+        payload = self._payload()
+        error = payload.get("error") if isinstance(payload, dict) else getattr(payload, "error", None)
+        if error:
+            return None, None, None, str(error), None
         provider = self.result_provider
-        if getattr(self.raw_result, "error", None):
-            return None, None, None,  getattr(self.raw_result, "error", None)
-        if provider == "openai":
-            return self._parse_oai_completion(ChatCompletion.model_validate(self.raw_result))
+        validated = self._validated
+        if provider in ("openai", "vllm", "litellm"):
+            if not isinstance(validated, ChatCompletion):
+                validated = ChatCompletion.model_validate(payload)
+            return self._parse_oai_completion(validated)
         elif provider == "anthropic":
-            try: #beta first
-                return self._parse_anthropic_message(PromptCachingBetaMessage.model_validate(self.raw_result))
-            except ValidationError:
-                return self._parse_anthropic_message(AnthropicMessage.model_validate(self.raw_result))
-        elif provider == "vllm":
-             return self._parse_oai_completion(ChatCompletion.model_validate(self.raw_result))
-        elif provider == "litellm":
-            return self._parse_oai_completion(ChatCompletion.model_validate(self.raw_result))
+            if not isinstance(validated, (AnthropicMessage, PromptCachingBetaMessage)):
+                try: #beta first
+                    validated = PromptCachingBetaMessage.model_validate(payload)
+                except ValidationError:
+                    validated = AnthropicMessage.model_validate(payload)
+            return self._parse_anthropic_message(validated)
         else:
             raise ValueError(f"Unsupported result provider: {provider}")
 
@@ -0,0 +1,332 @@
+"""
+In-process accounting of inference latency, tokens, cache hits and retries.
+
+`ParallelAIUtilities` feeds every completed batch into an `InferenceMetrics`
+collector together with the labels of the caller (environment, phase, round).
+The collector keeps Prometheus-style counters and histograms, exported in the
+Prometheus text format to a file or a local `/metrics` endpoint, and pre-aggregated
+views per round/environment/phase/model and per agent that show which phase or
+model dominates the round time.
+
+Rounds and agents are kept out of the Prometheus label sets to bound their
+cardinality; they are available in the views instead.
+"""
+
+import logging
+import os
+import random
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from pydantic import BaseModel, PrivateAttr, computed_field
+
+from trade_agents.inference.message_models import LLMOutput
+from trade_agents.inference.routing import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# latencies kept per aggregate for its percentiles, exact below this many requests
+LATENCY_RESERVOIR_SIZE = 1024
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def label_set(**labels: Any) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: LabelSet, extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(labels) + sorted((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with the Prometheus semantics (le buckets, sum, count)."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        counts, total = [], 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class LatencyReservoir:
+    """Uniform random sample of at most `size` latencies (reservoir sampling), bounds the memory of percentiles."""
+
+    def __init__(self, size: int = LATENCY_RESERVOIR_SIZE, seed: Optional[int] = 0):
+        self.size = size
+        self.samples: List[float] = []
+        self.count = 0
+        self._rng = random.Random(seed)
+
+    def observe(self, value: float):
+        self.count += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+            return
+        index = self._rng.randrange(self.count)
+        if index < self.size:
+            self.samples[index] = value
+
+    def merge(self, other: "LatencyReservoir"):
+        """Sample of both reservoirs, each side weighted by the number of latencies it stands for."""
+        count = self.count + other.count
+        if len(self.samples) + len(other.samples) <= self.size:
+            self.samples.extend(other.samples)
+        else:
+            ours, theirs = self._rng.sample(self.samples, len(self.samples)), other._rng.sample(other.samples, len(other.samples))
+            merged = []
+            while len(merged) < self.size and (ours or theirs):
+                take_ours = not theirs or (ours and self._rng.random() < self.count / count)
+                merged.append((ours if take_ours else theirs).pop())
+            self.samples = merged
+        self.count = count
+
+    def percentile(self, q: float) -> Optional[float]:
+        return percentile(self.samples, q)
+
+
+class PhaseAggregate(BaseModel):
+    """Pre-aggregated requests of one round, environment, phase and model."""
+    round: Optional[int] = None
+    environment: Optional[str] = None
+    phase: Optional[str] = None
+    client: Optional[str] = None
+    model: Optional[str] = None
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    wall_time: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    _latencies: LatencyReservoir = PrivateAttr(default_factory=LatencyReservoir)
+
+    @computed_field
+    @property
+    def latency_p50(self) -> Optional[float]:
+        return self._latencies.percentile(50)
+
+    @computed_field
+    @property
+    def latency_p95(self) -> Optional[float]:
+        return self._latencies.percentile(95)
+
+    @computed_field
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cache_read_input_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+class AgentAggregate(BaseModel):
+    """Pre-aggregated requests of one agent in one phase over the whole run."""
+    agent: str
+    phase: Optional[str] = None
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    latency_sum: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @computed_field
+    @property
+    def mean_latency(self) -> float:
+        return self.latency_sum / self.requests if self.requests else 0.0
+
+
+class InferenceMetrics:
+    """Counters, histograms and pre-aggregated views of the completions of a run."""
+
+    def __init__(self, latency_buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.latency_buckets = tuple(latency_buckets)
+        self.counters: Dict[str, Dict[LabelSet, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[LabelSet, Histogram]] = defaultdict(dict)
+        self.phase_aggregates: Dict[Tuple, PhaseAggregate] = {}
+        self.agent_aggregates: Dict[Tuple[str, Optional[str]], AgentAggregate] = {}
+        # wall time of every (round, environment, phase) batch, a phase may run several batches
+        self.phase_wall_times: Dict[Tuple, float] = defaultdict(float)
+        # callables returning the exposition text of metrics kept elsewhere, e.g. the embedding cache
+        self.collectors: List[Callable[[], str]] = []
+
+    def register_collector(self, collector: Callable[[], str]):
+        """Export the Prometheus text returned by `collector` along with the inference metrics."""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def _observe(self, name: str, labels: LabelSet, value: float):
+        histogram = self.histograms[name].get(labels)
+        if histogram is None:
+            histogram = self.histograms[name][labels] = Histogram(self.latency_buckets)
+        histogram.observe(value)
+
+    def record_batch(self, outputs: List[LLMOutput], wall_time: float, labels: Optional[Dict[str, Any]] = None):
+        """Record one run_parallel_ai_completion batch: its outputs and its wall-clock time."""
+        labels = labels or {}
+        environment, phase, round_num = labels.get("environment"), labels.get("phase"), labels.get("round")
+        phase_key = (round_num, environment, phase)
+        self.phase_wall_times[phase_key] += wall_time
+        self._observe("inference_phase_duration_seconds", label_set(environment=environment, phase=phase), wall_time)
+
+        seen_results = set()
+        for output in outputs:
+            # coalesced outputs share the raw result of one upstream call
+            shared = id(output.raw_result) in seen_results
+            seen_results.add(id(output.raw_result))
+            self._record_output(output, environment, phase, round_num, shared)
+
+    def _record_output(self, output: LLMOutput, environment: Optional[str], phase: Optional[str], round_num: Optional[int], shared: bool):
+        client = output.client
+        model = (output.completion_kwargs or {}).get("model")
+        metadata = output.request_metadata or {}
+        retries = max(0, metadata.get("attempts", 1) - 1)
+        latency = output.time_taken
+        error = output.error is not None
+        usage = output.usage if not shared else None
+        tokens = usage.token_counts(output.result_provider) if usage else {"input": 0, "output": 0, "cache_read": 0, "cache_creation": 0}
+
+        base = label_set(client=client, model=model, environment=environment, phase=phase)
+        self.counters["inference_requests_total"][label_set(client=client, model=model, environment=environment, phase=phase, status="error" if error else "ok")] += 1
+        if shared:
+            self.counters["inference_coalesced_requests_total"][base] += 1
+        if retries:
+            self.counters["inference_retries_total"][base] += retries
+        if metadata.get("usage_estimated") and not shared:
+            self.counters["inference_estimated_usage_requests_total"][base] += 1
+        for token_type, count in tokens.items():
+            if count:
+                self.counters["inference_tokens_total"][label_set(client=client, model=model, environment=environment, phase=phase, type=token_type)] += count
+        self._observe("inference_request_latency_seconds", label_set(client=client, model=model, phase=phase), latency)
+
+        key = (round_num, environment, phase, client, model)
+        aggregate = self.phase_aggregates.get(key)
+        if aggregate is None:
+            aggregate = self.phase_aggregates[key] = PhaseAggregate(round=round_num, environment=environment, phase=phase, client=client, model=model)
+        aggregate.requests += 1
+        aggregate.errors += int(error)
+        aggregate.retries += retries
+        aggregate._latencies.observe(latency)
+        aggregate.input_tokens += tokens["input"]
+        aggregate.output_tokens += tokens["output"]
+        aggregate.cache_read_input_tokens += tokens["cache_read"]
+        aggregate.cache_creation_input_tokens += tokens["cache_creation"]
+
+        agent = self.agent_aggregates.get((output.source_id, phase))
+        if agent is None:
+            agent = self.agent_aggregates[(output.source_id, phase)] = AgentAggregate(agent=output.source_id, phase=phase)
+        agent.requests += 1
+        agent.errors += int(error)
+        agent.retries += retries
+        agent.latency_sum += latency
+        agent.input_tokens += tokens["input"]
+        agent.output_tokens += tokens["output"]
+
+    def phase_breakdown(self, round_num: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        One row per round, environment, phase and model, with the phase's share of the round time.
+        Only the rows of `round_num` are returned if it is given.
+
+        The share is computed from batch wall-clock times, so it shows which phase the round
+        waited on, not the summed request latencies.
+        """
+        round_times: Dict[Tuple, float] = defaultdict(float)
+        for (batch_round, environment, _), wall_time in self.phase_wall_times.items():
+            round_times[(batch_round, environment)] += wall_time
+        rows = []
+        for aggregate in self.phase_aggregates.values():
+            if round_num is not None and aggregate.round != round_num:
+                continue
+            row = aggregate.model_dump()
+            row["wall_time"] = self.phase_wall_times.get((aggregate.round, aggregate.environment, aggregate.phase), 0.0)
+            round_time = round_times.get((aggregate.round, aggregate.environment), 0.0)
+            row["share_of_round_time"] = row["wall_time"] / round_time if round_time else 0.0
+            rows.append(row)
+        return sorted(rows, key=lambda r: (r["round"] or 0, r["environment"] or "", r["phase"] or "", r["model"] or ""))
+
+    def model_breakdown(self) -> List[Dict[str, Any]]:
+        """One row per client and model over the whole run."""
+        merged: Dict[Tuple, PhaseAggregate] = {}
+        for aggregate in self.phase_aggregates.values():
+            key = (aggregate.client, aggregate.model)
+            total = merged.setdefault(key, PhaseAggregate(client=aggregate.client, model=aggregate.model))
+            for field in ("requests", "errors", "retries", "input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+                setattr(total, field, getattr(total, field) + getattr(aggregate, field))
+            total._latencies.merge(aggregate._latencies)
+        return [
+            {k: v for k, v in total.model_dump().items() if k not in ("round", "environment", "phase", "wall_time")}
+            for total in merged.values()
+        ]
+
+    def agent_breakdown(self) -> List[Dict[str, Any]]:
+        return [aggregate.model_dump() for aggregate in self.agent_aggregates.values()]
+
+    def dominant_phase(self, round_num: int, environment: Optional[str] = None) -> Optional[str]:
+        """Phase with the longest wall time in a round."""
+        candidates = [
+            (wall_time, phase) for (r, env, phase), wall_time in self.phase_wall_times.items()
+            if r == round_num and (environment is None or env == environment)
+        ]
+        return max(candidates)[1] if candidates else None
+
+    def to_prometheus_text(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append(f"{name}_bucket{format_labels(labels, {'le': f'{bound:g}'})} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels, {'le': '+Inf'})} {histogram.count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        text = "\n".join(lines) + "\n"
+        return text + "".join(collector() for collector in self.collectors)
+
+    def write_prometheus_file(self, filepath: str):
+        """Write the metrics for the node exporter textfile collector (written atomically)."""
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, "w") as f:
+            f.write(self.to_prometheus_text())
+        os.replace(tmp_filepath, filepath)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9464) -> web.AppRunner:
+        """Expose the metrics on http://host:port/metrics; call `cleanup()` on the returned runner to stop."""
+
+        async def handle_metrics(request: web.Request) -> web.Response:
+            return web.Response(text=self.to_prometheus_text(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Serving inference metrics on http://{host}:{port}/metrics")
+        return runner
+
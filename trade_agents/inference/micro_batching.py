@@ -0,0 +1,90 @@
+"""
+Micro-batching of concurrent single-prompt completions.
+
+Agents calling `execute()` outside an orchestrator each send a batch of one prompt, with its
+own requests file round-trip. The `MicroBatcher` collects the prompts submitted within a
+short window (a few milliseconds) and dispatches them as one `run_parallel_ai_completion`
+batch, resolving the future of every caller with its own output.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from trade_agents.inference.message_models import LLMOutput, LLMPromptContext
+
+logger = logging.getLogger(__name__)
+
+BatchRunner = Callable[[List[LLMPromptContext], bool], Awaitable[List[LLMOutput]]]
+
+
+class MicroBatcher:
+    """
+    Dispatches the prompts submitted within `window` seconds as one batch.
+
+    A batch is dispatched early once it holds `max_batch_size` prompts, or when a prompt with
+    an id that is already waiting is submitted (outputs are matched to prompts by id).
+    """
+
+    def __init__(self, run_batch: BatchRunner, window: float = 0.01, max_batch_size: int = 256):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # prompts waiting per update_history flag, the flag is set per batch
+        self._pending: Dict[bool, Dict[str, Tuple[LLMPromptContext, asyncio.Future]]] = {}
+        self._timers: Dict[bool, asyncio.TimerHandle] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # the event loop only keeps weak references to the dispatch tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.num_batches = 0
+        self.num_prompts = 0
+
+    async def submit(self, prompt: LLMPromptContext, update_history: bool = True) -> Optional[LLMOutput]:
+        """Output of a single prompt, completed together with the prompts submitted around it."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # batches never span event loops
+            self._loop, self._pending, self._timers = loop, {}, {}
+        pending = self._pending.setdefault(update_history, {})
+        if prompt.id in pending:
+            self._flush(update_history)
+            pending = self._pending.setdefault(update_history, {})
+
+        future = loop.create_future()
+        pending[prompt.id] = (prompt, future)
+        if len(pending) >= self.max_batch_size:
+            self._flush(update_history)
+        elif update_history not in self._timers:
+            self._timers[update_history] = loop.call_later(self.window, self._flush, update_history)
+        return await future
+
+    def _flush(self, update_history: bool):
+        timer = self._timers.pop(update_history, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(update_history, None)
+        if batch:
+            task = self._loop.create_task(self._dispatch(batch, update_history))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: Dict[str, Tuple[LLMPromptContext, asyncio.Future]], update_history: bool):
+        self.num_batches += 1
+        self.num_prompts += len(batch)
+        logger.debug(f"Dispatching a micro-batch of {len(batch)} prompts")
+        try:
+            outputs = await self.run_batch([prompt for prompt, _ in batch.values()], update_history)
+        except Exception as e:
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # cancelled, e.g. at loop shutdown: the callers must not wait forever
+            for _, future in batch.values():
+                future.cancel()
+            raise
+        outputs_by_id = {output.source_id: output for output in outputs}
+        for prompt_id, (_, future) in batch.items():
+            if not future.done():
+                future.set_result(outputs_by_id.get(prompt_id))
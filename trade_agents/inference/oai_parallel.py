@@ -41,9 +41,26 @@ from dataclasses import (
     dataclass,
     field,
 )  # for storing API inputs, outputs, and metadata
-from typing import List  # for type hints in functions
+from typing import Dict, List, Optional  # for type hints in functions
 from pydantic import BaseModel, Field
 
+from trade_agents.inference.local_backend import estimate_tokens
+from trade_agents.inference.retry import (
+    RetryPolicy,
+    RetryQueue,
+    classify_error,
+    is_rate_limit_error,
+    parse_retry_after,
+    retry_policy_for,
+)
+from trade_agents.inference.routing import InferenceRouter
+from trade_agents.inference.streaming import (
+    OpenAIStreamAccumulator,
+    create_stream_accumulator,
+    iter_sse_events,
+    required_fields_from_request,
+)
+
 class OAIApiFromFileConfig(BaseModel):
  requests_filepath: str
  save_filepath: str
@@ -54,9 +71,19 @@ class OAIApiFromFileConfig(BaseModel):
  max_attempts:int = Field(5,description="The maximum number of attempts to make for each request")
  logging_level:int = Field(20,description="The logging level to use for the request")
  token_encoding_name: str = Field("cl100k_base",description="The token encoding scheme to use for calculating request sizes")
+ stream: bool = Field(False,description="Request server-sent events and rebuild the final payload from the stream")
+ early_resolve: bool = Field(True,description="When streaming, stop reading once the required structured-output fields are complete")
+ request_timeout: Optional[float] = Field(None,description="Timeout in seconds of a single attempt, None keeps the aiohttp default")
+ deadline: Optional[float] = Field(None,description="Unix time after which pending requests are abandoned instead of sent or retried")
+ hedge: bool = Field(False,description="Send a duplicate of requests that run longer than the hedge delay and keep the first valid response")
+ hedge_after: Optional[float] = Field(None,description="Hedge delay in seconds, defaults to the router's observed p95 latency")
+ retry_policies: Optional[Dict[str, RetryPolicy]] = Field(None,description="Retry policy per error class, missing classes use the defaults of trade_agents.inference.retry")
 
 async def process_api_requests_from_file(
-        api_cfg: OAIApiFromFileConfig
+        api_cfg: OAIApiFromFileConfig,
+        router: Optional[InferenceRouter] = None,
+        provider: Optional[str] = None,
+        rate_limiter: Optional["RateLimiter"] = None,
 ):
     """
     Asynchronously processes API requests from a given file, executing them in parallel
@@ -76,6 +103,23 @@ async def process_api_requests_from_file(
     - token_encoding_name: Name of the token encoding scheme used for calculating request sizes.
     - max_attempts: The maximum number of attempts for each request in case of failures.
     - logging_level: The logging level to use for reporting the process's progress and issues.
+    - stream: Whether to stream completions instead of waiting for the full response body.
+    - early_resolve: Whether a streamed structured output resolves as soon as its required fields are complete.
+    - router: Optional InferenceRouter whose per-model AIMD limiters gate concurrency and which records
+      the latency and error outcome of every attempt.
+    - provider: Name of the provider the requests are sent to, used with the model as the router key.
+    - rate_limiter: Request and token budget shared with the other calls sending to the same provider;
+      by default the call gets its own budget from max_requests_per_minute / max_tokens_per_minute.
+    - request_timeout: Timeout of a single attempt in seconds.
+    - deadline: Unix time after which requests are no longer sent or retried; they are saved as
+      `deadline exceeded` errors so the caller can apply its fallback.
+    - hedge / hedge_after: Whether, and after how many seconds, a duplicate of a slow request is sent.
+    - retry_policies: Backoff of every error class; validation and authentication errors are not retried.
+
+    Failed requests wait for their backoff in a retry queue; while they wait, and whenever a retry
+    and a fresh request are both ready, fresh requests keep being dispatched. The number of
+    attempts of every request is saved in its metadata (`attempts`, and `retry_errors` with the
+    class of every retried error).
     
     The function initializes necessary tracking structures, sets up asynchronous HTTP sessions,
     and manages request retries and rate limiting. It logs the progress and any issues encountered
@@ -91,8 +135,12 @@ async def process_api_requests_from_file(
     token_encoding_name = api_cfg.token_encoding_name
     max_attempts = api_cfg.max_attempts
     logging_level = api_cfg.logging_level
+    stream = api_cfg.stream
+    early_resolve = api_cfg.early_resolve
+    request_timeout = api_cfg.request_timeout
+    deadline = api_cfg.deadline
+    retry_policies = api_cfg.retry_policies
     # constants
-    seconds_to_pause_after_rate_limit_error = 15
     seconds_to_sleep_each_loop = (
         0.001  # 1 ms limits max throughput to 1,000 requests per second
     )
@@ -117,7 +165,8 @@ async def process_api_requests_from_file(
         }
 
     # initialize trackers
-    queue_of_requests_to_retry = asyncio.Queue()
+    queue_of_requests_to_retry = RetryQueue()
+    take_retry_next = False  # alternate ready retries and fresh requests
     task_id_generator = (
         task_id_generator_function()
     )  # generates integer IDs of 1, 2, 3, ...
@@ -127,9 +176,8 @@ async def process_api_requests_from_file(
     next_request = None  # variable to hold the next request to call
 
     # initialize available capacity counts
-    available_request_capacity = max_requests_per_minute
-    available_token_capacity = max_tokens_per_minute
-    last_update_time = time.time()
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(max_requests_per_minute, max_tokens_per_minute)
 
     # initialize flags
     file_not_finished = True  # after file is empty, we'll skip reading it
@@ -144,8 +192,9 @@ async def process_api_requests_from_file(
             while True:
                 # get next request (if one is not already waiting for capacity)
                 if next_request is None:
-                    if not queue_of_requests_to_retry.empty():
-                        next_request = queue_of_requests_to_retry.get_nowait()
+                    if queue_of_requests_to_retry.has_ready() and (take_retry_next or not file_not_finished):
+                        next_request = queue_of_requests_to_retry.pop_ready()
+                        take_retry_next = False
                         logging.debug(
                             f"Retrying request {next_request.task_id}: {next_request}"
                         )
@@ -165,6 +214,7 @@ async def process_api_requests_from_file(
                             )
                             status_tracker.num_tasks_started += 1
                             status_tracker.num_tasks_in_progress += 1
+                            take_retry_next = True
                             logging.debug(
                                 f"Reading request {next_request.task_id}: {next_request}"
                             )
@@ -173,31 +223,25 @@ async def process_api_requests_from_file(
                             logging.debug("Read file exhausted")
                             file_not_finished = False
 
-                # update available capacity
-                current_time = time.time()
-                seconds_since_update = current_time - last_update_time
-                available_request_capacity = min(
-                    available_request_capacity
-                    + max_requests_per_minute * seconds_since_update / 60.0,
-                    max_requests_per_minute,
-                )
-                available_token_capacity = min(
-                    available_token_capacity
-                    + max_tokens_per_minute * seconds_since_update / 60.0,
-                    max_tokens_per_minute,
-                )
-                last_update_time = current_time
+                # requests still waiting when the deadline expires are abandoned
+                if next_request and deadline is not None and time.time() >= deadline:
+                    next_request.save_failure(
+                        "deadline exceeded", save_filepath, status_tracker, deadline_exceeded=True
+                    )
+                    next_request = None
 
                 # if enough capacity available, call API
                 if next_request:
                     next_request_tokens = next_request.token_consumption
                     if (
-                        available_request_capacity >= 1
-                        and available_token_capacity >= next_request_tokens
+                        rate_limiter.has_capacity(next_request_tokens)
+                        and (
+                            router is None
+                            or router.try_acquire(provider, next_request.request_json.get("model"))
+                        )
                     ):
                         # update counters
-                        available_request_capacity -= 1
-                        available_token_capacity -= next_request_tokens
+                        rate_limiter.consume(next_request_tokens)
                         next_request.attempts_left -= 1
 
                         # call API
@@ -209,6 +253,15 @@ async def process_api_requests_from_file(
                                 retry_queue=queue_of_requests_to_retry,
                                 save_filepath=save_filepath,
                                 status_tracker=status_tracker,
+                                stream=stream,
+                                early_resolve=early_resolve,
+                                router=router,
+                                provider=provider,
+                                request_timeout=request_timeout,
+                                deadline=deadline,
+                                hedge_after=hedge_delay(api_cfg, router, provider, next_request.request_json.get("model")),
+                                retry_policies=retry_policies,
+                                rate_limiter=rate_limiter,
                             )
                         )
                         next_request = None  # reset next_request to empty
@@ -220,23 +273,18 @@ async def process_api_requests_from_file(
                 # main loop sleeps briefly so concurrent tasks can run
                 await asyncio.sleep(seconds_to_sleep_each_loop)
 
-                # if a rate limit error was hit recently, pause to cool down
-                seconds_since_rate_limit_error = (
-                    time.time() - status_tracker.time_of_last_rate_limit_error
-                )
-                if (
-                    seconds_since_rate_limit_error
-                    < seconds_to_pause_after_rate_limit_error
-                ):
-                    remaining_seconds_to_pause = (
-                        seconds_to_pause_after_rate_limit_error
-                        - seconds_since_rate_limit_error
+                # if a rate limit error was hit recently, pause for its backoff (or Retry-After) to cool down
+                remaining_seconds_to_pause = status_tracker.rate_limit_pause_until - time.time()
+                if remaining_seconds_to_pause > 0:
+                    if deadline is not None:
+                        # never cool down past the deadline
+                        remaining_seconds_to_pause = min(
+                            remaining_seconds_to_pause, max(0.0, deadline - time.time())
+                        )
+                    logging.warning(
+                        f"Pausing to cool down until {time.ctime(status_tracker.rate_limit_pause_until)}"
                     )
                     await asyncio.sleep(remaining_seconds_to_pause)
-                    # ^e.g., if pause is 15 seconds and final limit was hit 5 seconds ago
-                    logging.warn(
-                        f"Pausing to cool down until {time.ctime(status_tracker.time_of_last_rate_limit_error + seconds_to_pause_after_rate_limit_error)}"
-                    )
 
         # after finishing, log final status
         logging.info(
@@ -246,6 +294,8 @@ async def process_api_requests_from_file(
             logging.warning(
                 f"{status_tracker.num_tasks_failed} / {status_tracker.num_tasks_started} requests failed. Errors logged to {save_filepath}."
             )
+        if status_tracker.num_retries > 0:
+            logging.info(f"{status_tracker.num_retries} retries were made.")
         if status_tracker.num_rate_limit_errors > 0:
             logging.warning(
                 f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate."
@@ -255,6 +305,49 @@ async def process_api_requests_from_file(
 # dataclasses
 
 
+@dataclass
+class RateLimiter:
+    """
+    Requests and tokens per minute budget, refilled continuously up to one minute of capacity.
+
+    One limiter per provider can be shared by every concurrent call of the process so that
+    the calls together stay within the provider's limits.
+    """
+
+    max_requests_per_minute: float
+    max_tokens_per_minute: float
+    available_request_capacity: Optional[float] = None
+    available_token_capacity: Optional[float] = None
+    last_update_time: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        if self.available_request_capacity is None:
+            self.available_request_capacity = self.max_requests_per_minute
+        if self.available_token_capacity is None:
+            self.available_token_capacity = self.max_tokens_per_minute
+
+    def refill(self):
+        current_time = time.time()
+        seconds_since_update = current_time - self.last_update_time
+        self.available_request_capacity = min(
+            self.available_request_capacity + self.max_requests_per_minute * seconds_since_update / 60.0,
+            self.max_requests_per_minute,
+        )
+        self.available_token_capacity = min(
+            self.available_token_capacity + self.max_tokens_per_minute * seconds_since_update / 60.0,
+            self.max_tokens_per_minute,
+        )
+        self.last_update_time = current_time
+
+    def has_capacity(self, tokens: int) -> bool:
+        self.refill()
+        return self.available_request_capacity >= 1 and self.available_token_capacity >= tokens
+
+    def consume(self, tokens: int):
+        self.available_request_capacity -= 1
+        self.available_token_capacity -= tokens
+
+
 @dataclass
 class StatusTracker:
     """
@@ -273,8 +366,10 @@ class StatusTracker:
     - num_rate_limit_errors: The count of errors received due to hitting the API's rate limits.
     - num_api_errors: The count of API-related errors excluding rate limit errors.
     - num_other_errors: The count of errors that are neither API errors nor rate limit errors.
-    - time_of_last_rate_limit_error: A timestamp (as an integer) of the last time a rate limit error was encountered,
-      used to implement a cooling-off period before making subsequent requests.
+    - num_retries: The number of attempts that were queued for a retry.
+    - time_of_last_rate_limit_error: A timestamp (as an integer) of the last time a rate limit error was encountered.
+    - rate_limit_pause_until: Unix time until which no request is sent after a rate limit error,
+      the backoff (or Retry-After) of the error that was hit.
     
     The class is initialized with all counters set to 0, and the `time_of_last_rate_limit_error`
     set to 0 indicating no rate limit errors have occurred yet.
@@ -287,7 +382,9 @@ class StatusTracker:
     num_rate_limit_errors: int = 0
     num_api_errors: int = 0  # excluding rate limit errors, counted above
     num_other_errors: int = 0
-    time_of_last_rate_limit_error: float = 0  # used to cool off after hitting rate limits
+    num_retries: int = 0
+    time_of_last_rate_limit_error: float = 0
+    rate_limit_pause_until: float = 0  # used to cool off after hitting rate limits
 
 
 @dataclass
@@ -302,6 +399,8 @@ class APIRequest:
     - attempts_left (int): The number of retries left if the request fails.
     - metadata (dict): Additional metadata associated with the request.
     - result (list): A list to store the results or errors from the API call.
+    - http_status (int): HTTP status of the last error response, used to classify the error.
+    - retry_after (float): Seconds the server asked to wait in the last error response.
     
     This class encapsulates the data and actions related to making an API request, including
     retry logic and error handling.
@@ -313,6 +412,8 @@ class APIRequest:
     attempts_left: int
     metadata: dict
     result: list = field(default_factory=list)
+    http_status: Optional[int] = None
+    retry_after: Optional[float] = None
 
     async def call_api(
         self,
@@ -322,6 +423,15 @@ class APIRequest:
         retry_queue: asyncio.Queue,
         save_filepath: str,
         status_tracker: StatusTracker,
+        stream: bool = False,
+        early_resolve: bool = True,
+        router: Optional[InferenceRouter] = None,
+        provider: Optional[str] = None,
+        request_timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         """
         Asynchronously sends the API request using aiohttp, handles errors, and manages retries.
@@ -330,28 +440,49 @@ class APIRequest:
         - session (aiohttp.ClientSession): The session object used for HTTP requests.
         - request_url (str): The URL to which the request is sent.
         - request_header (dict): Headers for the request, including authorization.
-        - retry_queue (asyncio.Queue): A queue for requests that need to be retried.
+        - retry_queue (RetryQueue): A queue for requests that need to be retried after their backoff.
         - save_filepath (str): The file path where results or errors should be logged.
         - status_tracker (StatusTracker): A shared object for tracking the status of all API requests.
+        - stream (bool): Whether to request a server-sent events stream.
+        - early_resolve (bool): Whether to stop reading the stream once the required output fields are complete.
+        - router (InferenceRouter): Optional router that holds a concurrency slot for this attempt and records its outcome.
+        - provider (str): Provider name used with the request's model as the router key.
+        - request_timeout (float): Timeout of this attempt in seconds, capped by the deadline.
+        - deadline (float): Unix time after which the request is not retried anymore.
+        - hedge_after (float): Seconds after which a duplicate request is sent, None disables hedging.
+        - retry_policies (dict): Retry policy per error class, see trade_agents.inference.retry.
+        - rate_limiter (RateLimiter): Budget a hedged duplicate is charged against, like the router's concurrency slot.
         
         This method attempts to post the request to the given URL. If the request encounters an error,
-        it determines whether to retry based on the remaining attempts and updates the status tracker
-        accordingly. Successful requests or final failures are logged to the specified file.
+        it classifies the error and determines whether and when to retry based on the error's policy,
+        the remaining attempts and the deadline, and updates the status tracker accordingly. Successful requests or final failures are logged to the specified file.
         """
         logging.info(f"Starting request #{self.task_id}")
+        self.metadata["attempts"] = self.metadata.get("attempts", 0) + 1
+        self.http_status = None
+        self.retry_after = None
         error = None
+        rate_limited = False
+        attempt_start = time.time()
+        timeout = request_timeout
+        if deadline is not None:
+            remaining = deadline - attempt_start
+            timeout = remaining if timeout is None else min(timeout, remaining)
         try:
-            async with session.post(
-                url=request_url, headers=request_header, json=self.request_json
-            ) as response:
-                response = await response.json()
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError("deadline exceeded before the request was sent")
+            response = await self._send_hedged(
+                session, request_url, request_header, stream, early_resolve, timeout, hedge_after,
+                rate_limiter, router, provider
+            )
             if "error" in response:
                 logging.warning(
                     f"Request {self.task_id} failed with error {response['error']}"
                 )
                 status_tracker.num_api_errors += 1
                 error = response
-                if "Rate limit" in response["error"].get("message", ""):
+                rate_limited = is_rate_limit_error(response) or self.http_status == 429
+                if rate_limited:
                     status_tracker.time_of_last_rate_limit_error = time.time()
                     status_tracker.num_rate_limit_errors += 1
                     status_tracker.num_api_errors -= (
@@ -365,20 +496,19 @@ class APIRequest:
             status_tracker.num_other_errors += 1
             error = e
 
+        if router is not None:
+            router.release(
+                provider,
+                self.request_json.get("model"),
+                latency=time.time() - attempt_start,
+                error=error is not None,
+                rate_limited=rate_limited,
+                overloaded=isinstance(error, Exception),
+            )
+
         if error:
             self.result.append(error)
-            if self.attempts_left:
-                retry_queue.put_nowait(self)
-            else:
-                logging.error(
-                    f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}"
-                )
-                self.metadata["end_time"] = time.time()
-                self.metadata["total_time"] = self.metadata["end_time"] - self.metadata["start_time"]
-                data = [self.metadata, self.request_json, {"error": str(error)}]
-                append_to_jsonl(data, save_filepath)
-                status_tracker.num_tasks_in_progress -= 1
-                status_tracker.num_tasks_failed += 1
+            self._retry_or_fail(error, rate_limited, retry_queue, save_filepath, status_tracker, deadline, retry_policies)
         else:
             self.metadata["end_time"] = time.time()
             self.metadata["total_time"] = self.metadata["end_time"] - self.metadata["start_time"]
@@ -388,9 +518,236 @@ class APIRequest:
             status_tracker.num_tasks_succeeded += 1
             logging.debug(f"Request {self.task_id} saved to {save_filepath}")
 
+    def _retry_or_fail(
+        self,
+        error,
+        rate_limited: bool,
+        retry_queue: RetryQueue,
+        save_filepath: str,
+        status_tracker: StatusTracker,
+        deadline: Optional[float],
+        retry_policies: Optional[Dict[str, RetryPolicy]],
+    ):
+        """Queues the request for a retry after the backoff of its error class, or saves it as failed."""
+        error_class = classify_error(error, self.http_status)
+        policy = retry_policy_for(error_class, retry_policies)
+        delay = policy.backoff(self.metadata["attempts"], self.retry_after) if policy.retry else None
+        if rate_limited and delay is not None:
+            status_tracker.rate_limit_pause_until = max(status_tracker.rate_limit_pause_until, time.time() + delay)
+
+        if deadline is not None and time.time() >= deadline:
+            self.save_failure("deadline exceeded", save_filepath, status_tracker, deadline_exceeded=True)
+        elif not policy.retry:
+            logging.error(f"Request {self.task_id} failed with a {error_class} error, not retrying: {error}")
+            self.save_failure(str(error), save_filepath, status_tracker, error_class=error_class)
+        elif not self.attempts_left:
+            logging.error(
+                f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}"
+            )
+            self.save_failure(str(error), save_filepath, status_tracker, error_class=error_class)
+        elif deadline is not None and time.time() + delay >= deadline:
+            # the backoff would end past the deadline
+            self.save_failure("deadline exceeded", save_filepath, status_tracker, deadline_exceeded=True)
+        else:
+            logging.info(f"Retrying request {self.task_id} after a {error_class} error in {delay:.2f}s")
+            self.metadata.setdefault("retry_errors", []).append(error_class)
+            status_tracker.num_retries += 1
+            retry_queue.put(self, delay)
+
+    def _record_error_status(self, response: aiohttp.ClientResponse):
+        """Keeps the status and Retry-After of an error response to classify the error."""
+        if response.status >= 400:
+            self.http_status = response.status
+            self.retry_after = parse_retry_after(response.headers)
+
+    def save_failure(
+        self,
+        error: str,
+        save_filepath: str,
+        status_tracker: StatusTracker,
+        deadline_exceeded: bool = False,
+        error_class: Optional[str] = None,
+    ):
+        """Saves the request as failed so that every request of the file has a result line."""
+        if deadline_exceeded:
+            logging.warning(f"Request {self.task_id} abandoned, deadline exceeded")
+            self.metadata["deadline_exceeded"] = True
+        if error_class is not None:
+            self.metadata["error_class"] = error_class
+        self.metadata["end_time"] = time.time()
+        self.metadata["total_time"] = self.metadata["end_time"] - self.metadata["start_time"]
+        data = [self.metadata, self.request_json, {"error": error}]
+        append_to_jsonl(data, save_filepath)
+        status_tracker.num_tasks_in_progress -= 1
+        status_tracker.num_tasks_failed += 1
+
+    async def _send_hedged(
+        self,
+        session: aiohttp.ClientSession,
+        request_url: str,
+        request_header: dict,
+        stream: bool,
+        early_resolve: bool,
+        timeout: Optional[float],
+        hedge_after: Optional[float],
+        rate_limiter: Optional[RateLimiter] = None,
+        router: Optional[InferenceRouter] = None,
+        provider: Optional[str] = None,
+    ) -> dict:
+        """
+        Sends the request and, if it is still running after `hedge_after` seconds, a duplicate of it.
+
+        The duplicate is charged against the rate limiter and takes its own router concurrency
+        slot; without capacity in either the request is not hedged. The first valid response
+        wins and the other request is cancelled. If both fail, the primary's error (exception
+        or error payload) is surfaced.
+        """
+        primary = asyncio.create_task(
+            self._send(session, request_url, request_header, stream, early_resolve, timeout)
+        )
+        if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+            return await primary
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        model = self.request_json.get("model")
+        if rate_limiter is not None and not rate_limiter.has_capacity(self.token_consumption):
+            logging.debug(f"Request {self.task_id} not hedged, no rate limit capacity")
+            return await primary
+        if router is not None and not router.try_acquire(provider, model):
+            logging.debug(f"Request {self.task_id} not hedged, no concurrency slot")
+            return await primary
+        if rate_limiter is not None:
+            rate_limiter.consume(self.token_consumption)
+
+        logging.info(f"Request {self.task_id} exceeded {hedge_after:.2f}s, sending hedged request")
+        self.metadata["hedged"] = True
+        hedge_start = time.time()
+        hedge = asyncio.create_task(
+            self._send(
+                session, request_url, request_header, stream, early_resolve,
+                None if timeout is None else timeout - hedge_after,
+            )
+        )
+        if router is not None:
+            def release_hedge(task: asyncio.Task):
+                # a hedge cancelled because the primary won is not an endpoint error
+                failed = not task.cancelled() and (task.exception() is not None or "error" in task.result())
+                router.release(provider, model, latency=time.time() - hedge_start, error=failed)
+
+            hedge.add_done_callback(release_hedge)
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and "error" not in task.result():
+                        if task is hedge:
+                            self.metadata["hedge_won"] = True
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        request_url: str,
+        request_header: dict,
+        stream: bool,
+        early_resolve: bool,
+        timeout: Optional[float],
+    ) -> dict:
+        """Sends the request once and returns the (rebuilt) response payload."""
+        client_timeout = aiohttp.ClientTimeout(total=timeout) if timeout is not None else None
+        if stream:
+            return await self._call_api_streaming(
+                session, request_url, request_header, early_resolve, client_timeout
+            )
+        post_kwargs = {"timeout": client_timeout} if client_timeout is not None else {}
+        async with session.post(
+            url=request_url, headers=request_header, json=self.request_json, **post_kwargs
+        ) as response:
+            self._record_error_status(response)
+            return await response.json()
+
+    async def _call_api_streaming(
+        self,
+        session: aiohttp.ClientSession,
+        request_url: str,
+        request_header: dict,
+        early_resolve: bool,
+        client_timeout: Optional[aiohttp.ClientTimeout] = None,
+    ) -> dict:
+        """
+        Sends the request with streaming enabled and rebuilds the non-streamed response payload.
+
+        If early resolution is enabled and the request forces a structured output, the stream is
+        closed as soon as every required field of the output schema has been received; the
+        metadata of the request is then flagged with `early_resolved`. The usage the provider
+        reports at the end of the stream is then estimated, and flagged with `usage_estimated`.
+        """
+        accumulator = create_stream_accumulator(request_url)
+        payload = {**self.request_json, "stream": True}
+        if isinstance(accumulator, OpenAIStreamAccumulator):
+            payload["stream_options"] = {"include_usage": True}
+        required_fields = required_fields_from_request(self.request_json) if early_resolve else None
+        early_resolved = False
+        post_kwargs = {"timeout": client_timeout} if client_timeout is not None else {}
+        async with session.post(url=request_url, headers=request_header, json=payload, **post_kwargs) as response:
+            self._record_error_status(response)
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # error responses and servers without streaming support answer with plain JSON
+                return await response.json(content_type=None)
+            async for event in iter_sse_events(response):
+                accumulator.feed(event)
+                if accumulator.error:
+                    break
+                if required_fields and accumulator.parser.has_fields(required_fields):
+                    early_resolved = True
+                    # drop the rest of the stream, the connection is not reused
+                    response.close()
+                    break
+        if early_resolved:
+            self.metadata["early_resolved"] = True
+            prompt_tokens = estimate_tokens(json.dumps([self.request_json.get("system"), self.request_json.get("messages")], default=str))
+            if accumulator.fill_missing_usage(prompt_tokens, estimate_tokens(accumulator.parser.text)):
+                self.metadata["usage_estimated"] = True
+        return accumulator.to_response(early_resolved=early_resolved)
+
 
 # functions
 
+def hedge_delay(
+    api_cfg: OAIApiFromFileConfig,
+    router: Optional[InferenceRouter],
+    provider: Optional[str],
+    model: Optional[str],
+) -> Optional[float]:
+    """
+    Returns the number of seconds after which a request should be hedged, or None to not hedge.
+
+    An explicit `hedge_after` wins; otherwise the router's observed p95 latency of the endpoint
+    is used once enough samples have been collected.
+    """
+    if not api_cfg.hedge:
+        return None
+    if api_cfg.hedge_after is not None:
+        return api_cfg.hedge_after
+    if router is None:
+        return None
+    stats = router.get_stats(provider, model)
+    if stats.num_samples < router.min_samples:
+        return None
+    return stats.p95
+
+
 def api_endpoint_from_url(request_url: str) -> str:
     """
     Extracts the API endpoint from a given request URL.
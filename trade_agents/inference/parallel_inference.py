@@ -1,10 +1,21 @@
 import asyncio
+import functools
 import json
-from typing import List, Dict, Any, Optional, Literal
+import uuid
+from collections import deque
+from typing import Deque, List, Dict, Any, Optional, Literal, Tuple
 from pydantic import BaseModel, Field, ValidationError
-from .message_models import LLMPromptContext, LLMOutput
+from .message_models import LLMPromptContext, LLMOutput, UsageTotals
 from .clients_models import AnthropicRequest, OpenAIRequest, VLLMRequest
-from .oai_parallel import process_api_requests_from_file, OAIApiFromFileConfig
+from .oai_parallel import process_api_requests_from_file, OAIApiFromFileConfig, RateLimiter
+from .batch_api import process_batch_requests_from_file, BatchApiFromFileConfig
+from .prefix_batching import process_prefix_batched_requests_from_file, PrefixBatchStats
+from .local_backend import LocalBackend
+from .metrics import InferenceMetrics
+from .coalescing import RequestCoalescer
+from .micro_batching import MicroBatcher
+from .retry import RetryPolicy
+from .routing import InferenceRouter
 import os
 from dotenv import load_dotenv
 import time
@@ -15,6 +26,9 @@ from anthropic.types.message_create_params import ToolChoiceToolChoiceTool
 import openai
 import anthropic
 
+# prefix sharing statistics kept for the most recent vLLM batches
+PREFIX_BATCH_STATS_WINDOW = 1000
+
 
 class RequestLimits(BaseModel):
     max_requests_per_minute: int = Field(default=50,description="The maximum number of requests per minute for the API")
@@ -27,7 +41,24 @@ class ParallelAIUtilities:
                  vllm_request_limits: Optional[RequestLimits] = None,
                  litellm_request_limits: Optional[RequestLimits] = None,
                  local_cache: bool = True,
-                 cache_folder: Optional[str] = None):
+                 cache_folder: Optional[str] = None,
+                 coalesce_requests: bool = True,
+                 stream: bool = False,
+                 early_resolve: bool = True,
+                 router: Optional[InferenceRouter] = None,
+                 adaptive_routing: bool = True,
+                 request_timeout: Optional[float] = None,
+                 hedge_requests: bool = False,
+                 hedge_after: Optional[float] = None,
+                 inference_mode: Literal["online", "batch"] = "online",
+                 batch_poll_interval: float = 30.0,
+                 batch_max_wait: Optional[float] = None,
+                 vllm_prefix_batching: bool = False,
+                 vllm_min_shared_prefix: int = 256,
+                 local_backend: Optional[LocalBackend] = None,
+                 retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+                 micro_batch_window: float = 0.01,
+                 micro_batch_max_size: int = 256):
         load_dotenv()
         self.openai_key = os.getenv("OPENAI_KEY")
         self.anthropic_key = os.getenv("ANTHROPIC_API_KEY")
@@ -35,13 +66,43 @@ class ParallelAIUtilities:
         self.vllm_endpoint = os.getenv("VLLM_ENDPOINT", "http://localhost:8000/v1/chat/completions")
         self.litellm_endpoint = os.getenv("LITELLM_ENDPOINT", "http://localhost:8000/v1/chat/completions")
         self.litellm_key = os.getenv("LITELLM_API_KEY")
+        self.openai_batch_url = os.getenv("OPENAI_BATCH_API_BASE", "https://api.openai.com/v1")
+        self.anthropic_batch_url = os.getenv("ANTHROPIC_BATCH_API_BASE", "https://api.anthropic.com/v1")
         self.oai_request_limits = oai_request_limits if oai_request_limits else RequestLimits(max_requests_per_minute=500,max_tokens_per_minute=200000,provider="openai")
         self.anthropic_request_limits = anthropic_request_limits if anthropic_request_limits else RequestLimits(max_requests_per_minute=50,max_tokens_per_minute=40000,provider="anthropic")
         self.vllm_request_limits = vllm_request_limits if vllm_request_limits else RequestLimits(max_requests_per_minute=500,max_tokens_per_minute=200000,provider="vllm")
         self.litellm_request_limits = litellm_request_limits if litellm_request_limits else RequestLimits(max_requests_per_minute=500,max_tokens_per_minute=200000,provider="litellm")
+        # one budget per provider, shared by every concurrent batch of this instance
+        self.rate_limiters = {
+            provider: RateLimiter(limits.max_requests_per_minute, limits.max_tokens_per_minute)
+            for provider, limits in (("openai", self.oai_request_limits), ("anthropic", self.anthropic_request_limits),
+                                     ("vllm", self.vllm_request_limits), ("litellm", self.litellm_request_limits))
+        }
         self.local_cache = local_cache
         self.cache_folder = self._setup_cache_folder(cache_folder)
         self.all_requests = []
+        self.coalescer = RequestCoalescer() if coalesce_requests else None
+        self.stream = stream
+        self.early_resolve = early_resolve
+        self.router = router if router is not None else (InferenceRouter() if adaptive_routing else None)
+        self.request_timeout = request_timeout
+        self.hedge_requests = hedge_requests
+        self.hedge_after = hedge_after
+        self.inference_mode = inference_mode
+        self.batch_poll_interval = batch_poll_interval
+        self.batch_max_wait = batch_max_wait
+        self.usage = UsageTotals()
+        self.vllm_prefix_batching = vllm_prefix_batching
+        self.vllm_min_shared_prefix = vllm_min_shared_prefix
+        self.prefix_batch_stats: Deque[PrefixBatchStats] = deque(maxlen=PREFIX_BATCH_STATS_WINDOW)
+        self.local_backend = local_backend
+        self.metrics = InferenceMetrics()
+        self.retry_policies = retry_policies
+        self.micro_batcher = MicroBatcher(
+            lambda prompts, update_history: self.run_parallel_ai_completion(prompts, update_history=update_history),
+            window=micro_batch_window,
+            max_batch_size=micro_batch_max_size,
+        )
 
     def _setup_cache_folder(self, cache_folder: Optional[str]) -> str:
         if cache_folder:
@@ -63,91 +124,178 @@ class ParallelAIUtilities:
             prompt_hashmap[output.source_id].add_chat_turn_history(output)
         return list(prompt_hashmap.values())
 
-    async def run_parallel_ai_completion(self, prompts: List[LLMPromptContext], update_history:bool=True) -> List[LLMOutput]:
+    async def run_parallel_ai_completion(self, prompts: List[LLMPromptContext], update_history:bool=True, deadline: Optional[float] = None,
+                                         labels: Optional[Dict[str, Any]] = None) -> List[LLMOutput]:
+        """
+        Run the prompts against their providers in parallel.
+
+        If a deadline (unix time) is given, requests that have not completed by then are
+        returned as `deadline exceeded` errors instead of being retried. The `labels` of the
+        caller (environment, phase, round) are attached to the batch in `self.metrics`.
+        """
+        batch_start = time.monotonic()
+        if self.router is not None:
+            self.router.route(prompts)
+        dispatch = functools.partial(self._run_provider_completions, deadline=deadline)
+        if self.coalescer is not None:
+            flattened_results = await self.coalescer.run(prompts, self._request_key, dispatch)
+        else:
+            flattened_results = await dispatch(prompts)
+        
+        # Track  requests
+        self.all_requests.extend(flattened_results)
+        self._record_usage(flattened_results)
+        self.metrics.record_batch(flattened_results, time.monotonic() - batch_start, labels)
+        
+        if update_history:
+            prompts = self._update_prompt_history(prompts, flattened_results)
+        
+        return flattened_results
+
+    async def run_ai_completion(self, prompt: LLMPromptContext, update_history: bool = True) -> Optional[LLMOutput]:
+        """
+        Run a single prompt, micro-batched with the other prompts submitted within `micro_batch_window`.
+
+        Used by agents calling `execute()` directly, so that concurrent calls share one batch.
+        """
+        return await self.micro_batcher.submit(prompt, update_history=update_history)
+
+    def _request_key(self, prompt: LLMPromptContext) -> Optional[str]:
+        """Canonical key of the provider request a prompt would send, used to coalesce identical requests."""
+        client = prompt.llm_config.client
+        try:
+            request = self._convert_prompt_to_request(prompt, client)
+        except Exception:
+            # Invalid requests are not shared, they surface their own error when dispatched
+            return None
+        if request is None:
+            return None
+        return RequestCoalescer.canonical_key(client, request)
+
+    async def _run_provider_completions(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        if self.local_backend is not None:
+            return await self._run_local_completion(prompts, deadline)
         openai_prompts = [p for p in prompts if p.llm_config.client == "openai"]
         anthropic_prompts = [p for p in prompts if p.llm_config.client == "anthropic"]
         vllm_prompts = [p for p in prompts if p.llm_config.client == "vllm"] 
         litellm_prompts = [p for p in prompts if p.llm_config.client == "litellm"]
         tasks = []
         if openai_prompts:
-            tasks.append(self._run_openai_completion(openai_prompts))
+            tasks.append(self._run_openai_completion(openai_prompts, deadline))
         if anthropic_prompts:
-            tasks.append(self._run_anthropic_completion(anthropic_prompts))
+            tasks.append(self._run_anthropic_completion(anthropic_prompts, deadline))
         if vllm_prompts:
-            tasks.append(self._run_vllm_completion(vllm_prompts))
+            tasks.append(self._run_vllm_completion(vllm_prompts, deadline))
         if litellm_prompts:
-            tasks.append(self._run_litellm_completion(litellm_prompts))
+            tasks.append(self._run_litellm_completion(litellm_prompts, deadline))
 
         results = await asyncio.gather(*tasks)
-        flattened_results = [item for sublist in results for item in sublist]
-        
-        # Track  requests
-        self.all_requests.extend(flattened_results)
-        
-        if update_history:
-            prompts = self._update_prompt_history(prompts, flattened_results)
-        
-        return flattened_results
+        return [item for sublist in results for item in sublist]
     
+    async def _run_local_completion(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        """Complete the prompts with the in-process backend, in each prompt's provider wire format."""
+        async def complete(prompt: LLMPromptContext) -> Optional[LLMOutput]:
+            client = prompt.llm_config.client
+            start_time = time.time()
+            try:
+                request = self._convert_prompt_to_request(prompt, client)
+            except Exception as e:
+                return LLMOutput(raw_result={"error": str(e)}, completion_kwargs={}, start_time=start_time, end_time=time.time(), source_id=prompt.id, client=client)
+            if request is None:
+                return None
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            # the backend bounds its concurrency across batches
+            try:
+                response = await asyncio.wait_for(self.local_backend.complete(request, client), timeout)
+            except asyncio.TimeoutError:
+                response = {"error": "deadline exceeded"}
+            return LLMOutput(raw_result=response, completion_kwargs=request, start_time=start_time, end_time=time.time(), source_id=prompt.id, client=client)
+
+        results = await asyncio.gather(*(complete(prompt) for prompt in prompts))
+        return [result for result in results if result is not None]
+
+    def _record_usage(self, outputs: List[LLMOutput]):
+        # coalesced outputs share the raw result of their leader, count each upstream call once
+        seen = set()
+        for output in outputs:
+            if id(output.raw_result) in seen:
+                continue
+            seen.add(id(output.raw_result))
+            estimated = bool((output.request_metadata or {}).get("usage_estimated"))
+            self.usage.add(output.usage, provider=output.result_provider, estimated=estimated)
+
+    def usage_summary(self) -> Dict[str, Any]:
+        """Token usage of every completion run so far, with prompt cache reads and writes."""
+        return self.usage.model_dump()
+
     def get_all_requests(self):
         requests = self.all_requests
         self.all_requests = []  
         return requests
 
-    async def _run_openai_completion(self, prompts: List[LLMPromptContext]) -> List[LLMOutput]:
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        requests_file = os.path.join(self.cache_folder, f'openai_requests_{timestamp}.jsonl')
-        results_file = os.path.join(self.cache_folder, f'openai_results_{timestamp}.jsonl')
+    async def _run_openai_completion(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        requests_file, results_file = self._batch_files("openai")
         self._prepare_requests_file(prompts, "openai", requests_file)
         config = self._create_oai_completion_config(prompts[0], requests_file, results_file)
         if config:
+            config.deadline = deadline
             try:
-                await process_api_requests_from_file(config)
+                if self.inference_mode == "batch":
+                    await process_batch_requests_from_file(self._create_batch_config("openai", config))
+                else:
+                    await process_api_requests_from_file(config, router=self.router, provider="openai", rate_limiter=self.rate_limiters.get("openai"))
                 return self._parse_results_file(results_file,client="openai")
             finally:
                 if not self.local_cache:
                     self._delete_files(requests_file, results_file)
         return []
 
-    async def _run_anthropic_completion(self, prompts: List[LLMPromptContext]) -> List[LLMOutput]:
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        requests_file = os.path.join(self.cache_folder, f'anthropic_requests_{timestamp}.jsonl')
-        results_file = os.path.join(self.cache_folder, f'anthropic_results_{timestamp}.jsonl')
+    async def _run_anthropic_completion(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        requests_file, results_file = self._batch_files("anthropic")
         self._prepare_requests_file(prompts, "anthropic", requests_file)
         config = self._create_anthropic_completion_config(prompts[0], requests_file, results_file)
         if config:
+            config.deadline = deadline
             try:
-                await process_api_requests_from_file(config)
+                if self.inference_mode == "batch":
+                    await process_batch_requests_from_file(self._create_batch_config("anthropic", config))
+                else:
+                    await process_api_requests_from_file(config, router=self.router, provider="anthropic", rate_limiter=self.rate_limiters.get("anthropic"))
                 return self._parse_results_file(results_file,client="anthropic")
             finally:
                 if not self.local_cache:
                     self._delete_files(requests_file, results_file)
         return []
     
-    async def _run_vllm_completion(self, prompts: List[LLMPromptContext]) -> List[LLMOutput]:
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        requests_file = os.path.join(self.cache_folder, f'vllm_requests_{timestamp}.jsonl')
-        results_file = os.path.join(self.cache_folder, f'vllm_results_{timestamp}.jsonl')
+    async def _run_vllm_completion(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        requests_file, results_file = self._batch_files("vllm")
         self._prepare_requests_file(prompts, "vllm", requests_file)
         config = self._create_vllm_completion_config(prompts[0], requests_file, results_file)
         if config:
+            config.deadline = deadline
             try:
-                await process_api_requests_from_file(config)
+                if self.vllm_prefix_batching:
+                    stats = await process_prefix_batched_requests_from_file(
+                        config, router=self.router, provider="vllm", min_prefix_chars=self.vllm_min_shared_prefix,
+                        rate_limiter=self.rate_limiters.get("vllm")
+                    )
+                    self.prefix_batch_stats.append(stats)
+                else:
+                    await process_api_requests_from_file(config, router=self.router, provider="vllm", rate_limiter=self.rate_limiters.get("vllm"))
                 return self._parse_results_file(results_file,client="vllm")
             finally:
                 if not self.local_cache:
                     self._delete_files(requests_file, results_file)
         return []
     
-    async def _run_litellm_completion(self, prompts: List[LLMPromptContext]) -> List[LLMOutput]:
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        requests_file = os.path.join(self.cache_folder, f'litellm_requests_{timestamp}.jsonl')
-        results_file = os.path.join(self.cache_folder, f'litellm_results_{timestamp}.jsonl')
+    async def _run_litellm_completion(self, prompts: List[LLMPromptContext], deadline: Optional[float] = None) -> List[LLMOutput]:
+        requests_file, results_file = self._batch_files("litellm")
         self._prepare_requests_file(prompts, "litellm", requests_file)
         config = self._create_litellm_completion_config(prompts[0], requests_file, results_file)
         if config:
+            config.deadline = deadline
             try:
-                await process_api_requests_from_file(config)
+                await process_api_requests_from_file(config, router=self.router, provider="litellm", rate_limiter=self.rate_limiters.get("litellm"))
                 return self._parse_results_file(results_file,client="litellm")
             finally:
                 if not self.local_cache:
@@ -156,6 +304,12 @@ class ParallelAIUtilities:
 
     
 
+    def _batch_files(self, client: str) -> Tuple[str, str]:
+        """Requests and results files of one batch; the suffix keeps concurrent batches of the same second apart."""
+        batch_name = f'{time.strftime("%Y-%m-%d_%H-%M-%S")}_{uuid.uuid4().hex[:8]}'
+        return (os.path.join(self.cache_folder, f'{client}_requests_{batch_name}.jsonl'),
+                os.path.join(self.cache_folder, f'{client}_results_{batch_name}.jsonl'))
+
     def _prepare_requests_file(self, prompts: List[LLMPromptContext], client: str, filename: str):
         requests = []
         for prompt in prompts:
@@ -278,6 +432,10 @@ class ParallelAIUtilities:
         return self._get_openai_request(prompt)
         
     def _convert_prompt_to_request(self, prompt: LLMPromptContext, client: str) -> Optional[Dict[str, Any]]:
+        """Compiled request of a prompt, built and validated once and then reused until the prompt changes."""
+        return prompt.compile_request(client, lambda: self._build_request(prompt, client))
+
+    def _build_request(self, prompt: LLMPromptContext, client: str) -> Optional[Dict[str, Any]]:
         if client == "openai":
             return self._get_openai_request(prompt)
         elif client == "anthropic":
@@ -302,6 +460,12 @@ class ParallelAIUtilities:
                 token_encoding_name="cl100k_base",
                 max_attempts=5,
                 logging_level=20,
+                stream=self.stream,
+                early_resolve=self.early_resolve,
+                request_timeout=self.request_timeout,
+                hedge=self.hedge_requests,
+                hedge_after=self.hedge_after,
+                retry_policies=self.retry_policies,
             )
         return None
 
@@ -317,6 +481,12 @@ class ParallelAIUtilities:
                 token_encoding_name="cl100k_base",
                 max_attempts=5,
                 logging_level=20,
+                stream=self.stream,
+                early_resolve=self.early_resolve,
+                request_timeout=self.request_timeout,
+                hedge=self.hedge_requests,
+                hedge_after=self.hedge_after,
+                retry_policies=self.retry_policies,
             )
         return None
     
@@ -332,6 +502,12 @@ class ParallelAIUtilities:
                 token_encoding_name="cl100k_base",
                 max_attempts=5,
                 logging_level=20,
+                stream=self.stream,
+                early_resolve=self.early_resolve,
+                request_timeout=self.request_timeout,
+                hedge=self.hedge_requests,
+                hedge_after=self.hedge_after,
+                retry_policies=self.retry_policies,
             )
         return None
     
@@ -347,10 +523,28 @@ class ParallelAIUtilities:
                 token_encoding_name="cl100k_base",
                 max_attempts=5,
                 logging_level=20,
+                stream=self.stream,
+                early_resolve=self.early_resolve,
+                request_timeout=self.request_timeout,
+                hedge=self.hedge_requests,
+                hedge_after=self.hedge_after,
+                retry_policies=self.retry_policies,
             )
         return None
     
 
+    def _create_batch_config(self, provider: Literal["openai", "anthropic"], config: OAIApiFromFileConfig) -> BatchApiFromFileConfig:
+        return BatchApiFromFileConfig(
+            requests_filepath=config.requests_filepath,
+            save_filepath=config.save_filepath,
+            api_key=config.api_key,
+            provider=provider,
+            base_url=self.openai_batch_url if provider == "openai" else self.anthropic_batch_url,
+            poll_interval=self.batch_poll_interval,
+            max_wait=self.batch_max_wait,
+            logging_level=config.logging_level,
+        )
+
     def _parse_results_file(self, filepath: str,client: Literal["openai", "anthropic", "vllm", "litellm"]) -> List[LLMOutput]:
         results = []
         with open(filepath, 'r') as f:
@@ -376,7 +570,8 @@ class ParallelAIUtilities:
             start_time=metadata["start_time"],
             end_time=metadata["end_time"] or time.time(),
             source_id=metadata["prompt_context_id"],
-            client=client
+            client=client,
+            request_metadata=metadata
         )
 
     def _delete_files(self, *files):
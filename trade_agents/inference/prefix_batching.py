@@ -0,0 +1,164 @@
+"""
+Shared-prefix dispatch for local vLLM servers.
+
+vLLM's automatic prefix caching reuses the KV blocks of a prompt prefix that an earlier
+request already computed. Agents of a simulation send prompts sharing the system
+template, the market rules and the same environment state, so requests are sorted to
+make shared prefixes adjacent and grouped. The leader of every group is dispatched
+first; once the leaders have completed, their prefixes are cached and the rest of each
+group is dispatched in prefix order.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, computed_field
+
+from trade_agents.inference.oai_parallel import OAIApiFromFileConfig, RateLimiter, process_api_requests_from_file
+from trade_agents.inference.routing import InferenceRouter
+
+logger = logging.getLogger(__name__)
+
+RequestEntry = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+def request_prefix_text(request: Dict[str, Any]) -> str:
+    """Text a chat request is tokenized from, in order, with the role of every message."""
+    parts = []
+    for message in request.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+        parts.append(f"<|{message.get('role')}|>{content or ''}")
+    return "".join(parts)
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+class PrefixGroup(BaseModel):
+    entries: List[Any]
+    shared_prefix_chars: int = 0
+
+
+class PrefixBatchStats(BaseModel):
+    """Prefix sharing of one dispatched batch, estimated from the prompts and measured from server usage."""
+    num_requests: int = 0
+    num_groups: int = 0
+    prompt_chars: int = 0
+    shared_prefix_chars: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: Optional[int] = None
+
+    @computed_field
+    @property
+    def estimated_hit_rate(self) -> float:
+        """Share of the prompt characters that follow a prefix an earlier request of the batch computed."""
+        return self.shared_prefix_chars / self.prompt_chars if self.prompt_chars else 0.0
+
+    @computed_field
+    @property
+    def measured_hit_rate(self) -> Optional[float]:
+        """Cached prompt tokens reported by the server, if it reports prompt token details."""
+        if self.cached_prompt_tokens is None or not self.prompt_tokens:
+            return None
+        return self.cached_prompt_tokens / self.prompt_tokens
+
+
+def group_by_shared_prefix(entries: List[RequestEntry], min_prefix_chars: int = 256) -> Tuple[List[PrefixGroup], PrefixBatchStats]:
+    """
+    Sort requests by prompt text and split them into groups sharing at least `min_prefix_chars`.
+
+    In sorted order the longest prefix a request shares with any other request is the one it
+    shares with a neighbour, so one pass over adjacent pairs is enough.
+    """
+    stats = PrefixBatchStats(num_requests=len(entries))
+    if not entries:
+        return [], stats
+    texts = [request_prefix_text(request) for _, request in entries]
+    order = sorted(range(len(entries)), key=texts.__getitem__)
+    stats.prompt_chars = sum(len(text) for text in texts)
+
+    groups: List[PrefixGroup] = []
+    previous = None
+    for index in order:
+        shared = common_prefix_length(texts[previous], texts[index]) if previous is not None else 0
+        if groups and shared >= min_prefix_chars:
+            group = groups[-1]
+            group.shared_prefix_chars = min(group.shared_prefix_chars, shared) if len(group.entries) > 1 else shared
+            group.entries.append(entries[index])
+            stats.shared_prefix_chars += shared
+        else:
+            groups.append(PrefixGroup(entries=[entries[index]]))
+        previous = index
+    stats.num_groups = len(groups)
+    return groups, stats
+
+
+def _write_entries(filepath: str, entries: List[RequestEntry]):
+    with open(filepath, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _measure_cached_tokens(save_filepath: str, stats: PrefixBatchStats):
+    if not os.path.exists(save_filepath):
+        return
+    with open(save_filepath) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            response = json.loads(line)[-1]
+            usage = response.get("usage") if isinstance(response, dict) else None
+            if not usage:
+                continue
+            stats.prompt_tokens += usage.get("prompt_tokens", 0)
+            details = usage.get("prompt_tokens_details") or {}
+            if details.get("cached_tokens") is not None:
+                stats.cached_prompt_tokens = (stats.cached_prompt_tokens or 0) + details["cached_tokens"]
+
+
+async def process_prefix_batched_requests_from_file(
+        api_cfg: OAIApiFromFileConfig,
+        router: Optional[InferenceRouter] = None,
+        provider: Optional[str] = "vllm",
+        min_prefix_chars: int = 256,
+        rate_limiter: Optional[RateLimiter] = None,
+) -> PrefixBatchStats:
+    """
+    Run a requests file in two waves ordered by shared prompt prefix and return the prefix statistics.
+
+    The first wave holds the leader of every prefix group (and the requests that share no
+    prefix), the second the remaining members of the groups in prefix order. Both waves
+    append to the same results file as `process_api_requests_from_file`.
+    """
+    with open(api_cfg.requests_filepath) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    groups, stats = group_by_shared_prefix(entries, min_prefix_chars=min_prefix_chars)
+    leaders = [group.entries[0] for group in groups]
+    followers = [entry for group in groups for entry in group.entries[1:]]
+
+    base, ext = os.path.splitext(api_cfg.requests_filepath)
+    waves = [(f"{base}_leaders{ext}", leaders), (f"{base}_followers{ext}", followers)]
+    try:
+        for wave_filepath, wave_entries in waves:
+            if not wave_entries:
+                continue
+            _write_entries(wave_filepath, wave_entries)
+            wave_cfg = api_cfg.model_copy(update={"requests_filepath": wave_filepath})
+            await process_api_requests_from_file(wave_cfg, router=router, provider=provider, rate_limiter=rate_limiter)
+    finally:
+        for wave_filepath, _ in waves:
+            if os.path.exists(wave_filepath):
+                os.remove(wave_filepath)
+
+    _measure_cached_tokens(api_cfg.save_filepath, stats)
+    logger.info(
+        f"Prefix batch: {stats.num_requests} requests in {stats.num_groups} groups, "
+        f"estimated prefix hit rate {stats.estimated_hit_rate:.1%}"
+        + (f", measured {stats.measured_hit_rate:.1%}" if stats.measured_hit_rate is not None else "")
+    )
+    return stats
@@ -0,0 +1,45 @@
+"""
+Process-wide registry of shared inference clients.
+
+Agents and orchestrators share one `ParallelAIUtilities` so that they share its per-provider
+rate limiters, adaptive router, request coalescer and usage accounting, and so that creating
+an agent does no I/O (loading `.env`, creating the cache folder). The orchestrator registers
+the client it configured; agents created without one get the default client on first use.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+from trade_agents.inference.parallel_inference import ParallelAIUtilities
+
+DEFAULT_CLIENT = "default"
+
+_clients: Dict[str, ParallelAIUtilities] = {}
+_lock = threading.Lock()
+
+
+def get_ai_utilities(name: str = DEFAULT_CLIENT, **kwargs: Any) -> ParallelAIUtilities:
+    """Shared client registered under `name`, created with `kwargs` on first use."""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = ParallelAIUtilities(**kwargs)
+    return client
+
+
+def register_ai_utilities(client: ParallelAIUtilities, name: str = DEFAULT_CLIENT) -> ParallelAIUtilities:
+    """Make `client` the shared client of `name`, e.g. the one an orchestrator configured."""
+    with _lock:
+        _clients[name] = client
+    return client
+
+
+def clear_ai_utilities(name: Optional[str] = None):
+    """Forget one shared client, or all of them."""
+    with _lock:
+        if name is None:
+            _clients.clear()
+        else:
+            _clients.pop(name, None)
@@ -0,0 +1,148 @@
+"""
+Retry policies of the parallel request processor.
+
+Failed attempts are classified from their HTTP status, the provider's error payload or the
+exception raised. Every error class has its own exponential backoff with full jitter, rate
+limit and overload errors honor the server's Retry-After header, and invalid requests
+(4xx validation and authentication errors) are not retried at all.
+
+Requests waiting for their backoff sit in a `RetryQueue` ordered by the time they become
+ready, so fresh requests keep being dispatched while they wait.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import aiohttp
+from pydantic import BaseModel, Field
+
+ERROR_CLASSES = ("rate_limit", "overloaded", "server", "timeout", "connection", "validation", "auth", "other")
+
+
+class RetryPolicy(BaseModel):
+    """Backoff of one error class: full jitter over `base_delay * multiplier ** (retry - 1)`, capped at `max_delay`."""
+    retry: bool = Field(True, description="Whether errors of this class are retried at all")
+    base_delay: float = Field(1.0, description="Backoff cap of the first retry in seconds")
+    max_delay: float = Field(30.0, description="Upper bound of the backoff cap in seconds")
+    multiplier: float = Field(2.0, description="Growth of the backoff cap per retry")
+    honor_retry_after: bool = Field(False, description="Wait at least the Retry-After the server sent")
+
+    def backoff(self, retry_number: int, retry_after: Optional[float] = None, rng: random.Random = random) -> float:
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** max(0, retry_number - 1))
+        delay = rng.uniform(0, cap)
+        if self.honor_retry_after and retry_after is not None:
+            # the server's wait is a floor, the jitter spreads the retries of concurrent requests
+            delay = retry_after + rng.uniform(0, self.base_delay)
+        return delay
+
+
+def default_retry_policies() -> Dict[str, RetryPolicy]:
+    return {
+        "rate_limit": RetryPolicy(base_delay=2.0, max_delay=60.0, honor_retry_after=True),
+        "overloaded": RetryPolicy(base_delay=1.0, max_delay=30.0, honor_retry_after=True),
+        "server": RetryPolicy(base_delay=0.5, max_delay=20.0, honor_retry_after=True),
+        "timeout": RetryPolicy(base_delay=0.25, max_delay=10.0),
+        "connection": RetryPolicy(base_delay=0.25, max_delay=10.0),
+        "validation": RetryPolicy(retry=False),
+        "auth": RetryPolicy(retry=False),
+        "other": RetryPolicy(base_delay=1.0, max_delay=20.0),
+    }
+
+
+DEFAULT_RETRY_POLICIES = default_retry_policies()
+
+
+def retry_policy_for(error_class: str, policies: Optional[Dict[str, RetryPolicy]] = None) -> RetryPolicy:
+    """Configured policy of an error class, falling back to the default policy of the class."""
+    if policies and error_class in policies:
+        return policies[error_class]
+    return DEFAULT_RETRY_POLICIES.get(error_class, DEFAULT_RETRY_POLICIES["other"])
+
+
+def is_rate_limit_error(response: dict) -> bool:
+    """Whether an error payload (OpenAI-compatible or Anthropic) reports a rate limit."""
+    error = response.get("error")
+    if not isinstance(error, dict):
+        return False
+    if error.get("type") in ("rate_limit_error", "overloaded_error") or error.get("code") in ("rate_limit_exceeded", 429, "429"):
+        return True
+    return "rate limit" in str(error.get("message", "")).lower()
+
+
+def classify_error(error: Any, status: Optional[int] = None) -> str:
+    """
+    Error class of a failed attempt, one of `ERROR_CLASSES`.
+
+    `error` is the error payload of the response or the exception raised by the attempt;
+    `status` the HTTP status of the response, if one was received.
+    """
+    if status is None and isinstance(error, aiohttp.ClientResponseError):
+        status = error.status
+    payload = error.get("error") if isinstance(error, dict) else None
+    error_type = payload.get("type") if isinstance(payload, dict) else None
+    if status == 429 or (error_type != "overloaded_error" and isinstance(error, dict) and is_rate_limit_error(error)):
+        return "rate_limit"
+    if status in (503, 529) or error_type == "overloaded_error":
+        return "overloaded"
+    if (status is not None and status >= 500) or error_type in ("api_error", "server_error"):
+        return "server"
+    if status in (401, 403) or error_type in ("authentication_error", "permission_error"):
+        return "auth"
+    if status == 408 or isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if (status is not None and 400 <= status < 500) or error_type in ("invalid_request_error", "not_found_error", "request_too_large"):
+        return "validation"
+    if isinstance(error, aiohttp.ClientError):
+        return "connection"
+    return "other"
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from the `retry-after-ms` or `Retry-After` (seconds or HTTP date) response headers."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryQueue:
+    """Requests waiting for their backoff, handed out in the order they become ready."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter = itertools.count()
+
+    def put(self, item: Any, delay: float = 0.0):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item))
+
+    def has_ready(self) -> bool:
+        return bool(self._heap) and self._heap[0][0] <= time.monotonic()
+
+    def pop_ready(self) -> Optional[Any]:
+        if not self.has_ready():
+            return None
+        return heapq.heappop(self._heap)[2]
+
+    def empty(self) -> bool:
+        return not self._heap
+
+    def __len__(self) -> int:
+        return len(self._heap)
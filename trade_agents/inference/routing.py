@@ -0,0 +1,227 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from trade_agents.inference.message_models import LLMConfig, LLMPromptContext
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+class EndpointStats:
+    """
+    Rolling latency and error statistics of one provider/model endpoint.
+
+    Only the last `window` attempts are kept so that the statistics follow the
+    current behaviour of the endpoint rather than its whole history.
+    """
+
+    def __init__(self, window: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (error, rate_limited)
+        self.in_flight = 0
+
+    def record(self, latency: float, error: bool = False, rate_limited: bool = False):
+        self._outcomes.append((error or rate_limited, rate_limited))
+        if not error and not rate_limited:
+            self._latencies.append(latency)
+
+    @property
+    def num_samples(self) -> int:
+        return len(self._outcomes)
+
+    @property
+    def p50(self) -> Optional[float]:
+        return percentile(list(self._latencies), 50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return percentile(list(self._latencies), 95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for error, _ in self._outcomes if error) / len(self._outcomes)
+
+    @property
+    def rate_limit_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, rate_limited in self._outcomes if rate_limited) / len(self._outcomes)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "samples": self.num_samples,
+            "in_flight": self.in_flight,
+            "p50": self.p50,
+            "p95": self.p95,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+        }
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent requests.
+
+    Each success while the limit is saturated raises the limit by 1/limit (about
+    +1 per window of requests); a rate limit or transport error multiplies it by
+    `backoff`. Decreases are applied at most once per `cooldown` seconds so that
+    a burst of 429s from one window only halves the limit once.
+    """
+
+    def __init__(self, initial_limit: float = 64, min_limit: float = 1, max_limit: float = 512,
+                 backoff: float = 0.5, cooldown: float = 1.0):
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, success: bool, overloaded: bool = False):
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight = max(0, self.in_flight - 1)
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif success and saturated:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class InferenceRouter:
+    """
+    Tracks per provider/model latency and error rates and routes prompts accordingly.
+
+    Every request dispatched by `process_api_requests_from_file` is gated by the
+    AIMD limiter of its endpoint and recorded in its rolling statistics. Prompts
+    whose LLMConfig declares a `fallback_pool` are routed to the fastest healthy
+    member of the pool before dispatch.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 5, max_error_rate: float = 0.5,
+                 max_rate_limit_rate: float = 0.2, initial_concurrency: float = 64,
+                 max_concurrency: float = 512):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_rate_limit_rate = max_rate_limit_rate
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.stats: Dict[Tuple[str, str], EndpointStats] = {}
+        self.limiters: Dict[Tuple[str, str], AIMDConcurrencyLimiter] = {}
+
+    @staticmethod
+    def endpoint_key(client: str, model: Optional[str]) -> Tuple[str, str]:
+        return client, model or ""
+
+    def get_stats(self, client: str, model: Optional[str]) -> EndpointStats:
+        key = self.endpoint_key(client, model)
+        if key not in self.stats:
+            self.stats[key] = EndpointStats(window=self.window)
+        return self.stats[key]
+
+    def get_limiter(self, client: str, model: Optional[str]) -> AIMDConcurrencyLimiter:
+        key = self.endpoint_key(client, model)
+        if key not in self.limiters:
+            self.limiters[key] = AIMDConcurrencyLimiter(initial_limit=self.initial_concurrency, max_limit=self.max_concurrency)
+        return self.limiters[key]
+
+    def try_acquire(self, client: str, model: Optional[str]) -> bool:
+        if not self.get_limiter(client, model).try_acquire():
+            return False
+        self.get_stats(client, model).in_flight += 1
+        return True
+
+    def release(self, client: str, model: Optional[str], latency: float, error: bool = False,
+                rate_limited: bool = False, overloaded: bool = False):
+        """Record the outcome of one attempt and free its concurrency slot."""
+        stats = self.get_stats(client, model)
+        stats.in_flight = max(0, stats.in_flight - 1)
+        stats.record(latency, error=error, rate_limited=rate_limited)
+        self.get_limiter(client, model).release(success=not error and not rate_limited, overloaded=rate_limited or overloaded)
+
+    def is_healthy(self, client: str, model: Optional[str]) -> bool:
+        stats = self.get_stats(client, model)
+        if stats.num_samples < self.min_samples:
+            return True
+        return stats.error_rate <= self.max_error_rate and stats.rate_limit_rate <= self.max_rate_limit_rate
+
+    def expected_latency(self, client: str, model: Optional[str], pending: int = 0) -> float:
+        """p95 latency scaled by how full the endpoint's concurrency window is; 0 for unexplored endpoints."""
+        stats = self.get_stats(client, model)
+        if stats.num_samples < self.min_samples or stats.p95 is None:
+            return 0.0
+        limiter = self.get_limiter(client, model)
+        return stats.p95 * (1 + (stats.in_flight + pending) / max(limiter.limit, 1))
+
+    def select(self, candidates: List[LLMConfig], pending: Optional[Dict[Tuple[str, str], int]] = None) -> LLMConfig:
+        """Pick the fastest healthy candidate, or the least unhealthy one if none is healthy."""
+        pending = pending or {}
+
+        def score(config: LLMConfig) -> Tuple[bool, float]:
+            key = self.endpoint_key(config.client, config.model)
+            return (
+                not self.is_healthy(config.client, config.model),
+                self.expected_latency(config.client, config.model, pending.get(key, 0)),
+            )
+
+        return min(candidates, key=score)
+
+    def route(self, prompts: List[LLMPromptContext]) -> List[LLMPromptContext]:
+        """Replace the llm_config of prompts that have a fallback pool with the best endpoint of the pool."""
+        pending: Dict[Tuple[str, str], int] = {}
+        for prompt in prompts:
+            primary = prompt.llm_config
+            if not primary.fallback_pool:
+                continue
+            candidates = [primary] + [c for c in self._pool_candidates(primary) if c is not None]
+            selected = self.select(candidates, pending)
+            key = self.endpoint_key(selected.client, selected.model)
+            pending[key] = pending.get(key, 0) + 1
+            if selected is not primary:
+                logger.debug(f"Routing prompt {prompt.id} from {primary.client}/{primary.model} to {selected.client}/{selected.model}")
+                prompt.llm_config = selected
+        return prompts
+
+    @staticmethod
+    def _pool_candidates(primary: LLMConfig) -> List[Optional[LLMConfig]]:
+        """Pool members adopting the primary's response format; members that cannot serve it are dropped."""
+        candidates = []
+        for member in primary.fallback_pool or []:
+            try:
+                candidates.append(LLMConfig(**{
+                    **primary.model_dump(exclude={"fallback_pool"}),
+                    "client": member.client,
+                    "model": member.model,
+                    "max_tokens": member.max_tokens,
+                    "temperature": member.temperature,
+                }))
+            except ValueError:
+                candidates.append(None)
+        return candidates
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            f"{client}/{model}": {**stats.summary(), "concurrency_limit": self.get_limiter(client, model).limit}
+            for (client, model), stats in self.stats.items()
+        }
@@ -0,0 +1,312 @@
+"""
+Incremental handling of streamed (server-sent events) chat completions.
+
+OpenAI, vLLM and LiteLLM stream `chat.completion.chunk` objects while Anthropic
+streams typed message events. The accumulators below rebuild the same final
+payload a non-streamed call would have returned, so results files and LLMOutput
+parsing stay unchanged. While accumulating they incrementally parse the JSON of
+the structured output so that the caller can resolve the action as soon as the
+schema-required fields are complete instead of waiting for the end of the stream.
+The usage the dropped end of such a stream would have reported is then estimated.
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aiohttp
+
+
+class IncrementalJSONParser:
+    """
+    Parses the top-level members of a JSON object while it is being streamed.
+
+    A member is only reported once its value is complete, i.e. once the
+    following ',' or the closing '}' of the object has been received, so a
+    number such as `12` is never reported while it could still become `125`.
+    Leading text before the first '{' (for example a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.closed = False
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """Consume the next piece of streamed text and return the completed members so far."""
+        if not text:
+            return self.fields
+        self._buffer += text
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self.closed:
+            ch = buffer[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = i + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_member(buffer[self._member_start:i])
+                    self.closed = True
+            elif ch == "," and self._depth == 1:
+                self._complete_member(buffer[self._member_start:i])
+                self._member_start = i + 1
+            i += 1
+        self._pos = i
+        return self.fields
+
+    def has_fields(self, required: List[str]) -> bool:
+        return bool(required) and all(name in self.fields for name in required)
+
+    def _complete_member(self, member_text: str):
+        member_text = member_text.strip()
+        if not member_text:
+            return
+        try:
+            self.fields.update(json.loads("{" + member_text + "}"))
+        except json.JSONDecodeError:
+            pass
+
+
+def required_fields_from_request(request_json: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Return the required fields of the structured output a request asks for.
+
+    Looks at the forced tool (OpenAI/vLLM `tool_choice.function.name`, Anthropic
+    `tool_choice.name`) and falls back to an OpenAI `json_schema` response format.
+    """
+    tool_choice = request_json.get("tool_choice")
+    tool_name = None
+    if isinstance(tool_choice, dict):
+        tool_name = tool_choice.get("function", {}).get("name") or tool_choice.get("name")
+    if tool_name:
+        for tool in request_json.get("tools") or []:
+            if "function" in tool and tool["function"].get("name") == tool_name:
+                return tool["function"].get("parameters", {}).get("required")
+            if tool.get("name") == tool_name:
+                return tool.get("input_schema", {}).get("required")
+    response_format = request_json.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return response_format.get("json_schema", {}).get("schema", {}).get("required")
+    return None
+
+
+class OpenAIStreamAccumulator:
+    """Rebuilds a `chat.completion` payload from OpenAI-compatible stream chunks."""
+
+    def __init__(self):
+        self.parser = IncrementalJSONParser()
+        self.error: Optional[Dict[str, Any]] = None
+        self._meta: Dict[str, Any] = {}
+        self._content: List[str] = []
+        self._tool_calls: Dict[int, Dict[str, Any]] = {}
+        self._finish_reason: Optional[str] = None
+        self._usage: Optional[Dict[str, Any]] = None
+
+    def feed(self, event: Dict[str, Any]):
+        if "error" in event:
+            self.error = event
+            return
+        for key in ("id", "created", "model", "system_fingerprint"):
+            if event.get(key) is not None:
+                self._meta.setdefault(key, event[key])
+        if event.get("usage"):
+            self._usage = event["usage"]
+        for choice in event.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            delta = choice.get("delta") or {}
+            if delta.get("content"):
+                self._content.append(delta["content"])
+                if not self._tool_calls:
+                    self.parser.feed(delta["content"])
+            for tool_delta in delta.get("tool_calls") or []:
+                self._feed_tool_call(tool_delta)
+            if choice.get("finish_reason"):
+                self._finish_reason = choice["finish_reason"]
+
+    def fill_missing_usage(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        """Use the estimated counts if the usage chunk was not received, returns whether it was missing."""
+        if self._usage:
+            return False
+        self._usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                       "total_tokens": prompt_tokens + completion_tokens}
+        return True
+
+    def _feed_tool_call(self, tool_delta: Dict[str, Any]):
+        index = tool_delta.get("index", 0)
+        tool_call = self._tool_calls.setdefault(index, {"id": None, "type": "function", "name": "", "arguments": []})
+        if tool_delta.get("id"):
+            tool_call["id"] = tool_delta["id"]
+        function = tool_delta.get("function") or {}
+        if function.get("name"):
+            tool_call["name"] += function["name"]
+        if function.get("arguments"):
+            tool_call["arguments"].append(function["arguments"])
+            if index == min(self._tool_calls):
+                self.parser.feed(function["arguments"])
+
+    def to_response(self, early_resolved: bool = False) -> Dict[str, Any]:
+        if self.error:
+            return self.error
+        message: Dict[str, Any] = {"role": "assistant", "content": "".join(self._content) or None}
+        tool_calls = []
+        first_index = min(self._tool_calls) if self._tool_calls else None
+        for index in sorted(self._tool_calls):
+            tool_call = self._tool_calls[index]
+            arguments = "".join(tool_call["arguments"])
+            if early_resolved and index == first_index:
+                arguments = json.dumps(self.parser.fields)
+            tool_calls.append({
+                "id": tool_call["id"] or f"call_{index}",
+                "type": "function",
+                "function": {"name": tool_call["name"], "arguments": arguments},
+            })
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+            if early_resolved:
+                tool_calls[:] = tool_calls[:1]
+        elif early_resolved:
+            message["content"] = json.dumps(self.parser.fields)
+        finish_reason = self._finish_reason or ("tool_calls" if tool_calls else "stop")
+        response = {
+            "id": self._meta.get("id", "chatcmpl-stream"),
+            "object": "chat.completion",
+            "created": self._meta.get("created", 0),
+            "model": self._meta.get("model", ""),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+        }
+        if self._meta.get("system_fingerprint"):
+            response["system_fingerprint"] = self._meta["system_fingerprint"]
+        if self._usage:
+            response["usage"] = self._usage
+        return response
+
+
+class AnthropicStreamAccumulator:
+    """Rebuilds an Anthropic `message` payload from Messages API stream events."""
+
+    def __init__(self):
+        self.parser = IncrementalJSONParser()
+        self.error: Optional[Dict[str, Any]] = None
+        self._message: Dict[str, Any] = {}
+        self._blocks: Dict[int, Dict[str, Any]] = {}
+        self._usage: Dict[str, Any] = {}
+
+    def feed(self, event: Dict[str, Any]):
+        event_type = event.get("type")
+        if event_type == "error":
+            self.error = {"error": event.get("error", event)}
+        elif event_type == "message_start":
+            self._message = dict(event.get("message") or {})
+            self._usage.update(self._message.get("usage") or {})
+        elif event_type == "content_block_start":
+            block = dict(event.get("content_block") or {})
+            block["_parts"] = []
+            self._blocks[event.get("index", len(self._blocks))] = block
+        elif event_type == "content_block_delta":
+            block = self._blocks.get(event.get("index", 0))
+            delta = event.get("delta") or {}
+            if block is None:
+                return
+            text = delta.get("partial_json") if delta.get("type") == "input_json_delta" else delta.get("text")
+            if text:
+                block["_parts"].append(text)
+                if event.get("index", 0) == min(self._blocks):
+                    self.parser.feed(text)
+        elif event_type == "message_delta":
+            delta = event.get("delta") or {}
+            if delta.get("stop_reason"):
+                self._message["stop_reason"] = delta["stop_reason"]
+            self._usage.update(event.get("usage") or {})
+
+    def fill_missing_usage(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        """
+        Use the estimated counts for the usage not received, returns whether any was missing.
+        The input usage (with the cache reads) arrives with `message_start`, the final output
+        count only with `message_delta` at the end of the stream.
+        """
+        estimated = False
+        if "input_tokens" not in self._usage:
+            self._usage["input_tokens"] = prompt_tokens
+            estimated = True
+        if self._message.get("stop_reason") is None:
+            self._usage["output_tokens"] = max(self._usage.get("output_tokens", 0), completion_tokens)
+            estimated = True
+        return estimated
+
+    def to_response(self, early_resolved: bool = False) -> Dict[str, Any]:
+        if self.error:
+            return self.error
+        content = []
+        first_index = min(self._blocks) if self._blocks else None
+        for index in sorted(self._blocks):
+            block = {k: v for k, v in self._blocks[index].items() if k != "_parts"}
+            text = "".join(self._blocks[index]["_parts"])
+            if block.get("type") == "tool_use":
+                if early_resolved and index == first_index:
+                    block["input"] = dict(self.parser.fields)
+                else:
+                    try:
+                        block["input"] = json.loads(text) if text else block.get("input", {})
+                    except json.JSONDecodeError:
+                        block["input"] = {"raw": text}
+            elif block.get("type") == "text":
+                block["text"] = json.dumps(self.parser.fields) if early_resolved and index == first_index else text
+            content.append(block)
+            if early_resolved:
+                break
+        response = dict(self._message)
+        response.setdefault("type", "message")
+        response.setdefault("role", "assistant")
+        response["content"] = content
+        if not response.get("stop_reason"):
+            response["stop_reason"] = "tool_use" if content and content[0].get("type") == "tool_use" else "end_turn"
+        response.setdefault("stop_sequence", None)
+        response["usage"] = {"input_tokens": 0, "output_tokens": 0, **self._usage}
+        return response
+
+
+def create_stream_accumulator(request_url: str):
+    """Pick the accumulator matching the wire format of the endpoint."""
+    if "anthropic.com" in request_url or request_url.rstrip("/").endswith("/messages"):
+        return AnthropicStreamAccumulator()
+    return OpenAIStreamAccumulator()
+
+
+async def iter_sse_events(response: aiohttp.ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the JSON payload of every `data:` line of a server-sent events response."""
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            continue
@@ -81,7 +81,14 @@ def msg_dict_to_oai(messages: List[Dict[str, Any]]) -> List[ChatCompletionMessag
 
         return [convert_message(msg) for msg in messages]
 
-def msg_dict_to_anthropic(messages: List[Dict[str, Any]],use_cache:bool=True,use_prefill:bool=False) -> Tuple[List[PromptCachingBetaTextBlockParam],List[MessageParam]]:
+def msg_dict_to_anthropic(messages: List[Dict[str, Any]],use_cache:bool=True,use_prefill:bool=False,cache_tail:bool=True) -> Tuple[List[PromptCachingBetaTextBlockParam],List[MessageParam]]:
+        """
+        Convert messages to an Anthropic system block list and message list.
+
+        With use_cache the system block is a cache breakpoint. cache_tail also marks the last
+        and third to last messages; without it the only message breakpoint is the end of the
+        history before the new user message, so the per-round tail is never written to the cache.
+        """
         def create_anthropic_system_message(system_message: Optional[Dict[str, Any]],use_cache:bool=True) -> List[PromptCachingBetaTextBlockParam]:
             if system_message and system_message["role"] == "system":
                 text = system_message["content"]
@@ -120,8 +127,12 @@ def msg_dict_to_anthropic(messages: List[Dict[str, Any]],use_cache:bool=True,use
         converted_messages = []
         system_message = []
         num_messages = len(messages)
-        if use_cache:
+        if use_cache and cache_tail:
             use_cache_ids = set([num_messages - 1, max(0, num_messages - 3)])
+        elif use_cache:
+            user_ids = [i for i, message in enumerate(messages) if message["role"] == "user"]
+            prefix_end = user_ids[-1] - 1 if user_ids else -1
+            use_cache_ids = set([prefix_end]) if prefix_end >= 0 and messages[prefix_end]["role"] != "system" else set()
         else:
             use_cache_ids = set()
         for i,message in enumerate(messages):
@@ -0,0 +1,153 @@
+"""
+Batch validation and repair of structured outputs.
+
+The outputs of a phase are validated against the pydantic schema of every agent (for
+example `Bid` or `Ask`) in a worker pool, off the event loop. Cheap failures are repaired
+deterministically: markdown fences, text around the JSON object, trailing commas, Python
+literals, objects wrapped in a single key, currency formatted numbers and numbers outside
+the schema bounds. Outputs that still fail carry a short error that is sent back to the
+model in one follow-up prompt (see `repair_prompt`).
+"""
+
+import ast
+import asyncio
+import json
+import re
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from trade_agents.inference.message_models import LLMOutput, LLMPromptContext
+
+ValidationItem = Tuple[str, Any, Type[BaseModel]]
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.MULTILINE)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_NUMBER = re.compile(r'^[^\d\-+.]*([-+]?\d[\d,]*(?:\.\d+)?|[-+]?\.\d+)[^\d]*$')
+
+
+class ValidationResult(BaseModel):
+    value: Optional[Any] = None
+    repaired: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def repair_json_text(text: str) -> Optional[Dict[str, Any]]:
+    """JSON object of a model response, tolerating fences, surrounding text, trailing commas and Python literals."""
+    if not text:
+        return None
+    cleaned = _FENCE.sub('', text.strip())
+    start, end = cleaned.find('{'), cleaned.rfind('}')
+    if start == -1 or end < start:
+        return None
+    candidate = cleaned[start:end + 1]
+    for attempt in (candidate, _TRAILING_COMMA.sub(r'\1', candidate)):
+        try:
+            parsed = json.loads(attempt)
+        except json.JSONDecodeError:
+            try:
+                parsed = ast.literal_eval(attempt)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+@lru_cache(maxsize=None)
+def _schema_properties(model: Type[BaseModel]) -> Dict[str, Dict[str, Any]]:
+    return model.model_json_schema().get("properties", {})
+
+
+def _coerce_number(value: Any, spec: Dict[str, Any]) -> Any:
+    if isinstance(value, str) and spec.get("type") in ("number", "integer"):
+        match = _NUMBER.match(value.strip())
+        if match:
+            value = float(match.group(1).replace(",", ""))
+            if spec["type"] == "integer" and value.is_integer():
+                value = int(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in spec:
+            value = max(value, spec["minimum"])
+        if "maximum" in spec:
+            value = min(value, spec["maximum"])
+    return value
+
+
+def repair_object(obj: Dict[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+    """Deterministic repairs of an object that failed validation against `model`."""
+    properties = _schema_properties(model)
+    if len(obj) == 1 and not set(obj) & set(properties):
+        # {"bid": {...}} or {"action": {...}}
+        inner = next(iter(obj.values()))
+        if isinstance(inner, dict):
+            obj = inner
+    return {key: _coerce_number(value, properties[key]) if key in properties else value for key, value in obj.items()}
+
+
+def _format_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'output'}: {e['msg']}" for e in error.errors())
+
+
+def validate_output(payload: Any, model: Type[BaseModel]) -> ValidationResult:
+    """Validate an LLMOutput, a parsed object or a response text against `model`, repairing cheap failures."""
+    if isinstance(payload, LLMOutput):
+        payload = payload.json_object.object if payload.json_object else payload.str_content
+    repaired = False
+    if isinstance(payload, str):
+        try:
+            obj = json.loads(payload)
+        except json.JSONDecodeError:
+            obj, repaired = repair_json_text(payload), True
+    else:
+        obj = payload
+    if not isinstance(obj, dict):
+        return ValidationResult(error="the response does not contain a JSON object")
+
+    try:
+        return ValidationResult(value=model.model_validate(obj), repaired=repaired)
+    except ValidationError:
+        pass
+    try:
+        return ValidationResult(value=model.model_validate(repair_object(obj, model)), repaired=True)
+    except ValidationError as e:
+        return ValidationResult(error=_format_error(e))
+
+
+def validate_chunk(items: List[ValidationItem]) -> List[Tuple[str, ValidationResult]]:
+    return [(key, validate_output(payload, model)) for key, payload, model in items]
+
+
+class OutputValidator:
+    """
+    Validates batches of outputs in an executor, in chunks to keep the dispatch overhead low.
+
+    The default executor of the event loop is used unless one is given; a process pool works
+    as long as the schemas are importable module-level models.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, chunk_size: int = 32):
+        self.executor = executor
+        self.chunk_size = chunk_size
+
+    async def validate_batch(self, items: List[ValidationItem]) -> Dict[str, ValidationResult]:
+        if not items:
+            return {}
+        loop = asyncio.get_running_loop()
+        chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+        results = await asyncio.gather(*(loop.run_in_executor(self.executor, validate_chunk, chunk) for chunk in chunks))
+        return {key: result for chunk in results for key, result in chunk}
+
+
+def repair_prompt(prompt: LLMPromptContext, error: str) -> LLMPromptContext:
+    """Copy of a prompt asking the model to answer again, with the validation error of its previous answer."""
+    return prompt.model_copy(update={
+        "new_message": f"{prompt.new_message}\n\nYour previous answer could not be used ({error}). "
+                       f"Answer again with a single JSON object that follows the output schema exactly."
+    })
@@ -0,0 +1,128 @@
+"""
+Recall and latency benchmark of the pgvector index options.
+
+For every table size, fills a scratch table with random vectors, then for every index method
+builds the index with the parameters of the memory config and compares the top-k of random
+queries against an exact search (sequential scan):
+
+    python -m trade_agents.memory.benchmark_index --sizes 100000 1000000 --methods ivfflat hnsw
+
+Search parameters (`ivfflat_probes`, `hnsw_ef_search`) and build parameters (`lists`,
+`hnsw_m`, `hnsw_ef_construction`) are read from the config file.
+"""
+
+import argparse
+import random
+import time
+from typing import Dict, List, Sequence
+
+from trade_agents.memory.config import load_config_from_yaml
+from trade_agents.memory.setup_db import DatabaseConnection
+
+BENCHMARK_TABLE = "vector_index_benchmark"
+
+
+def recall_at_k(exact: Sequence[Sequence[int]], approx: Sequence[Sequence[int]]) -> float:
+    """Fraction of the exact neighbours found by the approximate searches."""
+    total = sum(len(ids) for ids in exact)
+    if not total:
+        return 1.0
+    return sum(len(set(e) & set(a)) for e, a in zip(exact, approx)) / total
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _fill_table(db: DatabaseConnection, size: int):
+    db.cursor.execute(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE};")
+    db.cursor.execute(f"""
+        CREATE UNLOGGED TABLE {BENCHMARK_TABLE} (
+            id BIGINT PRIMARY KEY,
+            embedding vector({db.config.vector_dim})
+        );
+    """)
+    # the reference to i makes Postgres draw a new vector per row
+    db.cursor.execute(f"""
+        INSERT INTO {BENCHMARK_TABLE}
+        SELECT i, ARRAY(SELECT random() - 0.5 FROM generate_series(1, %s) WHERE i > 0)::vector
+        FROM generate_series(1, %s) AS i;
+    """, (db.config.vector_dim, size))
+    db.cursor.execute(f"ANALYZE {BENCHMARK_TABLE};")
+    db.conn.commit()
+
+
+def _search(db: DatabaseConnection, queries: List[List[float]], k: int, exact: bool):
+    results, latencies = [], []
+    for query in queries:
+        if exact:
+            db.cursor.execute("SET LOCAL enable_indexscan = off;")
+        else:
+            db.apply_search_settings(db.cursor)
+        start = time.perf_counter()
+        db.cursor.execute(f"""
+            SELECT id FROM {BENCHMARK_TABLE}
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s;
+        """, (query, k))
+        results.append([row[0] for row in db.cursor.fetchall()])
+        latencies.append((time.perf_counter() - start) * 1000)
+        db.conn.commit()
+    return results, latencies
+
+
+def benchmark(db: DatabaseConnection, sizes: Sequence[int], methods: Sequence[str],
+              k: int = 10, num_queries: int = 100, seed: int = 0) -> List[Dict[str, float]]:
+    """Recall@k, query latency and build time of every index method at every table size."""
+    rng = random.Random(seed)
+    db.connect()
+    rows = []
+    try:
+        for size in sizes:
+            _fill_table(db, size)
+            queries = [[rng.random() - 0.5 for _ in range(db.config.vector_dim)] for _ in range(num_queries)]
+            exact, exact_latencies = _search(db, queries, k, exact=True)
+            for method in methods:
+                db.cursor.execute(f"DROP INDEX IF EXISTS {BENCHMARK_TABLE}_index;")
+                start = time.perf_counter()
+                db.cursor.execute(f"CREATE INDEX {BENCHMARK_TABLE}_index ON {BENCHMARK_TABLE} {db.vector_index_clause(method)};")
+                db.conn.commit()
+                build_seconds = time.perf_counter() - start
+
+                approx, latencies = _search(db, queries, k, exact=False)
+                rows.append({
+                    "size": size,
+                    "method": method,
+                    "build_seconds": round(build_seconds, 1),
+                    f"recall@{k}": round(recall_at_k(exact, approx), 4),
+                    "p50_ms": round(percentile(latencies, 0.5), 2),
+                    "p95_ms": round(percentile(latencies, 0.95), 2),
+                    "exact_p50_ms": round(percentile(exact_latencies, 0.5), 2),
+                })
+    finally:
+        db.conn.rollback()
+        db.cursor.execute(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE};")
+        db.conn.commit()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pgvector index recall and latency")
+    parser.add_argument("--config", default="trade_agents/memory/memory_config.yaml")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--methods", nargs="+", default=["ivfflat", "hnsw"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    db = DatabaseConnection(load_config_from_yaml(args.config))
+    try:
+        results = benchmark(db, args.sizes, args.methods, k=args.k, num_queries=args.queries)
+    finally:
+        db.close()
+
+    columns = list(results[0].keys()) if results else []
+    print("  ".join(f"{column:>14}" for column in columns))
+    for row in results:
+        print("  ".join(f"{str(row[column]):>14}" for column in columns))
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import yaml
 from pydantic_settings import BaseSettings
 from pydantic import Field
@@ -8,11 +10,23 @@ class MarketMemoryConfig(BaseSettings):
     password: str = Field(default="password")
     host: str = Field(default="localhost")
     port: str = Field(default="0000")
-    index_method: str = Field(default="ivfflat") 
+    pool_min_size: int = Field(default=1)
+    pool_max_size: int = Field(default=20, description="Concurrent memory queries across all agents")
+    statement_timeout: str = Field(default="60s")
+    memory_layout: str = Field(default="per_agent", description="Options: per_agent, shared")
+    memory_partitions: int = Field(default=16, description="Hash partitions of the shared memory tables")
+    index_method: str = Field(default="ivfflat", description="Options: ivfflat, hnsw")
     lists: int = Field(default=100)
+    ivfflat_probes: int = Field(default=10, description="Lists searched per IVFFlat query")
+    hnsw_m: int = Field(default=16)
+    hnsw_ef_construction: int = Field(default=64)
+    hnsw_ef_search: int = Field(default=40, description="Candidate list size per HNSW query")
+    defer_index_build: bool = Field(default=False, description="Build knowledge base vector indexes after bulk ingest")
     embedding_api_url: str = Field(default="http://0.0.0.0:8080/embed")
     model: str = Field(default="jinaai/jina-embeddings-v2-base-en")
     batch_size: int = Field(default=32)
+    max_batch_tokens: int = Field(default=16384, description="Token budget of one embedding request")
+    embedding_concurrency: int = Field(default=4, description="Embedding requests in flight per async embedder")
     timeout: int = Field(default=10)
     retry_attempts: int = Field(default=3)
     retry_delay: float = Field(default=1.0)
@@ -22,9 +36,18 @@ class MarketMemoryConfig(BaseSettings):
     max_input: int = Field(default=512)
     top_k: int = Field(default=3)
     similarity_threshold: float = Field(default=0.7)
+    local_memory_index: bool = Field(default=False, description="Answer short-term lookups in process, write to Postgres behind")
+    local_index_max_items: int = Field(default=10_000, description="Short-term memories kept in the local index per agent")
+    search_overfetch: int = Field(default=4, description="Candidates fetched per result before threshold and dedup")
     encoding_format: str = Field(default="float")
 
-    embedding_provider: str = Field(default="tei", description="Options: tei, openai, etc.")
+    embedding_cache_size: int = Field(default=100_000, description="Embeddings kept in memory as float32 (3 KB each at 768 dimensions), 0 disables the cache")
+    embedding_cache_store: Optional[str] = Field(default=None, description="Options: sqlite, postgres")
+    embedding_cache_path: str = Field(default="outputs/embedding_cache.sqlite")
+
+    embedding_provider: str = Field(default="tei", description="Options: tei, openai, local")
+    local_embedding_model: Optional[str] = Field(default=None, description="sentence-transformers model of the local provider, None uses the hashing vectorizer")
+    local_embedding_threads: int = Field(default=4, description="CPU threads of the local provider, only the sentence-transformers model embeds batches in parallel")
 
 def load_config_from_yaml(yaml_path: str = "config.yaml") -> MarketMemoryConfig:
     with open(yaml_path, 'r') as f:
@@ -1,86 +1,220 @@
+import asyncio
 import os
 import requests
 import time
 import tiktoken
 import logging
+import threading
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
 from dotenv import load_dotenv
 
+from trade_agents.memory.embedding_cache import get_embedding_cache
+from trade_agents.memory.local_embedding import WordEncoding, get_local_backend
+
+# aiohttp sessions of the async embedders, one per event loop and concurrency limit
+_async_sessions = weakref.WeakKeyDictionary()
+# embedders shared by the agents' memories, by memory config
+_embedders: Dict[str, "MemoryEmbedder"] = {}
+_embedders_lock = threading.Lock()
+
+
+def _async_session(config):
+    """Session and request semaphore shared by the async embedders of the running event loop."""
+    sessions = _async_sessions.setdefault(asyncio.get_running_loop(), {})
+    session, semaphore = sessions.get(config.embedding_concurrency, (None, None))
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.embedding_concurrency),
+            timeout=aiohttp.ClientTimeout(total=config.timeout)
+        )
+        semaphore = asyncio.Semaphore(config.embedding_concurrency)
+        sessions[config.embedding_concurrency] = (session, semaphore)
+    return session, semaphore
+
+
+async def close_async_sessions():
+    """Close the embedding sessions of the running event loop."""
+    sessions = _async_sessions.pop(asyncio.get_running_loop(), {})
+    for session, _ in sessions.values():
+        await session.close()
+
+
 class MemoryEmbedder:
     """
     MemoryEmbedder embeds given text inputs from a specified embedding model.
+    Embeddings are looked up in the process-wide embedding cache first, only the
+    misses are sent to the embedding API.
+
+    `get_embeddings` sends the batches one after another on a pooled `requests`
+    session, `aget_embeddings` sends them concurrently (up to `embedding_concurrency`)
+    on an aiohttp session and can be awaited directly from asyncio code. The `local`
+    provider embeds in process on CPU threads, without any service or network access.
+    `get_embedder` returns the embedder shared by every memory with the same config.
     """
-    def __init__(self, config):
+    def __init__(self, config, cache=None):
         self.config = config
-        self.encoding = tiktoken.get_encoding("cl100k_base")
-        self.max_input = self.config.max_input - 1000
+        self.local_backend = None
+        if config.embedding_provider == "local":
+            # tiktoken downloads its encodings, local runs count whitespace tokens
+            self.local_backend = get_local_backend(config)
+            self.encoding = WordEncoding()
+            self.model_key = f"local:{self.local_backend.name}:{config.vector_dim}"
+        else:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+            self.model_key = f"{config.embedding_provider}:{config.model}"
+        self.max_input = self.config.max_input - 1000 if self.config.max_input > 1000 else self.config.max_input
+        self.cache = cache if cache is not None else get_embedding_cache(config)
+        self.openai_key = None
+        if config.embedding_provider == "openai":
+            load_dotenv()
+            self.openai_key = os.getenv("OPENAI_KEY")
+        self.session = requests.Session()
         logging.info(f"Initialized MemoryEmbedder with {config.embedding_provider} provider")
 
-    def _truncate_text(self, text: str) -> str:
-        """Truncate text to max_input tokens using tiktoken."""
+    def _truncate(self, text: str) -> Tuple[str, int]:
+        """Truncate text to max_input tokens using tiktoken, returns the text and its token count."""
         tokens = self.encoding.encode(text)
         if len(tokens) > self.max_input:
             logging.warning(f"Text truncated from {len(tokens)} to {self.max_input} tokens")
             tokens = tokens[:self.max_input]
             text = self.encoding.decode(tokens)
-        return text
+        return text, len(tokens)
+
+    def _truncate_text(self, text: str) -> str:
+        return self._truncate(text)[0]
+
+    def _batches(self, texts: List[str], token_counts: Optional[List[int]] = None) -> Iterator[List[str]]:
+        """Batches of at most `batch_size` texts and `max_batch_tokens` tokens."""
+        if token_counts is None:
+            token_counts = [len(self.encoding.encode(text)) for text in texts]
+        batch, batch_tokens = [], 0
+        for text, tokens in zip(texts, token_counts):
+            if batch and (len(batch) >= self.config.batch_size or batch_tokens + tokens > self.config.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
 
     def get_embeddings(self, texts):
         """Get embeddings with retry logic and batch processing."""
         single_input = isinstance(texts, str)
         texts = [texts] if single_input else texts
 
-        texts = [self._truncate_text(text) for text in texts]
+        texts, token_counts = self._prepare(texts)
+
+        if self.cache is None:
+            all_embeddings = self._embed(texts, token_counts)
+        else:
+            keys = self._keys(texts)
+            found = self.cache.get_many(keys)
+            missing = self._missing(keys, texts, token_counts, found)
+            if missing:
+                fetched = list(zip(missing, self._embed(*self._unzip(missing))))
+                self.cache.put_many(fetched)
+                found.update(fetched)
+            all_embeddings = [found[key] for key in keys]
+
+        return all_embeddings[0] if single_input else all_embeddings
+
+    async def aget_embeddings(self, texts):
+        """
+        Async `get_embeddings`: the batches of cache misses are sent concurrently. Only the
+        in-memory cache is read on the event loop, the persistent tier runs on the executor.
+        """
+        single_input = isinstance(texts, str)
+        texts = [texts] if single_input else texts
+
+        texts, token_counts = self._prepare(texts)
+
+        if self.cache is None:
+            all_embeddings = await self._aembed(texts, token_counts)
+        else:
+            loop = asyncio.get_running_loop()
+            keys = self._keys(texts)
+            found = self.cache.get_local(keys)
+            if self.cache.store is not None:
+                not_in_memory = [key for key in dict.fromkeys(keys) if key not in found]
+                if not_in_memory:
+                    found.update(await loop.run_in_executor(None, self.cache.get_stored, not_in_memory))
+            self.cache.count_misses(sum(1 for key in keys if key not in found))
+            missing = self._missing(keys, texts, token_counts, found)
+            if missing:
+                fetched = list(zip(missing, await self._aembed(*self._unzip(missing))))
+                self.cache.put_local(fetched)
+                if self.cache.store is not None:
+                    await loop.run_in_executor(None, self.cache.store.put_many, fetched)
+                found.update(fetched)
+            all_embeddings = [found[key] for key in keys]
+
+        return all_embeddings[0] if single_input else all_embeddings
+
+    def _prepare(self, texts):
+        """Truncated texts and their token counts."""
+        truncated = [self._truncate(text) for text in texts]
+        return [text for text, _ in truncated], [tokens for _, tokens in truncated]
+
+    def _keys(self, texts):
+        return [self.cache.key(self.model_key, text) for text in texts]
 
+    @staticmethod
+    def _missing(keys, texts, token_counts, found):
+        """Texts to embed and their token counts by key, identical texts of a batch are embedded once."""
+        return {key: (text, tokens) for key, text, tokens in zip(keys, texts, token_counts) if key not in found}
+
+    @staticmethod
+    def _unzip(missing):
+        return [text for text, _ in missing.values()], [tokens for _, tokens in missing.values()]
+
+    def _embed(self, texts, token_counts=None):
         if self.config.embedding_provider == "openai":
-            all_embeddings = self._get_openai_embeddings(texts)
+            return self._get_openai_embeddings(texts, token_counts)
         elif self.config.embedding_provider == "tei":
-            all_embeddings = self._get_tei_embeddings(texts)
+            return self._get_tei_embeddings(texts, token_counts)
+        elif self.config.embedding_provider == "local":
+            return self.local_backend.embed_batches(list(self._batches(texts, token_counts)))
         else:
             raise NotImplementedError(
                 f"Unknown embedding provider: {self.config.embedding_provider}"
             )
 
-        return all_embeddings[0] if single_input else all_embeddings
-
-    def _get_openai_embeddings(self, texts):
-        """Embeddings from OpenAI API."""
-        load_dotenv()
-        self.openai_key = os.getenv("OPENAI_KEY")
-        headers = {
-            "Authorization": f"Bearer {self.openai_key}",
-            "Content-Type": "application/json"
-        }
-        all_embeddings = []
-
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i : i + self.config.batch_size]
-            payload = {
-                "input": batch,
-                "model": self.config.model
+    def _request(self, batch):
+        """Headers and payload of an embedding request for a batch of texts."""
+        if self.config.embedding_provider == "openai":
+            headers = {
+                "Authorization": f"Bearer {self.openai_key}",
+                "Content-Type": "application/json"
             }
-            # Reuse the _send_embedding_request method
-            response = self._send_embedding_request(payload, headers)
-            response_json = response.json()
-            batch_embeddings = [item["embedding"] for item in response_json.get("data", [])]
-            all_embeddings.extend(batch_embeddings)
+            return headers, {"input": batch, "model": self.config.model}
+        elif self.config.embedding_provider == "tei":
+            return {"Content-Type": "application/json"}, {"inputs": batch, "model": self.config.model}
+        raise NotImplementedError(
+            f"Unknown embedding provider: {self.config.embedding_provider}"
+        )
 
-        return all_embeddings
+    def _parse_response(self, response_json):
+        if self.config.embedding_provider == "openai":
+            return [item["embedding"] for item in response_json.get("data", [])]
+        return response_json
 
-    def _get_tei_embeddings(self, texts):
+    def _get_openai_embeddings(self, texts, token_counts=None):
+        """Embeddings from OpenAI API."""
+        return self._send_batches(texts, token_counts)
+
+    def _get_tei_embeddings(self, texts, token_counts=None):
         """Embeddings for local embedding model (TEI)."""
-        headers = {"Content-Type": "application/json"}
-        all_embeddings = []
+        return self._send_batches(texts, token_counts)
 
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i : i + self.config.batch_size]
-            payload = {
-                "inputs": batch,
-                "model": self.config.model
-            }
-            # Reuse the _send_embedding_request method
+    def _send_batches(self, texts, token_counts=None):
+        all_embeddings = []
+        for batch in self._batches(texts, token_counts):
+            headers, payload = self._request(batch)
             response = self._send_embedding_request(payload, headers)
-            all_embeddings.extend(response.json())
-
+            all_embeddings.extend(self._parse_response(response.json()))
         return all_embeddings
 
     def _send_embedding_request(self, payload, headers):
@@ -88,8 +222,9 @@ class MemoryEmbedder:
         Sends POST request to the embedding API with retry logic. 
         """
         for attempt in range(self.config.retry_attempts):
+            response = None
             try:
-                response = requests.post(
+                response = self.session.post(
                     self.config.embedding_api_url,
                     headers=headers,
                     json=payload,
@@ -109,4 +244,48 @@ class MemoryEmbedder:
                     raise e
                 time.sleep(self.config.retry_delay)
 
-        raise RuntimeError("Unexpected error in _send_embedding_request")
\ No newline at end of file
+        raise RuntimeError("Unexpected error in _send_embedding_request")
+
+    async def _aembed(self, texts, token_counts=None):
+        batches = list(self._batches(texts, token_counts))
+        if self.local_backend is not None:
+            results = await asyncio.gather(*(
+                asyncio.wrap_future(self.local_backend.executor.submit(self.local_backend.embed_batch, batch))
+                for batch in batches
+            ))
+        else:
+            results = await asyncio.gather(*(self._aembed_batch(batch) for batch in batches))
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    async def _aembed_batch(self, batch):
+        headers, payload = self._request(batch)
+        return self._parse_response(await self._asend_embedding_request(payload, headers))
+
+    async def _asend_embedding_request(self, payload, headers):
+        """Async `_send_embedding_request`, at most `embedding_concurrency` requests are in flight."""
+        session, semaphore = _async_session(self.config)
+        for attempt in range(self.config.retry_attempts):
+            try:
+                async with semaphore:
+                    async with session.post(self.config.embedding_api_url, headers=headers, json=payload) as response:
+                        if response.status >= 400:
+                            logging.error(f"HTTP error {response.status} from embedding API: {await response.text()}")
+                        response.raise_for_status()
+                        return await response.json()
+            except Exception:
+                if attempt == self.config.retry_attempts - 1:
+                    raise
+                await asyncio.sleep(self.config.retry_delay)
+
+        raise RuntimeError("Unexpected error in _asend_embedding_request")
+
+
+def get_embedder(config) -> MemoryEmbedder:
+    """Process-wide embedder for `config`, the agents' memories share its session and cache."""
+    key = config.model_dump_json()
+    with _embedders_lock:
+        embedder = _embedders.get(key)
+        # the shared caches may have been cleared since
+        if embedder is None or embedder.cache is not get_embedding_cache(config):
+            embedder = _embedders[key] = MemoryEmbedder(config)
+    return embedder
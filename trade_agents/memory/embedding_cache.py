@@ -0,0 +1,225 @@
+"""
+Cache of text embeddings, keyed by a hash of the embedding model and the (truncated) text.
+
+Agents in the same round often embed the same strings (episodic queries are built from the
+task and the environment state, memory contents repeat), so `MemoryEmbedder` looks every text
+up here and only sends the misses upstream. The cache has an in-memory LRU tier and an
+optional persistent tier that outlives the process: a SQLite file or a Postgres table.
+
+All memory embedders of a process share one cache through `get_embedding_cache(config)`.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+from trade_agents.memory.setup_db import DatabaseConnection
+
+Embedding = List[float]
+
+
+class SQLiteEmbeddingStore:
+    """Persistent tier in a local SQLite file."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, embedding TEXT NOT NULL)")
+            self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters of a statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embedding_cache WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((key, json.loads(embedding)) for key, embedding in rows)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Embedding]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, embedding) VALUES (?, ?)",
+                [(key, json.dumps(embedding)) for key, embedding in items]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresEmbeddingStore:
+    """Persistent tier in the memory database, shared by every process using it."""
+
+    def __init__(self, db: DatabaseConnection):
+        self.db = db
+        with self.db.connection() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    embedding REAL[] NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        with self.db.connection() as cursor:
+            cursor.execute("SELECT key, embedding FROM embedding_cache WHERE key = ANY(%s);", (list(keys),))
+            return {key: list(embedding) for key, embedding in cursor.fetchall()}
+
+    def put_many(self, items: Iterable[Tuple[str, Embedding]]):
+        rows = list(items)
+        with self.db.connection() as cursor:
+            execute_values(
+                cursor,
+                "INSERT INTO embedding_cache (key, embedding) VALUES %s ON CONFLICT (key) DO NOTHING",
+                rows,
+                page_size=len(rows)
+            )
+
+    def close(self):
+        self.db.close()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU of embeddings in front of an optional persistent store.
+
+    Entries are kept as float32 arrays (3 KB for 768 dimensions instead of about 25 KB as a
+    list of Python floats) and returned as lists.
+    """
+
+    def __init__(self, max_entries: int = 100_000, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put_local(self, key: str, embedding: Embedding):
+        self._entries[key] = array("f", embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        """Cached embeddings of the keys found in either tier; every key counts once as a hit or a miss."""
+        found = self.get_local(keys)
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            found.update(self.get_stored(missing))
+        self.count_misses(sum(1 for key in keys if key not in found))
+        return found
+
+    def get_local(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        """Embeddings of the keys held in memory, never blocks on I/O."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = embedding.tolist()
+            self.hits += len(found)
+        return found
+
+    def get_stored(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        """Embeddings of the keys found in the persistent store, promoted to memory."""
+        if self.store is None:
+            return {}
+        stored = self.store.get_many(keys)
+        with self._lock:
+            for key, embedding in stored.items():
+                self._put_local(key, embedding)
+            self.store_hits += len(stored)
+        return stored
+
+    def count_misses(self, misses: int):
+        with self._lock:
+            self.misses += misses
+
+    def put_many(self, items: Sequence[Tuple[str, Embedding]]):
+        if not items:
+            return
+        self.put_local(items)
+        if self.store is not None:
+            self.store.put_many(items)
+
+    def put_local(self, items: Sequence[Tuple[str, Embedding]]):
+        with self._lock:
+            for key, embedding in items:
+                self._put_local(key, embedding)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.store_hits + self.misses
+        return (self.hits + self.store_hits) / lookups if lookups else 0.0
+
+    def to_prometheus_text(self) -> str:
+        return "\n".join([
+            "# TYPE embedding_cache_lookups_total counter",
+            f'embedding_cache_lookups_total{{result="hit",tier="memory"}} {self.hits}',
+            f'embedding_cache_lookups_total{{result="hit",tier="store"}} {self.store_hits}',
+            f'embedding_cache_lookups_total{{result="miss"}} {self.misses}',
+            "# TYPE embedding_cache_entries gauge",
+            f"embedding_cache_entries {len(self._entries)}",
+        ]) + "\n"
+
+
+_caches: Dict[Tuple, Optional[EmbeddingCache]] = {}
+_lock = threading.Lock()
+
+
+def _create_store(config):
+    if config.embedding_cache_store == "sqlite":
+        return SQLiteEmbeddingStore(config.embedding_cache_path)
+    if config.embedding_cache_store == "postgres":
+        return PostgresEmbeddingStore(DatabaseConnection(config))
+    if config.embedding_cache_store:
+        raise ValueError(f"Unknown embedding cache store: {config.embedding_cache_store}")
+    return None
+
+
+def get_embedding_cache(config) -> Optional[EmbeddingCache]:
+    """Process-wide cache for the cache settings of `config`, None when caching is disabled."""
+    settings = (config.embedding_cache_size, config.embedding_cache_store, config.embedding_cache_path,
+                config.dbname, config.host, config.port)
+    if settings not in _caches:
+        with _lock:
+            if settings not in _caches:
+                if config.embedding_cache_size <= 0 and not config.embedding_cache_store:
+                    _caches[settings] = None
+                else:
+                    _caches[settings] = EmbeddingCache(max(config.embedding_cache_size, 0), _create_store(config))
+    return _caches[settings]
+
+
+def clear_embedding_caches():
+    """Forget the shared caches, closing their persistent stores."""
+    with _lock:
+        for cache in _caches.values():
+            if cache is not None and cache.store is not None:
+                cache.store.close()
+        _caches.clear()
@@ -64,8 +64,11 @@ class MarketKnowledgeBase:
             logging.error(f"Error checking knowledge base existence: {str(e)}")
             return False
 
-    def ingest_knowledge(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> UUID:
-        """Process a document: chunk, embed, and store as a KnowledgeObject."""
+    def ingest_knowledge(self, text: str, metadata: Optional[Dict[str, Any]] = None, build_indexes: bool = True) -> UUID:
+        """
+        Process a document: chunk, embed, and store as a KnowledgeObject. Vector indexes
+        deferred at table creation are built afterwards unless `build_indexes` is False.
+        """
         chunks = self._chunk(text)
         embeddings = self.embedding_service.get_embeddings([c.text for c in chunks])
 
@@ -73,8 +76,16 @@ class MarketKnowledgeBase:
             chunk.embedding = emb
 
         knowledge_id = self._save_knowledge_and_chunks(text, chunks, metadata)
+        if build_indexes:
+            self.db.build_deferred_indexes()
         return knowledge_id
 
+    def ingest_knowledge_batch(self, texts: List[str], metadata: Optional[Dict[str, Any]] = None) -> List[UUID]:
+        """Ingest many documents, then build the vector indexes deferred until the data is loaded."""
+        knowledge_ids = [self.ingest_knowledge(text, metadata, build_indexes=False) for text in texts]
+        self.db.build_deferred_indexes()
+        return knowledge_ids
+
     def _chunk(self, text: str) -> List[KnowledgeChunk]:
         if self.chunking_method:
             return self.chunking_method.chunk(text)
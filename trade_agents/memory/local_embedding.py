@@ -0,0 +1,123 @@
+"""
+In-process embedding backends for running the memory subsystem without an embedding server.
+
+`embedding_provider: "local"` embeds on CPU threads of the process, either with a small
+sentence-embedding model through sentence-transformers (optional dependency, set
+`local_embedding_model`) or, by default, with a deterministic hashing vectorizer.
+
+The hashing vectorizer needs no model and no network: lower-cased words and word bigrams
+are hashed into `vector_dim` signed buckets and the vector is L2-normalized, so texts that
+share words are close under cosine distance. It is not a semantic model, but it is stable
+across processes and machines, which makes it suitable for tests and benchmarks.
+
+The thread pool only embeds batches in parallel with sentence-transformers, whose torch
+kernels release the GIL. The hashing vectorizer is pure Python and holds the GIL, so its
+batches run one at a time; the pool then only keeps the embedding off the event loop.
+"""
+
+import hashlib
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+Embedding = List[float]
+
+_WORD = re.compile(r"\w+")
+
+
+class WordEncoding:
+    """Whitespace stand-in for the tiktoken encoding, used to truncate and batch local inputs offline."""
+
+    def encode(self, text: str) -> List[str]:
+        return text.split()
+
+    def decode(self, tokens: Sequence[str]) -> str:
+        return " ".join(tokens)
+
+
+class HashingVectorizer:
+    """Deterministic feature-hashing embeddings of words and word bigrams."""
+
+    name = "hashing"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return digest % self.dim, 1.0 if (digest >> 63) & 1 else -1.0
+
+    def embed_one(self, text: str) -> Embedding:
+        words = _WORD.findall(text.lower())
+        vector = [0.0] * self.dim
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            index, sign = self._bucket(feature)
+            vector[index] += sign
+        norm = math.sqrt(sum(value * value for value in vector))
+        if not norm:
+            # a zero vector has no cosine distance, empty texts get a fixed unit vector
+            vector[0] = 1.0
+            return vector
+        return [value / norm for value in vector]
+
+    def embed(self, texts: Sequence[str]) -> List[Embedding]:
+        return [self.embed_one(text) for text in texts]
+
+
+class SentenceTransformerModel:
+    """A small sentence-embedding model run on CPU with sentence-transformers (optional dependency)."""
+
+    def __init__(self, model_name: str, dim: int):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("local_embedding_model requires sentence-transformers, install it with `pip install sentence-transformers`") from e
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        model_dim = self.model.get_sentence_embedding_dimension()
+        if model_dim != dim:
+            raise ValueError(f"Local embedding model {model_name} produces {model_dim}-dimensional vectors, vector_dim is {dim}")
+
+    def embed(self, texts: Sequence[str]) -> List[Embedding]:
+        return self.model.encode(list(texts), normalize_embeddings=True, show_progress_bar=False).tolist()
+
+
+class LocalEmbeddingBackend:
+    """
+    Embeds batches of texts on a pool of CPU threads. Batches run in parallel only with a
+    sentence-transformers model, hashing batches are serialized by the GIL.
+    """
+
+    def __init__(self, model, threads: int = 4):
+        self.model = model
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="local-embedding")
+
+    @property
+    def name(self) -> str:
+        return self.model.name
+
+    def embed_batch(self, texts: Sequence[str]) -> List[Embedding]:
+        return self.model.embed(texts)
+
+    def embed_batches(self, batches: Sequence[Sequence[str]]) -> List[Embedding]:
+        return [embedding for batch in self.executor.map(self.embed_batch, batches) for embedding in batch]
+
+
+_backends: Dict[Tuple, LocalEmbeddingBackend] = {}
+_lock = threading.Lock()
+
+
+def get_local_backend(config) -> LocalEmbeddingBackend:
+    """Process-wide backend for the local embedding settings of `config`, the model is loaded once."""
+    settings = (config.local_embedding_model, config.vector_dim, config.local_embedding_threads)
+    if settings not in _backends:
+        with _lock:
+            if settings not in _backends:
+                if config.local_embedding_model:
+                    model = SentenceTransformerModel(config.local_embedding_model, config.vector_dim)
+                else:
+                    model = HashingVectorizer(config.vector_dim)
+                _backends[settings] = LocalEmbeddingBackend(model, config.local_embedding_threads)
+    return _backends[settings]
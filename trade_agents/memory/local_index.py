@@ -0,0 +1,137 @@
+"""
+In-process index of an agent's short-term memories.
+
+With `local_memory_index` enabled, `ShortTermMemory` mirrors every write of the run into a
+`LocalMemoryIndex` and answers recent-memory and similarity lookups from it, without a
+database round-trip; Postgres becomes a write-behind store that is flushed in the
+background. Short-term memory holds a few hundred items per agent, so similarity search is
+an exact brute-force scan over normalized vectors, with NumPy when it is installed.
+
+The index holds at most `max_items` memories. Once older memories have been evicted, lookups
+that may need them return None and the caller falls back to the database.
+"""
+
+import bisect
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else list(vector)
+
+
+def _metadata_text(memory_object) -> Dict[str, str]:
+    """Metadata values as Postgres `metadata->>key` renders them, for filters."""
+    serialized = memory_object.serialize_metadata()
+    metadata = json.loads(serialized) if serialized else {}
+    return {key: value if isinstance(value, str) else json.dumps(value) for key, value in metadata.items()}
+
+
+class LocalMemoryIndex:
+    """The short-term memories of one agent, ordered by creation time, with their normalized embeddings."""
+
+    def __init__(self, max_items: int = 10_000):
+        self.max_items = max_items
+        self.items = []
+        self.evicted = False
+        self._keys: List[datetime] = []
+        self._vectors: Dict[Any, List[float]] = {}
+        self._metadata: Dict[Any, Dict[str, str]] = {}
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, memory_objects: Iterable):
+        for memory_object in memory_objects:
+            position = bisect.bisect_right(self._keys, memory_object.created_at)
+            self._keys.insert(position, memory_object.created_at)
+            self.items.insert(position, memory_object)
+            if memory_object.embedding is not None:
+                self._vectors[memory_object.memory_id] = _normalize(memory_object.embedding)
+            self._metadata[memory_object.memory_id] = _metadata_text(memory_object)
+        while len(self.items) > self.max_items:
+            self._forget(0)
+            self.evicted = True
+        self._matrix = None
+
+    def _forget(self, position: int):
+        memory_object = self.items.pop(position)
+        self._keys.pop(position)
+        self._vectors.pop(memory_object.memory_id, None)
+        self._metadata.pop(memory_object.memory_id, None)
+
+    def _matching(
+        self,
+        cognitive_step: Optional[Union[str, List[str]]] = None,
+        metadata_filters: Optional[Dict[str, Any]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> List[int]:
+        """Positions of the memories matching the filters of `CognitiveMemory.get_cognitive_items`."""
+        steps = [cognitive_step] if isinstance(cognitive_step, str) else cognitive_step
+        positions = []
+        for position, memory_object in enumerate(self.items):
+            if steps and memory_object.cognitive_step not in steps:
+                continue
+            if start_time and memory_object.created_at < start_time:
+                continue
+            if end_time and memory_object.created_at > end_time:
+                continue
+            if metadata_filters:
+                metadata = self._metadata[memory_object.memory_id]
+                if any(metadata.get(k) != str(v) for k, v in metadata_filters.items()):
+                    continue
+            positions.append(position)
+        return positions
+
+    def recent(self, limit: int = 10, **filters) -> Optional[List]:
+        """The `limit` most recent matching memories, oldest first, or None when evicted memories may be missing."""
+        positions = self._matching(**filters)
+        if self.evicted and len(positions) < limit:
+            return None
+        return [self.items[position] for position in positions[-limit:]] if limit > 0 else []
+
+    def search(self, query_embedding: List[float], top_k: int, cognitive_step: Optional[Union[str, List[str]]] = None) -> Optional[List[Tuple[Any, float]]]:
+        """Nearest memories by cosine similarity with their similarity, or None once memories were evicted."""
+        if self.evicted:
+            return None
+        query = _normalize(query_embedding)
+        candidates = [self.items[position] for position in self._matching(cognitive_step=cognitive_step)]
+        candidates = [memory_object for memory_object in candidates if memory_object.memory_id in self._vectors]
+        if not candidates:
+            return []
+
+        if np is not None and cognitive_step is None:
+            if self._matrix is None:
+                indexed = [memory_object for memory_object in self.items if memory_object.memory_id in self._vectors]
+                self._matrix = np.array([self._vectors[memory_object.memory_id] for memory_object in indexed], dtype=np.float32)
+            similarities = (self._matrix @ np.asarray(query, dtype=np.float32)).tolist()
+        else:
+            similarities = [
+                sum(a * b for a, b in zip(self._vectors[memory_object.memory_id], query)) for memory_object in candidates
+            ]
+
+        ranked = sorted(zip(candidates, similarities), key=lambda pair: pair[1], reverse=True)
+        return ranked[:top_k]
+
+    def remove(
+        self,
+        cognitive_step: Optional[Union[str, List[str]]] = None,
+        metadata_filters: Optional[Dict[str, Any]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> int:
+        positions = self._matching(cognitive_step, metadata_filters, start_time, end_time)
+        for position in reversed(positions):
+            self._forget(position)
+        self._matrix = None
+        return len(positions)
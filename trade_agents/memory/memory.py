@@ -1,17 +1,23 @@
 import asyncio
 import json
+import logging
 import uuid
+from collections import defaultdict
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Tuple, Union
 from uuid import UUID
 
 from fastapi import logger
+from psycopg2.extras import execute_values
 from pydantic import BaseModel, Field, ConfigDict
 
-from trade_agents.memory.embedding import MemoryEmbedder
+from trade_agents.memory.embedding import MemoryEmbedder, get_embedder
 from trade_agents.memory.config import MarketMemoryConfig
+from trade_agents.memory.local_index import LocalMemoryIndex
 from trade_agents.memory.setup_db import DatabaseConnection
-from trade_agents.memory.vector_search import MemoryRetriever
+from trade_agents.memory.vector_search import MemoryRetriever, agent_memory_query
+
+COGNITIVE_COLUMNS = "memory_id, cognitive_step, content, embedding, created_at, metadata"
 
 
 class MemoryObject(BaseModel):
@@ -94,9 +100,16 @@ class BaseMemory:
         """Ensure database connection is ready"""
         self.db.connect()
 
+    def _insert_values(self, columns: List[str], values: List[Any]):
+        """Columns, placeholders and values of an insert, with agent_id in the shared layout."""
+        if self.db.shared_layout:
+            columns, values = ["agent_id"] + columns, [self.agent_id] + values
+        return ", ".join(columns), ", ".join(["%s"] * len(columns)), tuple(values)
+
 class CognitiveMemory(BaseMemory):
     """
-    Handles storing and retrieving single-step memory items in agent_{agent_id}_cognitive table.
+    Handles storing and retrieving single-step memory items in agent_{agent_id}_cognitive table
+    (or the agent's rows of the shared cognitive table).
     """
 
     def __init__(
@@ -107,7 +120,7 @@ class CognitiveMemory(BaseMemory):
         agent_id: str
     ):
         BaseMemory.__init__(self, config, db_conn, embedder, agent_id)
-        self.cognitive_table = f"agent_{self.safe_id}_cognitive"
+        self.cognitive_table = self.db.cognitive_memory_table(self.agent_id)
         self.db.create_agent_cognitive_memory_table(self.agent_id)
 
     def store_cognitive_item(self, memory_object: MemoryObject):
@@ -115,36 +128,67 @@ class CognitiveMemory(BaseMemory):
         Insert a single cognitive step into the 'cognitive' table,
         returning the DB's actual created_at timestamp.
         """
-        self.db.connect()
-        try:
-            if memory_object.embedding is None:
-                memory_object.embedding = self.embedder.get_embeddings(memory_object.content)
+        if memory_object.embedding is None:
+            memory_object.embedding = self.embedder.get_embeddings(memory_object.content)
 
-            now = memory_object.created_at or datetime.now(timezone.utc)
+        now = memory_object.created_at or datetime.now(timezone.utc)
+        memory_object.created_at = now
 
-            self.db.cursor.execute(f"""
+        columns, placeholders, values = self._cognitive_row(memory_object)
+        with self.db.connection() as cursor:
+            cursor.execute(f"""
                 INSERT INTO {self.cognitive_table}
-                (memory_id, cognitive_step, content, embedding, created_at, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                ({columns})
+                VALUES ({placeholders})
                 RETURNING created_at
-            """, (
+            """, values)
+            row = cursor.fetchone()
+        if row:
+            memory_object.created_at = row[0]
+        else:
+            memory_object.created_at = now
+
+    def _cognitive_row(self, memory_object: MemoryObject):
+        return self._insert_values(
+            ["memory_id", "cognitive_step", "content", "embedding", "created_at", "metadata"],
+            [
                 str(memory_object.memory_id),
                 memory_object.cognitive_step,
                 memory_object.content,
                 memory_object.embedding,
-                now,
+                memory_object.created_at,
                 memory_object.serialize_metadata()
-            ))
-            row = self.db.cursor.fetchone()
-            if row:
-                memory_object.created_at = row[0]
-            else:
-                memory_object.created_at = now
+            ]
+        )
 
-            self.db.conn.commit()
-        except Exception as e:
-            self.db.conn.rollback()
-            raise e
+    @staticmethod
+    def store_cognitive_items_bulk(items: List[Tuple["CognitiveMemory", MemoryObject]]):
+        """
+        Insert the cognitive steps of many agents at once: the missing embeddings are computed
+        in one batched call and the rows are written with execute_values in a single transaction.
+        All memories must share one database connection.
+        """
+        if not items:
+            return
+        first_memory = items[0][0]
+
+        missing = [memory_object for _, memory_object in items if memory_object.embedding is None]
+        if missing:
+            embeddings = first_memory.embedder.get_embeddings([memory_object.content for memory_object in missing])
+            for memory_object, embedding in zip(missing, embeddings):
+                memory_object.embedding = embedding
+
+        now = datetime.now(timezone.utc)
+        rows_by_table = defaultdict(list)
+        for memory, memory_object in items:
+            memory_object.created_at = memory_object.created_at or now
+            columns, _, values = memory._cognitive_row(memory_object)
+            rows_by_table[(memory.cognitive_table, columns)].append(values)
+
+        with first_memory.db.connection() as cursor:
+            # one statement in the shared layout, one per agent table otherwise
+            for (table, columns), rows in rows_by_table.items():
+                execute_values(cursor, f"INSERT INTO {table} ({columns}) VALUES %s", rows, page_size=len(rows))
 
     def get_cognitive_items(
         self,
@@ -157,10 +201,8 @@ class CognitiveMemory(BaseMemory):
         """
         Retrieve a list of single-step memory items (short-term) from the agent's cognitive table.
         """
-        self.db.connect()
 
-        conditions = []
-        params = []
+        conditions, params = self.db.agent_scope(self.agent_id)
 
         if cognitive_step:
             if isinstance(cognitive_step, str):
@@ -207,32 +249,108 @@ class CognitiveMemory(BaseMemory):
             ORDER BY created_at ASC;
         """
 
-        try:
-            self.db.cursor.execute(query, tuple(params))
-            rows = self.db.cursor.fetchall()
-
-            items = []
-            for row in rows:
-                if len(row) != 6:
-                    continue
-
-                mem_id, step, content, embedding, created_at, meta = row
-                if isinstance(embedding, str):
-                    embedding = [float(x) for x in embedding.strip('[]').split(',')]
-
-                mo = MemoryObject(
-                    memory_id=UUID(mem_id),
-                    agent_id=self.agent_id,
-                    cognitive_step=step,
-                    content=content,
-                    embedding=embedding,
-                    created_at=created_at,
-                    metadata=meta if meta else {}
-                )
+        with self.db.connection() as cursor:
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
+
+        items = []
+        for row in rows:
+            mo = self._row_to_memory_object(row)
+            if mo is not None:
                 items.append(mo)
-            return items
-        except Exception as e:
-            raise e
+        return items
+
+    def _row_to_memory_object(self, row) -> Optional[MemoryObject]:
+        if len(row) != 6:
+            return None
+
+        mem_id, step, content, embedding, created_at, meta = row
+        if isinstance(embedding, str):
+            embedding = [float(x) for x in embedding.strip('[]').split(',')]
+
+        return MemoryObject(
+            memory_id=UUID(mem_id),
+            agent_id=self.agent_id,
+            cognitive_step=step,
+            content=content,
+            embedding=embedding,
+            created_at=created_at,
+            metadata=meta if meta else {}
+        )
+
+    @staticmethod
+    def get_cognitive_items_batch(memories: List["CognitiveMemory"], limit: int = 10) -> Dict[str, List[MemoryObject]]:
+        """
+        The `limit` most recent items of many agents in one query, oldest first as in
+        `get_cognitive_items`. All memories must share one database connection.
+        """
+        if not memories:
+            return {}
+        db = memories[0].db
+        columns = COGNITIVE_COLUMNS
+
+        if db.shared_layout:
+            query = f"""
+                SELECT q.agent_id, m.*
+                FROM unnest(%s::text[]) AS q(agent_id)
+                CROSS JOIN LATERAL (
+                    SELECT {columns}
+                    FROM {memories[0].cognitive_table} c
+                    WHERE c.agent_id = q.agent_id
+                    ORDER BY c.created_at DESC
+                    LIMIT %s
+                ) m;
+            """
+            params = ([memory.agent_id for memory in memories], limit)
+        else:
+            query = " UNION ALL ".join(
+                f"(SELECT %s, {columns} FROM {memory.cognitive_table} ORDER BY created_at DESC LIMIT %s)"
+                for memory in memories
+            )
+            params = tuple(value for memory in memories for value in (memory.agent_id, limit))
+
+        with db.connection() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        memories_by_agent = {memory.agent_id: memory for memory in memories}
+        items = {memory.agent_id: [] for memory in memories}
+        for agent_id, *row in rows:
+            mo = memories_by_agent[agent_id]._row_to_memory_object(row)
+            if mo is not None:
+                items[agent_id].append(mo)
+        for agent_items in items.values():
+            agent_items.sort(key=lambda mo: mo.created_at)
+        return items
+
+    def search_cognitive_items(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        cognitive_step: Optional[Union[str, List[str]]] = None
+    ) -> List[Tuple[MemoryObject, float]]:
+        """The items nearest to an embedding, with their cosine similarity."""
+        conditions, params = self.db.agent_scope(self.agent_id)
+        if cognitive_step:
+            steps = [cognitive_step] if isinstance(cognitive_step, str) else cognitive_step
+            conditions.append(f"cognitive_step IN ({', '.join(['%s'] * len(steps))})")
+            params.extend(steps)
+        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+
+        with self.db.connection() as cursor:
+            self.db.apply_search_settings(cursor)
+            cursor.execute(
+                agent_memory_query(self.cognitive_table, COGNITIVE_COLUMNS, where_clause, exact=self.db.shared_layout),
+                (query_embedding, *params, query_embedding, top_k)
+            )
+            rows = cursor.fetchall()
+
+        results = []
+        for *row, similarity in rows:
+            mo = self._row_to_memory_object(row)
+            if mo is not None:
+                results.append((mo, similarity))
+        return results
 
     def delete_cognitive_items(
         self,
@@ -245,10 +363,8 @@ class CognitiveMemory(BaseMemory):
         Delete rows from the short-term cognitive memory based on filters.
         Returns how many rows were deleted.
         """
-        self.db.connect()
 
-        conditions = []
-        params = []
+        conditions, params = self.db.agent_scope(self.agent_id)
 
         if cognitive_step:
             if isinstance(cognitive_step, str):
@@ -275,22 +391,18 @@ class CognitiveMemory(BaseMemory):
 
         where_clause = " AND ".join(conditions) if conditions else "TRUE"
 
-        try:
-            self.db.cursor.execute(
+        with self.db.connection() as cursor:
+            cursor.execute(
                 f"DELETE FROM {self.cognitive_table} WHERE {where_clause} RETURNING *;",
                 tuple(params)
             )
-            deleted_count = self.db.cursor.rowcount
-            self.db.conn.commit()
-            return deleted_count
-        except Exception as e:
-            self.db.conn.rollback()
-            raise e
+            return cursor.rowcount
 
 
 class EpisodicMemory(BaseMemory):
     """
-    Manages the 'episodic' memory table named agent_{agent_id}_episodic.
+    Manages the 'episodic' memory table named agent_{agent_id}_episodic
+    (or the agent's rows of the shared episodic table).
     Each row represents a full 'episode' containing multiple steps.
     """
 
@@ -302,32 +414,28 @@ class EpisodicMemory(BaseMemory):
         agent_id: str
     ):
         BaseMemory.__init__(self, config, db_conn, embedder, agent_id)
-        self.episodic_table = f"agent_{self.safe_id}_episodic"
+        self.episodic_table = self.db.episodic_memory_table(self.agent_id)
         self.db.create_agent_episodic_memory_table(self.agent_id)
 
     def store_episode(self, episode: EpisodicMemoryObject):
         """
-        Insert an entire 'episode' in agent_{agent_id}_episodic.
+        Insert an entire 'episode' in the agent's episodic table.
         """
-        self.db.connect()
-        try:
-            # If no embedding was provided, derive from the task_query + cognitive steps
-            if episode.embedding is None:
-                concat_str = f"Task:{episode.task_query} + Steps:{episode.cognitive_steps}"
-                episode.embedding = self.embedder.get_embeddings(concat_str)
+        # If no embedding was provided, derive from the task_query + cognitive steps
+        if episode.embedding is None:
+            concat_str = f"Task:{episode.task_query} + Steps:{episode.cognitive_steps}"
+            episode.embedding = self.embedder.get_embeddings(concat_str)
 
-            step_data = [step.dict() for step in episode.cognitive_steps]
-            strategy_data = episode.strategy_update if episode.strategy_update else []
-            meta = episode.metadata if episode.metadata else {}
+        step_data = [step.dict() for step in episode.cognitive_steps]
+        strategy_data = episode.strategy_update if episode.strategy_update else []
+        meta = episode.metadata if episode.metadata else {}
 
-            now = episode.created_at or datetime.now(timezone.utc)
+        now = episode.created_at or datetime.now(timezone.utc)
 
-            self.db.cursor.execute(f"""
-                INSERT INTO {self.episodic_table}
-                (memory_id, task_query, cognitive_steps, total_reward,
-                 strategy_update, embedding, created_at, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-            """, (
+        columns, placeholders, values = self._insert_values(
+            ["memory_id", "task_query", "cognitive_steps", "total_reward",
+             "strategy_update", "embedding", "created_at", "metadata"],
+            [
                 str(episode.memory_id),
                 episode.task_query,
                 json.dumps(step_data),
@@ -336,11 +444,14 @@ class EpisodicMemory(BaseMemory):
                 episode.embedding,
                 now,
                 json.dumps(meta),
-            ))
-            self.db.conn.commit()
-        except Exception as e:
-            self.db.conn.rollback()
-            raise e
+            ]
+        )
+        with self.db.connection() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {self.episodic_table}
+                ({columns})
+                VALUES ({placeholders});
+            """, values)
 
     def get_episodes(
         self,
@@ -352,10 +463,8 @@ class EpisodicMemory(BaseMemory):
         """
         Retrieve episodes in descending order of created_at.
         """
-        self.db.connect()
 
-        conditions = []
-        params = []
+        conditions, params = self.db.agent_scope(self.agent_id)
 
         if metadata_filters:
             for k, v in metadata_filters.items():
@@ -390,45 +499,43 @@ class EpisodicMemory(BaseMemory):
         """
         params.append(limit)
 
-        try:
-            self.db.cursor.execute(query, tuple(params))
-            rows = self.db.cursor.fetchall()
+        with self.db.connection() as cursor:
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
 
-            episodes = []
-            for row in rows:
-                (mem_id, task_query, steps_json, reward, strategy_json,
-                 embedding, created_at, meta) = row
+        episodes = []
+        for row in rows:
+            (mem_id, task_query, steps_json, reward, strategy_json,
+             embedding, created_at, meta) = row
 
-                if isinstance(steps_json, str):
-                    steps_list = json.loads(steps_json)
-                else:
-                    steps_list = steps_json or []
+            if isinstance(steps_json, str):
+                steps_list = json.loads(steps_json)
+            else:
+                steps_list = steps_json or []
 
-                if isinstance(strategy_json, str):
-                    strategy_list = json.loads(strategy_json)
-                else:
-                    strategy_list = strategy_json or []
-
-                if isinstance(embedding, str):
-                    embedding = [float(x) for x in embedding.strip('[]').split(',')]
-
-                csteps = [CognitiveStep(**step) for step in steps_list]
-
-                episode_obj = EpisodicMemoryObject(
-                    memory_id=UUID(mem_id),
-                    agent_id=self.agent_id,
-                    task_query=task_query,
-                    cognitive_steps=csteps,
-                    total_reward=reward,
-                    strategy_update=strategy_list,
-                    embedding=embedding,
-                    created_at=created_at,
-                    metadata=meta if meta else {}
-                )
-                episodes.append(episode_obj)
-            return episodes
-        except Exception as e:
-            raise e
+            if isinstance(strategy_json, str):
+                strategy_list = json.loads(strategy_json)
+            else:
+                strategy_list = strategy_json or []
+
+            if isinstance(embedding, str):
+                embedding = [float(x) for x in embedding.strip('[]').split(',')]
+
+            csteps = [CognitiveStep(**step) for step in steps_list]
+
+            episode_obj = EpisodicMemoryObject(
+                memory_id=UUID(mem_id),
+                agent_id=self.agent_id,
+                task_query=task_query,
+                cognitive_steps=csteps,
+                total_reward=reward,
+                strategy_update=strategy_list,
+                embedding=embedding,
+                created_at=created_at,
+                metadata=meta if meta else {}
+            )
+            episodes.append(episode_obj)
+        return episodes
 
     def delete_episodes(
         self,
@@ -440,10 +547,8 @@ class EpisodicMemory(BaseMemory):
         Delete entire episodes based on optional filters.
         Returns how many rows were deleted.
         """
-        self.db.connect()
 
-        conditions = []
-        params = []
+        conditions, params = self.db.agent_scope(self.agent_id)
 
         if task_query:
             conditions.append("task_query = %s")
@@ -459,36 +564,51 @@ class EpisodicMemory(BaseMemory):
 
         where_clause = " AND ".join(conditions) if conditions else "TRUE"
 
-        try:
-            self.db.cursor.execute(
+        with self.db.connection() as cursor:
+            cursor.execute(
                 f"DELETE FROM {self.episodic_table} WHERE {where_clause} RETURNING *;",
                 tuple(params)
             )
-            deleted_count = self.db.cursor.rowcount
-            self.db.conn.commit()
-            return deleted_count
-        except Exception as e:
-            self.db.conn.rollback()
-            raise e
+            return cursor.rowcount
 
 class ShortTermMemory(BaseModel):
+    """
+    Short-term memory of an agent. With `local_memory_index` enabled, the memories of the run
+    are mirrored in a `LocalMemoryIndex` that answers lookups in process, and writes reach
+    Postgres in the background (write-behind): `flush()` waits until they are durable.
+    """
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     cognitive_memory: CognitiveMemory
     items_cache: List[MemoryObject] = Field(default_factory=list)
+    local_index: Optional[LocalMemoryIndex] = None
+    pending_writes: set = Field(default_factory=set)
 
     def __init__(self, memory_config: MarketMemoryConfig, db_conn: DatabaseConnection, agent_id: str):
         super().__init__(
-            cognitive_memory=CognitiveMemory(memory_config, db_conn, MemoryEmbedder(memory_config), agent_id)
+            cognitive_memory=CognitiveMemory(memory_config, db_conn, get_embedder(memory_config), agent_id),
+            local_index=LocalMemoryIndex(memory_config.local_index_max_items) if memory_config.local_memory_index else None
         )
 
     async def store_memory(self, memory_object: MemoryObject):
         """
-        Asynchronously store memory by offloading the synchronous DB call
-        to a thread pool. Use run_in_executor so we can call create_task().
+        Asynchronously store memory on the database thread pool, with a pooled
+        connection of its own, so it can be scheduled with create_task().
+        With the local index, the memory is indexed at once and written behind.
         """
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self._store_memory_sync, memory_object)
+        if memory_object.embedding is None:
+            memory_object.embedding = await self.cognitive_memory.embedder.aget_embeddings(memory_object.content)
+        if self.local_index is None:
+            await self.cognitive_memory.db.run(self._store_memory_sync, memory_object)
+            return
+
+        memory_object.created_at = memory_object.created_at or datetime.now(timezone.utc)
+        self.local_index.add([memory_object])
+        self.items_cache.append(memory_object)
+        ShortTermMemory._write_behind(
+            [self],
+            self.cognitive_memory.db.run(self.cognitive_memory.store_cognitive_item, memory_object)
+        )
 
     def _store_memory_sync(self, memory_object: MemoryObject):
         """
@@ -497,6 +617,66 @@ class ShortTermMemory(BaseModel):
         self.cognitive_memory.store_cognitive_item(memory_object)
         self.items_cache.append(memory_object)
 
+    @staticmethod
+    def _write_behind(memories: List["ShortTermMemory"], write):
+        """Run a database write in the background; failed writes stay pending so `flush()` raises them."""
+        task = asyncio.ensure_future(write)
+        for memory in memories:
+            memory.pending_writes.add(task)
+
+        def done(task):
+            if task.cancelled() or task.exception() is not None:
+                if not task.cancelled():
+                    logging.getLogger(__name__).error(f"Write-behind of short-term memory failed: {task.exception()}")
+                return
+            for memory in memories:
+                memory.pending_writes.discard(task)
+
+        task.add_done_callback(done)
+
+    async def flush(self):
+        """Wait until the written-behind memories are stored in the database."""
+        while self.pending_writes:
+            pending = list(self.pending_writes)
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            self.pending_writes.difference_update(pending)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+
+    @staticmethod
+    async def store_memories_bulk(items: List[Tuple["ShortTermMemory", MemoryObject]]):
+        """
+        Store the memories of many agents in one batched write, for example all the
+        perceptions of a phase. The missing embeddings are fetched with the async embedder
+        before the write. See `CognitiveMemory.store_cognitive_items_bulk`.
+        """
+        if not items:
+            return
+        missing = [memory_object for _, memory_object in items if memory_object.embedding is None]
+        if missing:
+            embeddings = await items[0][0].cognitive_memory.embedder.aget_embeddings(
+                [memory_object.content for memory_object in missing]
+            )
+            for memory_object, embedding in zip(missing, embeddings):
+                memory_object.embedding = embedding
+        write = items[0][0].cognitive_memory.db.run(
+            CognitiveMemory.store_cognitive_items_bulk,
+            [(memory.cognitive_memory, memory_object) for memory, memory_object in items]
+        )
+        if items[0][0].local_index is None:
+            await write
+            for memory, memory_object in items:
+                memory.items_cache.append(memory_object)
+            return
+
+        now = datetime.now(timezone.utc)
+        for memory, memory_object in items:
+            memory_object.created_at = memory_object.created_at or now
+            memory.local_index.add([memory_object])
+            memory.items_cache.append(memory_object)
+        ShortTermMemory._write_behind(list({id(memory): memory for memory, _ in items}.values()), write)
+
     async def retrieve_recent_memories(
         self,
         limit: int = 10,
@@ -505,16 +685,66 @@ class ShortTermMemory(BaseModel):
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None
     ) -> List[MemoryObject]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            lambda: self.cognitive_memory.get_cognitive_items(
-                limit=limit,
+        if self.local_index is not None:
+            recent = self.local_index.recent(
+                limit,
                 cognitive_step=cognitive_step,
                 metadata_filters=metadata_filters,
                 start_time=start_time,
                 end_time=end_time
             )
+            if recent is not None:
+                return recent
+            await self.flush()
+        return await self.cognitive_memory.db.run(
+            self.cognitive_memory.get_cognitive_items,
+            limit=limit,
+            cognitive_step=cognitive_step,
+            metadata_filters=metadata_filters,
+            start_time=start_time,
+            end_time=end_time
+        )
+
+    @staticmethod
+    async def retrieve_recent_memories_batch(memories: List["ShortTermMemory"], limit: int = 10) -> Dict[str, List[MemoryObject]]:
+        """The recent memories of many agents, by agent id, in one query for those the local index cannot answer."""
+        if not memories:
+            return {}
+        items = {}
+        remote = []
+        for memory in memories:
+            recent = memory.local_index.recent(limit) if memory.local_index is not None else None
+            if recent is not None:
+                items[memory.cognitive_memory.agent_id] = recent
+            else:
+                remote.append(memory)
+        if remote:
+            await asyncio.gather(*(memory.flush() for memory in remote))
+            items.update(await remote[0].cognitive_memory.db.run(
+                CognitiveMemory.get_cognitive_items_batch,
+                [memory.cognitive_memory for memory in remote],
+                limit
+            ))
+        return items
+
+    async def search_memories(
+        self,
+        query: str,
+        top_k: int = 5,
+        cognitive_step: Optional[Union[str, List[str]]] = None
+    ) -> List[Tuple[MemoryObject, float]]:
+        """The memories most similar to a query, with their cosine similarity."""
+        query_embedding = await self.cognitive_memory.embedder.aget_embeddings(query)
+        if self.local_index is not None:
+            results = self.local_index.search(query_embedding, top_k, cognitive_step=cognitive_step)
+            if results is not None:
+                return results
+            await self.flush()
+        return await self.cognitive_memory.db.run(
+            self.cognitive_memory.search_cognitive_items,
+            query_embedding,
+            top_k,
+            cognitive_step
         )
 
     async def clear_memories(
@@ -524,15 +754,15 @@ class ShortTermMemory(BaseModel):
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None
     ) -> int:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            lambda: self.cognitive_memory.delete_cognitive_items(
-                cognitive_step=cognitive_step,
-                metadata_filters=metadata_filters,
-                start_time=start_time,
-                end_time=end_time
-            )
+        if self.local_index is not None:
+            self.local_index.remove(cognitive_step, metadata_filters, start_time, end_time)
+            await self.flush()
+        return await self.cognitive_memory.db.run(
+            self.cognitive_memory.delete_cognitive_items,
+            cognitive_step=cognitive_step,
+            metadata_filters=metadata_filters,
+            start_time=start_time,
+            end_time=end_time
         )
 
 class LongTermMemory(BaseModel):
@@ -541,7 +771,7 @@ class LongTermMemory(BaseModel):
     episodic_store: EpisodicMemory
 
     def __init__(self, memory_config: MarketMemoryConfig, db_conn: DatabaseConnection, agent_id: str):
-        embedder = MemoryEmbedder(memory_config)
+        embedder = get_embedder(memory_config)
         super().__init__(
             memory_retriever=MemoryRetriever(config=memory_config, db_conn=db_conn, embedding_service=embedder),
             episodic_store=EpisodicMemory(memory_config, db_conn, embedder, agent_id)
@@ -557,12 +787,10 @@ class LongTermMemory(BaseModel):
         metadata: Optional[Dict[str, Any]] = None
     ):
         """
-        An async wrapper that calls `_store_episodic_memory_sync` via run_in_executor
+        An async wrapper that runs `_store_episodic_memory_sync` on the database thread pool
         so we can schedule it with create_task(...).
         """
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
+        await self.episodic_store.db.run(
             self._store_episodic_memory_sync,
             agent_id,
             task_query,
@@ -624,38 +852,56 @@ class LongTermMemory(BaseModel):
         query: str,
         top_k: int = 5
     ) -> List[EpisodicMemoryObject]:
-        loop = asyncio.get_event_loop()
-        retrieved = await loop.run_in_executor(
-            None,
-            lambda: self.memory_retriever.search_agent_episodic_memory(
-                agent_id=agent_id,
-                query=query,
-                top_k=top_k
-            )
+        retrieved = await self.episodic_store.db.run(
+            self.memory_retriever.search_agent_episodic_memory,
+            agent_id=agent_id,
+            query=query,
+            top_k=top_k
         )
-        episodes = []
-        for memory_item in retrieved:
-            content_dict = json.loads(memory_item.text)
-            steps_json = content_dict.get("cognitive_steps", [])
-            step_objs = [CognitiveStep(**step) for step in steps_json]
-            
-            created_at_str = content_dict.get("created_at")
-            created_at = datetime.fromisoformat(created_at_str)
-
-            eobj = EpisodicMemoryObject(
-                memory_id=UUID(content_dict["memory_id"]),
-                agent_id=agent_id,
-                task_query=content_dict.get("task_query", ""),
-                cognitive_steps=step_objs,
-                total_reward=content_dict.get("total_reward"),
-                strategy_update=content_dict.get("strategy_update"),
-                created_at=created_at,
-                metadata=content_dict.get("metadata", {}),
-                similarity=round(memory_item.similarity, 2)
-            )
-            episodes.append(eobj)
+        return [self._to_episode(agent_id, memory_item) for memory_item in retrieved]
 
-        return episodes
+    @staticmethod
+    async def retrieve_episodic_memories_batch(
+        queries: List[Tuple["LongTermMemory", str]],
+        top_k: int = 5
+    ) -> Dict[str, List[EpisodicMemoryObject]]:
+        """
+        The episodes most similar to one query per agent, by agent id, with one embedding
+        request and one SQL statement. See `MemoryRetriever.search_agent_episodic_memory_batch`.
+        """
+        if not queries:
+            return {}
+        first_memory = queries[0][0]
+        retrieved = await first_memory.episodic_store.db.run(
+            first_memory.memory_retriever.search_agent_episodic_memory_batch,
+            [(memory.episodic_store.agent_id, query) for memory, query in queries],
+            top_k
+        )
+        return {
+            agent_id: [LongTermMemory._to_episode(agent_id, memory_item) for memory_item in memory_items]
+            for agent_id, memory_items in retrieved.items()
+        }
+
+    @staticmethod
+    def _to_episode(agent_id: str, memory_item) -> EpisodicMemoryObject:
+        content_dict = json.loads(memory_item.text)
+        steps_json = content_dict.get("cognitive_steps", [])
+        step_objs = [CognitiveStep(**step) for step in steps_json]
+
+        created_at_str = content_dict.get("created_at")
+        created_at = datetime.fromisoformat(created_at_str)
+
+        return EpisodicMemoryObject(
+            memory_id=UUID(content_dict["memory_id"]),
+            agent_id=agent_id,
+            task_query=content_dict.get("task_query", ""),
+            cognitive_steps=step_objs,
+            total_reward=content_dict.get("total_reward"),
+            strategy_update=content_dict.get("strategy_update"),
+            created_at=created_at,
+            metadata=content_dict.get("metadata", {}),
+            similarity=round(memory_item.similarity, 2)
+        )
 
     async def delete_episodic_memory(
         self,
@@ -664,12 +910,9 @@ class LongTermMemory(BaseModel):
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None
     ) -> int:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            lambda: self.episodic_store.delete_episodes(
-                task_query=task_query,
-                start_time=start_time,
-                end_time=end_time
-            )
+        return await self.episodic_store.db.run(
+            self.episodic_store.delete_episodes,
+            task_query=task_query,
+            start_time=start_time,
+            end_time=end_time
         )
@@ -0,0 +1,102 @@
+"""
+Migration of agent memories from per-agent tables to the shared, partitioned tables.
+
+Copies the rows of every `agent_<id>_cognitive` and `agent_<id>_episodic` table into
+`agent_cognitive_memory` and `agent_episodic_memory`, one transaction per agent table, and
+optionally drops the per-agent tables once copied. Rows already present in the shared tables
+are skipped, so an interrupted migration can be run again.
+
+    python -m trade_agents.memory.migrate_memory --config trade_agents/memory/memory_config.yaml --drop
+"""
+
+import argparse
+import logging
+import re
+from typing import Dict, List, Optional
+
+from trade_agents.memory.config import load_config_from_yaml
+from trade_agents.memory.setup_db import COGNITIVE_MEMORY_TABLE, EPISODIC_MEMORY_TABLE, DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+_AGENT_TABLE = re.compile(r'^agent_(?P<agent_id>.+)_(?P<kind>cognitive|episodic)$')
+_SANITIZED_UUID = re.compile(r'^[0-9a-f]{8}_[0-9a-f]{4}_[0-9a-f]{4}_[0-9a-f]{4}_[0-9a-f]{12}$')
+
+MEMORY_COLUMNS = {
+    "cognitive": ["memory_id", "cognitive_step", "content", "embedding", "created_at", "metadata"],
+    "episodic": ["memory_id", "task_query", "cognitive_steps", "total_reward",
+                 "strategy_update", "embedding", "created_at", "metadata"],
+}
+SHARED_TABLES = {"cognitive": COGNITIVE_MEMORY_TABLE, "episodic": EPISODIC_MEMORY_TABLE}
+
+
+def agent_id_from_table(table_name: str) -> Optional[str]:
+    """
+    Agent id of a per-agent memory table. Table names replace the hyphens of an id with
+    underscores, which is undone for UUIDs; other ids are kept as they appear in the name.
+    """
+    match = _AGENT_TABLE.match(table_name)
+    if not match:
+        return None
+    agent_id = match.group("agent_id")
+    if _SANITIZED_UUID.match(agent_id):
+        agent_id = agent_id.replace('_', '-')
+    return agent_id
+
+
+def find_agent_memory_tables(db: DatabaseConnection) -> Dict[str, List[str]]:
+    """Per-agent memory tables of the database, by memory kind."""
+    db.connect()
+    db.cursor.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_schema = current_schema() AND table_name LIKE 'agent\\_%'
+        ORDER BY table_name;
+    """)
+    tables = {"cognitive": [], "episodic": []}
+    for (table_name,) in db.cursor.fetchall():
+        match = _AGENT_TABLE.match(table_name)
+        if match:
+            tables[match.group("kind")].append(table_name)
+    return tables
+
+
+def migrate_agent_memory(db: DatabaseConnection, drop_tables: bool = False) -> Dict[str, int]:
+    """Copy every per-agent memory table into the shared tables, returning the rows copied per kind."""
+    db.create_shared_memory_tables()
+    copied = {"cognitive": 0, "episodic": 0}
+    for kind, tables in find_agent_memory_tables(db).items():
+        columns = ", ".join(MEMORY_COLUMNS[kind])
+        for table in tables:
+            agent_id = agent_id_from_table(table)
+            try:
+                db.cursor.execute(f"""
+                    INSERT INTO {SHARED_TABLES[kind]} (agent_id, {columns})
+                    SELECT %s, {columns} FROM {table}
+                    ON CONFLICT (agent_id, memory_id) DO NOTHING;
+                """, (agent_id,))
+                copied[kind] += db.cursor.rowcount
+                if drop_tables:
+                    db.cursor.execute(f"DROP TABLE {table};")
+                db.conn.commit()
+            except Exception as e:
+                db.conn.rollback()
+                logger.error(f"Failed to migrate {table}: {e}")
+                raise
+            logger.info(f"Migrated {table} for agent {agent_id}")
+    return copied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Migrate per-agent memory tables to the shared layout")
+    parser.add_argument("--config", default="trade_agents/memory/memory_config.yaml")
+    parser.add_argument("--drop", action="store_true", help="Drop the per-agent tables once copied")
+    args = parser.parse_args()
+
+    db = DatabaseConnection(load_config_from_yaml(args.config))
+    try:
+        counts = migrate_agent_memory(db, drop_tables=args.drop)
+        print(f"Copied {counts['cognitive']} cognitive and {counts['episodic']} episodic rows")
+        print("Set memory_layout: shared in the memory config to use the shared tables")
+    finally:
+        db.close()
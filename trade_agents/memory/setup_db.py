@@ -1,38 +1,183 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
 import psycopg2
 from psycopg2.errors import DuplicateDatabase
+from psycopg2.pool import ThreadedConnectionPool
+
+COGNITIVE_MEMORY_TABLE = "agent_cognitive_memory"
+EPISODIC_MEMORY_TABLE = "agent_episodic_memory"
 
 
 class DatabaseConnection:
+    """
+    Connections to the memory database.
+
+    Schema management uses a single connection (`conn`/`cursor`). Memory reads and writes
+    take a connection of their own from a pool for the duration of one operation (see
+    `connection()`), and the async memory API runs them on a thread pool sized to the
+    connection pool (see `run()`), so agents query the database concurrently.
+
+    With `memory_layout: per_agent` every agent has its own cognitive and episodic tables.
+    With `memory_layout: shared` all agents write to one cognitive and one episodic table,
+    hash-partitioned by `agent_id`, and queries are scoped by an `agent_id` condition.
+
+    Vector indexes use `index_method` (ivfflat or hnsw) and its build parameters. With
+    `defer_index_build` the knowledge base indexes are only recorded at table creation and
+    built by `build_deferred_indexes()` once the documents are loaded. Agent memory tables
+    fill row by row during the simulation, so their indexes are always built with the table;
+    the shared tables have no vector index, their searches rank each agent's rows exactly.
+    """
+
     def __init__(self, config):
         self.config = config
         self.conn = None
         self.cursor = None
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self._pool_slots = None
+        self._executor = None
+        self._shared_tables_ready = False
+        self.deferred_indexes: Dict[str, str] = {}
+
+    def _connect_kwargs(self) -> dict:
+        return dict(
+            dbname=self.config.dbname,
+            user=self.config.user,
+            password=self.config.password,
+            host=self.config.host,
+            port=self.config.port,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=5,
+            options=f"-c statement_timeout={self.config.statement_timeout}"
+        )
 
     def connect(self):
         """Establish a new connection if needed"""
         if self.conn is None or (hasattr(self.conn, 'closed') and self.conn.closed):
-            self.conn = psycopg2.connect(
-                dbname=self.config.dbname,
-                user=self.config.user,
-                password=self.config.password,
-                host=self.config.host,
-                port=self.config.port,
-                keepalives=1,
-                keepalives_idle=30,
-                keepalives_interval=10,
-                keepalives_count=5
-            )
+            self.conn = psycopg2.connect(**self._connect_kwargs())
             self.conn.set_session(autocommit=False)
             self.cursor = self.conn.cursor()
-            
-            self.cursor.execute("SET statement_timeout = '60s'")
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._pool_lock:
+            if self.pool is None or self.pool.closed:
+                self.pool = ThreadedConnectionPool(
+                    self.config.pool_min_size,
+                    self.config.pool_max_size,
+                    **self._connect_kwargs()
+                )
+                # getconn() raises once the pool is exhausted, callers wait for a slot instead
+                self._pool_slots = threading.BoundedSemaphore(self.config.pool_max_size)
+            return self.pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Cursor on a pooled connection for one operation.
+        Commits when the block succeeds and rolls back when it raises.
+        """
+        pool = self._get_pool()
+        slots = self._pool_slots
+        slots.acquire()
+        conn = None
+        try:
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    yield cursor
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # broken connections are discarded rather than returned to the pool
+            if conn is not None:
+                pool.putconn(conn, close=True)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                pool.putconn(conn, close=bool(conn.closed))
+            slots.release()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.pool_max_size,
+                    thread_name_prefix="memory-db"
+                )
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking memory operation on the database thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
 
     def close(self):
-        """Close the database connection."""
+        """Close the database connection, the connection pool and its threads."""
         if self.cursor:
             self.cursor.close()
         if self.conn:
             self.conn.close()
+        with self._pool_lock:
+            if self.pool is not None and not self.pool.closed:
+                self.pool.closeall()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def vector_index_clause(self, method: Optional[str] = None) -> str:
+        """Access method and build parameters of a cosine index on `embedding`."""
+        method = method or self.config.index_method
+        if method == "hnsw":
+            return (f"USING hnsw (embedding vector_cosine_ops) "
+                    f"WITH (m = {self.config.hnsw_m}, ef_construction = {self.config.hnsw_ef_construction})")
+        if method == "ivfflat":
+            return f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {self.config.lists})"
+        raise ValueError(f"Unknown index method: {method}")
+
+    def _create_vector_index(self, index_name: str, table: str, method: Optional[str] = None, deferrable: bool = False):
+        statement = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} {self.vector_index_clause(method)};"
+        if deferrable and self.config.defer_index_build:
+            self.deferred_indexes[index_name] = statement
+        else:
+            self.cursor.execute(statement)
+
+    def build_deferred_indexes(self) -> List[str]:
+        """
+        Build the vector indexes deferred at table creation, after a bulk ingest: an IVFFlat
+        index clusters the rows present at build time, and inserting into an index is slower
+        than building it once. Returns the names of the indexes built.
+        """
+        if not self.deferred_indexes:
+            return []
+        self.connect()
+        built = []
+        for index_name, statement in list(self.deferred_indexes.items()):
+            try:
+                self.cursor.execute(statement)
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
+            del self.deferred_indexes[index_name]
+            built.append(index_name)
+        return built
+
+    def apply_search_settings(self, cursor):
+        """Set the recall/speed trade-off of vector searches for the current transaction."""
+        cursor.execute(f"SET LOCAL hnsw.ef_search = {int(self.config.hnsw_ef_search)};")
+        cursor.execute(f"SET LOCAL ivfflat.probes = {int(self.config.ivfflat_probes)};")
 
     def _ensure_database_exists(self):
         """Ensure the database exists, creating it if necessary."""
@@ -103,19 +248,98 @@ class DatabaseConnection:
         """)
 
         # Add vector index for the chunks
+        self._create_vector_index(f"{base_name}_chunks_index", knowledge_chunks_table, deferrable=True)
+
+        self.conn.commit()
+
+    @property
+    def shared_layout(self) -> bool:
+        return self.config.memory_layout == "shared"
+
+    def cognitive_memory_table(self, agent_id: str) -> str:
+        if self.shared_layout:
+            return COGNITIVE_MEMORY_TABLE
+        return f"agent_{self._sanitize_table_name(agent_id)}_cognitive"
+
+    def episodic_memory_table(self, agent_id: str) -> str:
+        if self.shared_layout:
+            return EPISODIC_MEMORY_TABLE
+        return f"agent_{self._sanitize_table_name(agent_id)}_episodic"
+
+    def agent_scope(self, agent_id: str) -> Tuple[List[str], List[Any]]:
+        """WHERE conditions and parameters restricting a memory query to one agent."""
+        if self.shared_layout:
+            return ["agent_id = %s"], [agent_id]
+        return [], []
+
+    def _create_shared_memory_table(self, table: str, columns: str):
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                agent_id TEXT NOT NULL,
+                memory_id UUID NOT NULL,
+                {columns},
+                embedding vector({self.config.vector_dim}),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                metadata JSONB DEFAULT '{{}}'::jsonb,
+                PRIMARY KEY (agent_id, memory_id)
+            ) PARTITION BY HASH (agent_id);
+        """)
+        for remainder in range(self.config.memory_partitions):
+            self.cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table}_p{remainder}
+                PARTITION OF {table}
+                FOR VALUES WITH (MODULUS {self.config.memory_partitions}, REMAINDER {remainder});
+            """)
+        # searches select an agent's rows through the (agent_id, created_at) index and rank them
+        # exactly (see `agent_memory_query`), so a vector index would only slow down inserts;
+        # the DROP removes the one earlier versions created on every partition
+        self.cursor.execute(f"DROP INDEX IF EXISTS {table}_embedding_index;")
         self.cursor.execute(f"""
-            CREATE INDEX IF NOT EXISTS {base_name}_chunks_index
-            ON {knowledge_chunks_table} USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = {self.config.lists});
+            CREATE INDEX IF NOT EXISTS {table}_recent_index
+            ON {table} (agent_id, created_at DESC);
         """)
 
-        self.conn.commit()
+    def create_shared_memory_tables(self):
+        """Create the shared cognitive and episodic tables, partitioned by agent_id."""
+        if self._shared_tables_ready:
+            return
+        self.connect()
+        try:
+            self._create_shared_memory_table(COGNITIVE_MEMORY_TABLE, """
+                cognitive_step TEXT,
+                content TEXT""")
+            self._create_shared_memory_table(EPISODIC_MEMORY_TABLE, """
+                task_query TEXT,
+                cognitive_steps JSONB,
+                total_reward DOUBLE PRECISION,
+                strategy_update JSONB""")
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise e
+        self._shared_tables_ready = True
+
+    def _clear_agent_memory(self, table: str, agent_id: str):
+        self.connect()
+        try:
+            if self.shared_layout:
+                self.cursor.execute(f"DELETE FROM {table} WHERE agent_id = %s;", (agent_id,))
+            else:
+                self.cursor.execute(f"TRUNCATE TABLE {table};")
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise e
 
     def create_agent_cognitive_memory_table(self, agent_id: str):
         """
         Create a separate cognitive memory table for a specific agent.
         This can store single-step or short-horizon items (akin to 'STM').
+        In the shared layout this only ensures the shared tables exist.
         """
+        if self.shared_layout:
+            self.create_shared_memory_tables()
+            return
         self.connect()
         sanitized_agent_id = self._sanitize_table_name(agent_id)
         cognitive_table = f"agent_{sanitized_agent_id}_cognitive"
@@ -131,12 +355,7 @@ class DatabaseConnection:
             );
         """)
 
-        index_name = f"agent_{sanitized_agent_id}_cognitive_index"
-        self.cursor.execute(f"""
-            CREATE INDEX IF NOT EXISTS {index_name}
-            ON {cognitive_table} USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = {self.config.lists});
-        """)
+        self._create_vector_index(f"agent_{sanitized_agent_id}_cognitive_index", cognitive_table)
 
         self.conn.commit()
 
@@ -147,22 +366,18 @@ class DatabaseConnection:
 
     def clear_agent_cognitive_memory(self, agent_id: str):
         """Clear all cognitive memory entries for a specific agent."""
-        self.connect()
-        sanitized_agent_id = self._sanitize_table_name(agent_id)
-        cognitive_table = f"agent_{sanitized_agent_id}_cognitive"
-        try:
-            self.cursor.execute(f"TRUNCATE TABLE {cognitive_table};")
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
+        self._clear_agent_memory(self.cognitive_memory_table(agent_id), agent_id)
 
     def create_agent_episodic_memory_table(self, agent_id: str):
         """
         Create a separate episodic memory table for a specific agent.
         Each row will store an entire 'episode' (cognitive_steps in JSON),
         plus other relevant episodic info (task_query, total_reward, etc.).
+        In the shared layout this only ensures the shared tables exist.
         """
+        if self.shared_layout:
+            self.create_shared_memory_tables()
+            return
         self.connect()
         sanitized_agent_id = self._sanitize_table_name(agent_id)
         episodic_table = f"agent_{sanitized_agent_id}_episodic"
@@ -180,12 +395,7 @@ class DatabaseConnection:
             );
         """)
 
-        index_name = f"agent_{sanitized_agent_id}_episodic_index"
-        self.cursor.execute(f"""
-            CREATE INDEX IF NOT EXISTS {index_name}
-            ON {episodic_table} USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = {self.config.lists});
-        """)
+        self._create_vector_index(f"agent_{sanitized_agent_id}_episodic_index", episodic_table)
 
         self.conn.commit()
 
@@ -196,12 +406,4 @@ class DatabaseConnection:
 
     def clear_agent_episodic_memory(self, agent_id: str):
         """Clear all episodic (long-horizon) memory entries for a specific agent."""
-        self.connect()
-        sanitized_agent_id = self._sanitize_table_name(agent_id)
-        episodic_table = f"agent_{sanitized_agent_id}_episodic"
-        try:
-            self.cursor.execute(f"TRUNCATE TABLE {episodic_table};")
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
\ No newline at end of file
+        self._clear_agent_memory(self.episodic_memory_table(agent_id), agent_id)
\ No newline at end of file
@@ -1,5 +1,5 @@
 import json
-from typing import List
+from typing import Dict, List, Tuple
 from pydantic import BaseModel
 
 class RetrievedMemory(BaseModel):
@@ -8,6 +8,57 @@ class RetrievedMemory(BaseModel):
     context: str = ""
 
 
+def knowledge_base_query(chunks_table: str, objects_table: str) -> str:
+    """
+    Top chunks of a knowledge base. The nearest candidates are fetched in index order first;
+    the similarity threshold and the dedup of identical texts only apply to that candidate set.
+    Parameters: query embedding (twice), candidate count, threshold, top_k.
+    """
+    return f"""
+        WITH candidates AS (
+            SELECT c.id, c.text, c.start_pos, c.end_pos, c.knowledge_id,
+                   c.embedding <=> %s::vector AS distance
+            FROM {chunks_table} c
+            ORDER BY c.embedding <=> %s::vector
+            LIMIT %s
+        ), unique_chunks AS (
+            SELECT DISTINCT ON (text) *
+            FROM candidates
+            WHERE (1 - distance) >= %s
+            ORDER BY text, distance
+        )
+        SELECT u.id, u.text, u.start_pos, u.end_pos, k.content, (1 - u.distance) AS similarity
+        FROM unique_chunks u
+        JOIN {objects_table} k ON u.knowledge_id = k.knowledge_id
+        ORDER BY u.distance
+        LIMIT %s;
+    """
+
+
+def agent_memory_query(table: str, columns: str, where_clause: str, exact: bool = False) -> str:
+    """
+    Nearest memories of one agent, in index order.
+    Parameters: query embedding, the agent scope parameters, query embedding, top_k.
+
+    In the shared layout (`exact=True`) a partition holds the memories of many agents, and an
+    approximate index over all of them would only return `hnsw.ef_search` candidates before
+    the agent filter applies. The shared tables therefore have no vector index: the agent's
+    rows are selected through the (agent_id, created_at) index and ranked exactly. The
+    OFFSET 0 subquery keeps that plan should a vector index be added to the table.
+    """
+    source = f"(SELECT * FROM {table} WHERE {where_clause} OFFSET 0) scoped" if exact else f"{table} WHERE {where_clause}"
+    return f"""
+        SELECT {columns},
+               (1 - (embedding <=> %s::vector)) AS similarity
+        FROM {source}
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+    """
+
+
+EPISODIC_COLUMNS = "memory_id, task_query, cognitive_steps, total_reward, strategy_update, metadata, created_at"
+
+
 class MemoryRetriever:
     """
     MemoryRetriever provides methods to search stored documents or agent memories
@@ -30,27 +81,19 @@ class MemoryRetriever:
         try:
             self.db.conn.rollback()
             self.db.ensure_connection()
-            
+            self.db.apply_search_settings(self.db.cursor)
+
             query_embedding = self.embedding_service.get_embeddings(query)
             top_k = top_k or self.config.top_k
 
             knowledge_chunks_table = f"{table_prefix}_knowledge_chunks"
             knowledge_objects_table = f"{table_prefix}_knowledge_objects"
 
-            self.db.cursor.execute(f"""
-                WITH ranked_chunks AS (
-                    SELECT DISTINCT ON (c.text)
-                        c.id, c.text, c.start_pos, c.end_pos, k.content,
-                        (1 - (c.embedding <=> %s::vector)) AS similarity
-                    FROM {knowledge_chunks_table} c
-                    JOIN {knowledge_objects_table} k ON c.knowledge_id = k.knowledge_id
-                    WHERE (1 - (c.embedding <=> %s::vector)) >= %s
-                    ORDER BY c.text, similarity DESC
-                )
-                SELECT * FROM ranked_chunks
-                ORDER BY similarity DESC
-                LIMIT %s;
-            """, (query_embedding, query_embedding, self.config.similarity_threshold, top_k))
+            self.db.cursor.execute(
+                knowledge_base_query(knowledge_chunks_table, knowledge_objects_table),
+                (query_embedding, query_embedding, top_k * self.config.search_overfetch,
+                 self.config.similarity_threshold, top_k)
+            )
 
             results = []
             rows = self.db.cursor.fetchall()
@@ -70,23 +113,22 @@ class MemoryRetriever:
 
     def search_agent_cognitive_memory(self, agent_id: str, query: str, top_k: int = None) -> List[RetrievedMemory]:
         """Search a specific agent's cognitive memory"""
-        self.db.connect()
         query_embedding = self.embedding_service.get_embeddings(query)
         top_k = top_k or self.config.top_k
         
-        safe_id = self._sanitize_id(agent_id)
-        agent_cognitive_table = f"agent_{safe_id}_cognitive"
-
-        self.db.cursor.execute(f"""
-            SELECT content,
-                   (1 - (embedding <=> %s::vector)) AS similarity
-            FROM {agent_cognitive_table}
-            ORDER BY similarity DESC
-            LIMIT %s;
-        """, (query_embedding, top_k))
+        agent_cognitive_table = self.db.cognitive_memory_table(agent_id)
+        conditions, params = self.db.agent_scope(agent_id)
+        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+
+        with self.db.connection() as cursor:
+            self.db.apply_search_settings(cursor)
+            cursor.execute(
+                agent_memory_query(agent_cognitive_table, "content", where_clause, exact=self.db.shared_layout),
+                (query_embedding, *params, query_embedding, top_k)
+            )
+            rows = cursor.fetchall()
 
         results = []
-        rows = self.db.cursor.fetchall()
         for row in rows:
             content, sim = row
             results.append(RetrievedMemory(text=content, similarity=sim))
@@ -94,44 +136,90 @@ class MemoryRetriever:
 
     def search_agent_episodic_memory(self, agent_id: str, query: str, top_k: int = None) -> List[RetrievedMemory]:
         """Search an agent's episodic memory"""
-        self.db.connect()
         query_embedding = self.embedding_service.get_embeddings(query)
         top_k = top_k or self.config.top_k
 
-        safe_id = self._sanitize_id(agent_id)
-        agent_episodic_table = f"agent_{safe_id}_episodic"
-
-        self.db.cursor.execute(f"""
-            SELECT 
-                memory_id, 
-                task_query, 
-                cognitive_steps,
-                total_reward, 
-                strategy_update, 
-                metadata,
-                created_at,
-                (1 - (embedding <=> %s::vector)) AS similarity
-            FROM {agent_episodic_table}
-            ORDER BY similarity DESC
-            LIMIT %s;
-        """, (query_embedding, top_k))
-
-        rows = self.db.cursor.fetchall()
-        results = []
-        for (mem_id, task_query, steps_json, total_reward, strategy_update, meta, created_at, sim) in rows:
-            content_dict = {
-                "memory_id": str(mem_id),
-                "task_query": task_query,
-                "cognitive_steps": steps_json,
-                "total_reward": total_reward,
-                "strategy_update": strategy_update,
-                "metadata": meta,
-                "created_at": created_at.isoformat()
-            }
-            content_str = json.dumps(content_dict)
-            results.append(RetrievedMemory(text=content_str, similarity=sim, context=""))
+        agent_episodic_table = self.db.episodic_memory_table(agent_id)
+        conditions, params = self.db.agent_scope(agent_id)
+        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+
+        with self.db.connection() as cursor:
+            self.db.apply_search_settings(cursor)
+            cursor.execute(
+                agent_memory_query(agent_episodic_table, EPISODIC_COLUMNS, where_clause, exact=self.db.shared_layout),
+                (query_embedding, *params, query_embedding, top_k)
+            )
+            rows = cursor.fetchall()
+
+        return [self._episodic_result(row) for row in rows]
+
+    def search_agent_episodic_memory_batch(self, queries: List[Tuple[str, str]], top_k: int = None) -> Dict[str, List[RetrievedMemory]]:
+        """
+        Search the episodic memory of many agents at once, one query per agent.
+        The queries are embedded in one request and every agent's top_k is answered by one SQL
+        statement: a LATERAL join over the query set in the shared layout, with an exact ranking
+        of each agent's rows (see `agent_memory_query`), a UNION ALL of the per-agent searches otherwise.
+        """
+        if not queries:
+            return {}
+        top_k = top_k or self.config.top_k
+        embeddings = self.embedding_service.get_embeddings([query for _, query in queries])
+        columns = EPISODIC_COLUMNS
+
+        if self.db.shared_layout:
+            query_set = ", ".join(["(%s, %s::vector)"] * len(queries))
+            sql = f"""
+                SELECT q.agent_id, m.*
+                FROM (VALUES {query_set}) AS q(agent_id, embedding)
+                CROSS JOIN LATERAL (
+                    SELECT {columns},
+                           (1 - (e.embedding <=> q.embedding)) AS similarity
+                    FROM (
+                        SELECT * FROM {self.db.episodic_memory_table(queries[0][0])}
+                        WHERE agent_id = q.agent_id
+                        OFFSET 0
+                    ) e
+                    ORDER BY e.embedding <=> q.embedding
+                    LIMIT %s
+                ) m;
+            """
+            params = [value for (agent_id, _), embedding in zip(queries, embeddings) for value in (agent_id, embedding)]
+            params.append(top_k)
+        else:
+            sql = " UNION ALL ".join(
+                f"(SELECT %s AS agent_id, * FROM ({agent_memory_query(self.db.episodic_memory_table(agent_id), columns, 'TRUE')}) nearest)"
+                for agent_id, _ in queries
+            )
+            params = [value for (agent_id, _), embedding in zip(queries, embeddings)
+                      for value in (agent_id, embedding, embedding, top_k)]
+
+        with self.db.connection() as cursor:
+            self.db.apply_search_settings(cursor)
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+
+        results = {agent_id: [] for agent_id, _ in queries}
+        for agent_id, *row in rows:
+            results[agent_id].append(self._episodic_result(row))
+        for agent_results in results.values():
+            agent_results.sort(key=lambda result: result.similarity, reverse=True)
         return results
 
+    @staticmethod
+    def _episodic_result(row) -> RetrievedMemory:
+        mem_id, task_query, steps_json, total_reward, strategy_update, meta, created_at, sim = row
+        content_dict = {
+            "memory_id": str(mem_id),
+            "task_query": task_query,
+            "cognitive_steps": steps_json,
+            "total_reward": total_reward,
+            "strategy_update": strategy_update,
+            "metadata": meta,
+            "created_at": created_at.isoformat()
+        }
+        content_str = json.dumps(content_dict)
+        return RetrievedMemory(text=content_str, similarity=sim, context="")
+
     def _get_context(self, start: int, end: int, full_text: str) -> str:
         """
         Extracts context around a specific text chunk within a full document.
@@ -1,19 +1,114 @@
+import asyncio
 from datetime import datetime, timezone
 import json
 import logging
-from typing import Any, List
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type
+from pydantic import BaseModel
 from trade_agents.agents.market_agent import MarketAgent
-from trade_agents.memory.memory import MemoryObject, BaseMemory
+from trade_agents.inference.message_models import LLMOutput, LLMPromptContext
+from trade_agents.inference.validation import OutputValidator, repair_prompt
+from trade_agents.memory.memory import MemoryObject, BaseMemory, LongTermMemory, ShortTermMemory
+from trade_agents.orchestrators.config import InferenceDeadlineConfig
 from trade_agents.orchestrators.logger_utils import log_perception, log_persona, log_reflection
 
 
 class AgentCognitiveProcessor:
-    def __init__(self, ai_utils, data_inserter, logger: logging.Logger, tool_mode=False):
+    def __init__(self, ai_utils, data_inserter, logger: logging.Logger, tool_mode=False, deadlines: Optional[InferenceDeadlineConfig] = None,
+                 validator: Optional[OutputValidator] = None, reprompt_invalid: bool = True):
         self.ai_utils = ai_utils
         self.data_inserter = data_inserter
         self.logger = logger
         self.tool_mode = tool_mode
+        self.deadlines = deadlines or InferenceDeadlineConfig()
         self.episode_steps = {}
+        self.last_outputs: Dict[Tuple[str, str], LLMOutput] = {}
+        self.skipped_agents: Set[str] = set()
+        # set by the orchestrator at the start of every round, labels the inference metrics
+        self.round_num: Optional[int] = None
+        self.validator = validator or OutputValidator()
+        self.reprompt_invalid = reprompt_invalid
+        # last validated output (e.g. Bid / Ask) of every agent, kept for the repeat_last fallback
+        self.validated_outputs: Dict[str, BaseModel] = {}
+
+    def _metric_labels(self, environment_name: str, phase: str) -> Dict[str, Any]:
+        return {"environment": environment_name, "phase": phase, "round": self.round_num}
+
+    def _phase_deadline(self, phase: str) -> Optional[float]:
+        """Unix time by which the phase's requests must complete, None when the phase has no deadline."""
+        seconds = getattr(self.deadlines, phase)
+        return time.time() + seconds if seconds is not None else None
+
+    def _match_outputs(self, agents: List[MarketAgent], outputs: List[LLMOutput], phase: str, repeatable: bool = True) -> List[Tuple[MarketAgent, LLMOutput]]:
+        """
+        Pair agents with their outputs by source_id and apply the deadline fallback.
+
+        Agents whose request failed or missed the phase deadline either sit the round out
+        ("skip") or reuse their output of the same phase from the previous round ("repeat_last").
+        """
+        outputs_by_id = {output.source_id: output for output in outputs}
+        matched = []
+        for agent in agents:
+            output = outputs_by_id.get(agent.id)
+            if output is not None and not output.error:
+                self.last_outputs[(agent.id, phase)] = output
+                matched.append((agent, output))
+                continue
+            reason = output.error if output is not None else "no output"
+            previous = self.last_outputs.get((agent.id, phase))
+            if repeatable and self.deadlines.fallback == "repeat_last" and previous is not None:
+                self.logger.warning(f"Agent {agent.index} {phase} failed ({reason}), repeating its last {phase}")
+                matched.append((agent, previous))
+            else:
+                self.logger.warning(f"Agent {agent.index} {phase} failed ({reason}), skipping the agent this round")
+                self.skipped_agents.add(agent.id)
+        return matched
+
+    async def _validate_outputs(
+        self,
+        agents: List[MarketAgent],
+        prompts: List[LLMPromptContext],
+        outputs: List[LLMOutput],
+        output_model: Callable[[MarketAgent], Optional[Type[BaseModel]]],
+        environment_name: str,
+        phase: str,
+        deadline: Optional[float],
+    ) -> List[LLMOutput]:
+        """
+        Validate the outputs of a phase against each agent's schema and drop the invalid ones.
+
+        Cheap failures are repaired by the validator; the agents whose outputs still fail are
+        re-prompted once, together in one follow-up batch, if the phase deadline allows it.
+        """
+        agents_by_id = {agent.id: agent for agent in agents}
+        models = {agent.id: output_model(agent) for agent in agents}
+
+        def items(batch: List[LLMOutput]):
+            return [(o.source_id, o, models[o.source_id]) for o in batch if not o.error and models.get(o.source_id)]
+
+        results = await self.validator.validate_batch(items(outputs))
+        failed = [agent_id for agent_id, result in results.items() if not result.ok]
+        if failed and self.reprompt_invalid and (deadline is None or time.time() < deadline):
+            prompts_by_id = {prompt.id: prompt for prompt in prompts}
+            retry_prompts = [repair_prompt(prompts_by_id[agent_id], results[agent_id].error) for agent_id in failed if agent_id in prompts_by_id]
+            self.logger.info(f"Re-prompting {len(retry_prompts)} agents with invalid {phase} outputs")
+            retried = await self.ai_utils.run_parallel_ai_completion(retry_prompts, update_history=False, deadline=deadline, labels=self._metric_labels(environment_name, f"{phase}_repair"))
+            self.data_inserter.insert_ai_requests(self.ai_utils.get_all_requests())
+            retried = [output for output in retried if not output.error]
+            results.update(await self.validator.validate_batch(items(retried)))
+            retried_by_id = {output.source_id: output for output in retried}
+            outputs = [retried_by_id.get(output.source_id, output) for output in outputs]
+
+        valid = []
+        for output in outputs:
+            result = results.get(output.source_id)
+            if result is not None and not result.ok:
+                self.logger.warning(f"Agent {agents_by_id[output.source_id].index} {phase} output is invalid: {result.error}")
+                continue
+            if result is not None:
+                self.validated_outputs[output.source_id] = result.value
+            valid.append(output)
+        return valid
 
     def _get_safe_id(self, agent_id: str) -> str:
         """Get sanitized agent ID consistent with memory storage"""
@@ -48,17 +143,34 @@ class AgentCognitiveProcessor:
             self.logger.warning(f"Failed to serialize content: {e}")
             return str(content)
 
+    async def _retrieve_perception_memories(self, agents: List[MarketAgent], environment_name: str) -> Dict[str, Tuple[list, list]]:
+        """Recent and episodic memories of all the agents, with one query each for the whole population."""
+        recent, episodes = await asyncio.gather(
+            ShortTermMemory.retrieve_recent_memories_batch([agent.short_term_memory for agent in agents], limit=5),
+            LongTermMemory.retrieve_episodic_memories_batch(
+                [(agent.long_term_memory, agent.perception_query(environment_name)) for agent in agents], top_k=2
+            )
+        )
+        return {agent.id: (recent.get(agent.id, []), episodes.get(agent.id, [])) for agent in agents}
+
     async def run_parallel_perceive(self, agents: List[MarketAgent], environment_name: str) -> List[Any]:
+        # a new perception starts a new round for the deadline fallback; cohorts may share the
+        # processor concurrently, so only the agents of this call are reset
+        self.skipped_agents.difference_update(agent.id for agent in agents)
+        memories = await self._retrieve_perception_memories(agents, environment_name)
         perception_prompts = []
         for agent in agents:
-            perception_prompt = await agent.perceive(environment_name, return_prompt=True, structured_tool=self.tool_mode)
+            perception_prompt = await agent.perceive(environment_name, return_prompt=True, structured_tool=self.tool_mode,
+                                                     memories=memories[agent.id])
             perception_prompts.append(perception_prompt)
         
-        perceptions = await self.ai_utils.run_parallel_ai_completion(perception_prompts, update_history=False)
+        perceptions = await self.ai_utils.run_parallel_ai_completion(perception_prompts, update_history=False, deadline=self._phase_deadline("perceive"), labels=self._metric_labels(environment_name, "perceive"))
         self.data_inserter.insert_ai_requests(self.ai_utils.get_all_requests())
+        matched = self._match_outputs(agents, perceptions, "perceive")
         
         # Log personas and perceptions, and store in memory
-        for agent, perception in zip(agents, perceptions):
+        memory_writes = []
+        for agent, perception in matched:
             safe_id = self._get_safe_id(agent.id)
             if safe_id not in self.episode_steps:
                 self.episode_steps[safe_id] = []
@@ -75,23 +187,37 @@ class AgentCognitiveProcessor:
                 metadata={"environment": environment_name},
                 created_at=datetime.now(timezone.utc)
             )
-            await agent.short_term_memory.store_memory(memory_obj)
+            memory_writes.append((agent.short_term_memory, memory_obj))
             self.episode_steps[safe_id].append(memory_obj)
             agent.last_perception = perception_content
 
-        return perceptions
+        await ShortTermMemory.store_memories_bulk(memory_writes)
+        return [perception for _, perception in matched]
 
-    async def run_parallel_action(self, agents: List[MarketAgent], environment_name: str) -> List[Any]:
+    async def run_parallel_action(self, agents: List[MarketAgent], environment_name: str,
+                                  output_model: Optional[Callable[[MarketAgent], Optional[Type[BaseModel]]]] = None) -> List[Any]:
+        """
+        Generate the actions of the agents in parallel.
+
+        If `output_model` maps an agent to the schema of its action, the actions are validated
+        (and repaired or re-prompted) and the validated models are kept in `validated_outputs`.
+        """
         action_prompts = []
+        agents = [agent for agent in agents if agent.id not in self.skipped_agents]
         for agent in agents:
             action_prompt = await agent.generate_action(environment_name, agent.last_perception, return_prompt=True, structured_tool=self.tool_mode)
             action_prompts.append(action_prompt)
             
-        actions = await self.ai_utils.run_parallel_ai_completion(action_prompts, update_history=False)
+        deadline = self._phase_deadline("act")
+        actions = await self.ai_utils.run_parallel_ai_completion(action_prompts, update_history=False, deadline=deadline, labels=self._metric_labels(environment_name, "act"))
         self.data_inserter.insert_ai_requests(self.ai_utils.get_all_requests())
+        if output_model is not None:
+            actions = await self._validate_outputs(agents, action_prompts, actions, output_model, environment_name, "act", deadline)
+        matched = self._match_outputs(agents, actions, "act")
         
         # Store actions in memory
-        for agent, action in zip(agents, actions):
+        memory_writes = []
+        for agent, action in matched:
             safe_id = self._get_safe_id(agent.id)
             if safe_id not in self.episode_steps:
                 self.episode_steps[safe_id] = []
@@ -104,10 +230,11 @@ class AgentCognitiveProcessor:
                 metadata={"environment": environment_name},
                 created_at=datetime.now(timezone.utc)
             )
-            await agent.short_term_memory.store_memory(memory_obj)
+            memory_writes.append((agent.short_term_memory, memory_obj))
             self.episode_steps[safe_id].append(memory_obj)
-            
-        return actions
+
+        await ShortTermMemory.store_memories_bulk(memory_writes)
+        return [action for _, action in matched]
 
     async def run_parallel_reflect(self, agents: List[MarketAgent], environment_name: str) -> None:
         reflection_prompts = []
@@ -120,10 +247,11 @@ class AgentCognitiveProcessor:
                 agents_with_observations.append(agent)
                 
         if reflection_prompts:
-            reflections = await self.ai_utils.run_parallel_ai_completion(reflection_prompts, update_history=False)
+            reflections = await self.ai_utils.run_parallel_ai_completion(reflection_prompts, update_history=False, deadline=self._phase_deadline("reflect"), labels=self._metric_labels(environment_name, "reflect"))
             self.data_inserter.insert_ai_requests(self.ai_utils.get_all_requests())
             
-            for agent, reflection in zip(agents_with_observations, reflections):
+            memory_writes = []
+            for agent, reflection in self._match_outputs(agents_with_observations, reflections, "reflect", repeatable=False):
                 safe_id = self._get_safe_id(agent.id)
                 if safe_id not in self.episode_steps:
                     self.episode_steps[safe_id] = []
@@ -164,7 +292,7 @@ class AgentCognitiveProcessor:
                         },
                         created_at=datetime.now(timezone.utc)
                     )
-                    await agent.short_term_memory.store_memory(memory_obj)
+                    memory_writes.append((agent.short_term_memory, memory_obj))
                     self.episode_steps[safe_id].append(memory_obj)
 
                     # Store episodic memory and clear episode steps
@@ -183,4 +311,6 @@ class AgentCognitiveProcessor:
                             "observation": agent.last_observation
                         }
                     )
-                    self.episode_steps[safe_id].clear()
\ No newline at end of file
+                    self.episode_steps[safe_id].clear()
+
+            await ShortTermMemory.store_memories_bulk(memory_writes)
\ No newline at end of file
@@ -4,7 +4,7 @@ import asyncio
 from datetime import datetime
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Type
 
 from trade_agents.orchestrators.base_orchestrator import BaseEnvironmentOrchestrator
 from trade_agents.agents.market_agent import MarketAgent
@@ -20,6 +20,7 @@ from trade_agents.environments.mechanisms.auction import (
 from trade_agents.economics.econ_models import (
     Ask,
     Bid,
+    MarketAction,
     Trade
 )
 from trade_agents.orchestrators.config import AuctionConfig, OrchestratorConfig
@@ -106,7 +107,7 @@ class AuctionOrchestrator(BaseEnvironmentOrchestrator):
         self.tracker = AuctionTracker()
         self.agent_surpluses: Dict[str, float] = {}
         self.logger = logger or logging.getlogger(__name__)
-        self.cognitive_processor = AgentCognitiveProcessor(ai_utils, data_inserter, self.logger, self.orchestrator_config.tool_mode)
+        self.cognitive_processor = AgentCognitiveProcessor(ai_utils, data_inserter, self.logger, self.orchestrator_config.tool_mode, self.orchestrator_config.inference_deadlines)
 
         
     async def setup_environment(self):
@@ -149,6 +150,7 @@ class AuctionOrchestrator(BaseEnvironmentOrchestrator):
 
     async def run_environment(self, round_num: int):
         log_running(self.logger, self.environment_name)
+        self.cognitive_processor.round_num = round_num
         env = self.environment
 
         # Reset agents' pending orders at the beginning of the round
@@ -185,7 +187,8 @@ class AuctionOrchestrator(BaseEnvironmentOrchestrator):
         # Run agents' action generation in parallel using imported cognitive method
         actions = await self.cognitive_processor.run_parallel_action(
             self.agents,
-            self.environment_name
+            self.environment_name,
+            output_model=self.action_model
         )
 
         actions_map = {action.source_id: action for action in actions}
@@ -194,31 +197,19 @@ class AuctionOrchestrator(BaseEnvironmentOrchestrator):
         agent_actions = {}
         for agent in self.agents:
             action = actions_map.get(agent.id)
-            if action:
-                try:
-                    action_content = action.json_object.object if action.json_object else json.loads(action.str_content or '{}')
-                    agent.last_action = action_content
-                    if 'price' in action_content and 'quantity' in action_content:
-                        action_content['quantity'] = 1  # Ensure quantity is 1
-
-                        if agent.role == "buyer":
-                            auction_action = Bid(**action_content)
-                        elif agent.role == "seller":
-                            auction_action = Ask(**action_content)
-                        else:
-                            raise ValueError(f"Invalid agent role: {agent.role}")
-
-                        agent_actions[agent.id] = AuctionAction(agent_id=agent.id, action=auction_action)
-                        # Update agent's pending orders
-                        good_name = env.mechanism.good_name
-                        agent.economic_agent.pending_orders.setdefault(good_name, []).append(auction_action)
-
-                        action_type = "Bid" if isinstance(auction_action, Bid) else "Ask"
-                        log_action(self.logger, agent.index, f"{action_type}: {auction_action}")
-                    else:
-                        raise ValueError(f"Invalid action content: {action_content}")
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
-                    self.logger.error(f"Error creating AuctionAction for agent {agent.index}: {str(e)}")
+            # actions were validated (and repaired or re-prompted) against the agent's Bid / Ask schema
+            auction_action = self.cognitive_processor.validated_outputs.get(agent.id) if action else None
+            if auction_action is not None:
+                agent.last_action = auction_action.model_dump(include={"price", "quantity"})
+                agent_actions[agent.id] = AuctionAction(agent_id=agent.id, action=auction_action)
+                # Update agent's pending orders
+                good_name = env.mechanism.good_name
+                agent.economic_agent.pending_orders.setdefault(good_name, []).append(auction_action)
+
+                action_type = "Bid" if isinstance(auction_action, Bid) else "Ask"
+                log_action(self.logger, agent.index, f"{action_type}: {auction_action}")
+            elif action:
+                self.logger.error(f"Error creating AuctionAction for agent {agent.index}: invalid action content")
             else:
                 self.logger.warning(f"No action found for agent {agent.index}")
 
@@ -246,6 +237,15 @@ class AuctionOrchestrator(BaseEnvironmentOrchestrator):
             self.environment_name
         )
 
+    @staticmethod
+    def action_model(agent: MarketAgent) -> Optional[Type[MarketAction]]:
+        """Schema an agent's action is validated against, None for an invalid role."""
+        if agent.role == "buyer":
+            return Bid
+        elif agent.role == "seller":
+            return Ask
+        return None
+
     def set_agent_system_messages(self, round_num: int, good_name: str):
         # Set system messages for agents based on their role and round number
         for agent in self.agents:
@@ -1,7 +1,7 @@
 # config.py
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Union
+from typing import List, Dict, Literal, Optional, Union
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import yaml
 from pathlib import Path
@@ -42,6 +42,25 @@ class LLMConfigModel(BaseModel):
     temperature: float
     max_tokens: int
     use_cache: bool
+    fallback_pool: List[str] = Field(default_factory=list, description="Names of other llm_configs the router may use for these agents")
+    prompt_layout: Literal["default", "cache_friendly"] = Field(default="default", description="Prompt layout, cache_friendly keeps a stable prefix for provider prompt caching")
+
+class OfflineBackendConfig(BaseModel):
+    backend: Literal["scripted", "local_model"] = Field(default="scripted", description="'scripted' synthesizes schema-valid outputs, 'local_model' runs a GGUF model in process")
+    model_path: Optional[str] = Field(default=None, description="GGUF model file of the local_model backend")
+    latency_distribution: Literal["constant", "uniform", "normal", "lognormal"] = "lognormal"
+    latency_mean: float = Field(default=0.5, description="Mean simulated latency in seconds")
+    latency_stddev: float = Field(default=0.2, description="Standard deviation of the simulated latency in seconds")
+    seed: int = 0
+    error_rate: float = Field(default=0.0, description="Share of requests failing with an injected server error")
+
+class InferenceDeadlineConfig(BaseModel):
+    perceive: Optional[float] = Field(default=None, description="Seconds the perception phase may take, None waits for every agent")
+    act: Optional[float] = Field(default=None, description="Seconds the action phase may take")
+    reflect: Optional[float] = Field(default=None, description="Seconds the reflection phase may take")
+    request_timeout: Optional[float] = Field(default=None, description="Timeout of a single request attempt in seconds")
+    hedge_requests: bool = Field(default=False, description="Duplicate requests that run longer than the observed p95 latency")
+    fallback: Literal["skip", "repeat_last"] = Field(default="skip", description="What an agent does when its request misses the deadline: sit the round out or repeat its last output")
 
 class DatabaseConfig(BaseSettings):
     db_type: str = "postgres"
@@ -61,8 +80,16 @@ class OrchestratorConfig(BaseSettings):
     environment_configs: Dict[str, Union[AuctionConfig, GroupChatConfig]]
     environment_order: List[str]
     protocol: str
-    database_config: DatabaseConfig = DatabaseConfig()
+    database_config: DatabaseConfig = Field(default_factory=DatabaseConfig)
     tool_mode: bool
+    inference_deadlines: InferenceDeadlineConfig = Field(default_factory=InferenceDeadlineConfig)
+    inference_mode: Literal["online", "batch"] = Field(default="online", description="'batch' runs OpenAI/Anthropic rounds through the provider batch APIs")
+    batch_poll_interval: float = Field(default=30.0, description="Seconds between batch status polls")
+    batch_max_wait: Optional[float] = Field(default=None, description="Seconds after which a running batch is cancelled")
+    offline_backend: Optional[OfflineBackendConfig] = Field(default=None, description="Run every agent against an in-process backend instead of the providers")
+    vllm_prefix_batching: bool = Field(default=False, description="Group vLLM prompts by shared prefix and send each group's leader first")
+    metrics_file: Optional[str] = Field(default=None, description="Prometheus text file the inference metrics are written to after every round")
+    metrics_port: Optional[int] = Field(default=None, description="Port of a local /metrics endpoint serving the inference metrics")
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')
 
 def load_config(config_path: Path) -> OrchestratorConfig:
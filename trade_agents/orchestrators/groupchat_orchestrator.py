@@ -53,7 +53,7 @@ class GroupChatOrchestrator:
         self.api_utils = GroupChatAPIUtils(self.config.groupchat_api_url, self.logger)
 
         # Initialize cognitive processor
-        self.cognitive_processor = AgentCognitiveProcessor(ai_utils, data_inserter, self.logger, self.orchestrator_config.tool_mode)
+        self.cognitive_processor = AgentCognitiveProcessor(ai_utils, data_inserter, self.logger, self.orchestrator_config.tool_mode, self.orchestrator_config.inference_deadlines)
 
         # Agent dictionary for quick lookup
         self.agent_dict = {agent.id: agent for agent in agents}
@@ -151,6 +151,7 @@ class GroupChatOrchestrator:
             round_num (int): The current round number.
         """
         log_round(self.logger, round_num)
+        self.cognitive_processor.round_num = round_num
 
         # Select topic proposers
         await self.select_topic_proposers()
@@ -232,7 +233,9 @@ class GroupChatOrchestrator:
             proposer_prompts.append(prompt)
 
         # Run prompts in parallel
-        proposals = await self.ai_utils.run_parallel_ai_completion(proposer_prompts, update_history=False)
+        proposals = await self.ai_utils.run_parallel_ai_completion(
+            proposer_prompts, update_history=False, labels={"environment": self.config.name, "phase": "propose_topic", "round": round_num}
+        )
         self.data_inserter.insert_ai_requests(self.ai_utils.get_all_requests())
 
         tasks = []
@@ -317,7 +320,9 @@ class GroupChatOrchestrator:
             # Agents perceive the messages
             perceptions = await self.cognitive_processor.run_parallel_perceive(cohort_agents, self.config.name)
             # Log personas and perceptions
-            for agent, perception in zip(cohort_agents, perceptions):
+            agents_by_id = {agent.id: agent for agent in cohort_agents}
+            for perception in perceptions:
+                agent = agents_by_id[perception.source_id]
                 log_persona(self.logger, agent.index, agent.persona)
                 log_perception(
                     self.logger, 
@@ -338,7 +343,9 @@ class GroupChatOrchestrator:
             messages_to_insert = []
             api_tasks = []
 
-            for agent, action in zip(cohort_agents, actions):
+            agents_by_id = {agent.id: agent for agent in cohort_agents}
+            for action in actions:
+                agent = agents_by_id[action.source_id]
                 content = self.extract_message_content(action)
                 if content:
                     # Prepare API task
@@ -469,7 +469,7 @@ class SimulationDataInserter:
                 'system': system_message,
                 'tools': request.completion_kwargs.get('tools', []),
                 'tool_choice': request.completion_kwargs.get('tool_choice', {}),
-                'raw_response': request.raw_result,
+                'raw_response': request.raw_json,
                 'completion_tokens': request.usage.completion_tokens if request.usage else None,
                 'prompt_tokens': request.usage.prompt_tokens if request.usage else None,
                 'total_tokens': request.usage.total_tokens if request.usage else None
@@ -504,7 +504,7 @@ class SimulationDataInserter:
                         request['system'],
                         json.dumps(request.get('tools', [])),
                         json.dumps(request.get('tool_choice', {})),
-                        json.dumps(request['raw_response']),
+                        request['raw_response'],
                         request['completion_tokens'],
                         request['prompt_tokens'],
                         request['total_tokens']
@@ -516,6 +516,44 @@ class SimulationDataInserter:
             logging.error(f"Error inserting AI requests: {str(e)}")
             raise
 
+    def insert_inference_metrics(self, metrics_rows: List[Dict[str, Any]]):
+        """Insert the per round, environment, phase and model inference aggregates (InferenceMetrics.phase_breakdown)."""
+        if not metrics_rows:
+            return
+        query = """
+        INSERT INTO inference_phase_metrics
+        (round, environment_name, phase, client, model, requests, errors, retries,
+        wall_time, share_of_round_time, latency_p50, latency_p95, input_tokens,
+        output_tokens, cache_read_input_tokens, cache_creation_input_tokens)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        try:
+            with self.conn.cursor() as cur:
+                for row in metrics_rows:
+                    cur.execute(query, (
+                        row['round'],
+                        row['environment'],
+                        row['phase'],
+                        row['client'],
+                        row['model'],
+                        row['requests'],
+                        row['errors'],
+                        row['retries'],
+                        row['wall_time'],
+                        row['share_of_round_time'],
+                        row['latency_p50'],
+                        row['latency_p95'],
+                        row['input_tokens'],
+                        row['output_tokens'],
+                        row['cache_read_input_tokens'],
+                        row['cache_creation_input_tokens']
+                    ))
+            self.conn.commit()
+            logging.info(f"Inserted {len(metrics_rows)} inference metrics rows")
+        except Exception as e:
+            self.conn.rollback()
+            logging.error(f"Error inserting inference metrics: {str(e)}")
+
     def insert_round_data(
         self, 
         round_num: int, 
@@ -6,10 +6,10 @@ import os
 import random
 import uuid
 from pathlib import Path
-from typing import List, Dict, Optional, Union
+from typing import Any, List, Dict, Optional, Union
 import warnings
 
-from trade_agents.memory.embedding import MemoryEmbedder
+from trade_agents.memory.embedding import close_async_sessions, get_embedder
 from trade_agents.memory.knowledge_base import MarketKnowledgeBase
 from trade_agents.memory.knowledge_base_agent import KnowledgeBaseAgent
 from trade_agents.memory.vector_search import MemoryRetriever
@@ -30,8 +30,10 @@ from trade_agents.economics.econ_models import (
     SellerPreferenceSchedule,
 )
 from trade_agents.inference.parallel_inference import ParallelAIUtilities, RequestLimits
+from trade_agents.inference.local_backend import LatencyModel, LocalBackend, create_local_backend
+from trade_agents.inference.registry import register_ai_utilities
 from trade_agents.orchestrators.base_orchestrator import BaseEnvironmentOrchestrator
-from trade_agents.orchestrators.config import OrchestratorConfig, load_config
+from trade_agents.orchestrators.config import LLMConfigModel, OrchestratorConfig, load_config
 from trade_agents.orchestrators.insert_simulation_data import SimulationDataInserter
 from trade_agents.memory.setup_db import DatabaseConnection
 from trade_agents.memory.config import MarketMemoryConfig, load_config_from_yaml
@@ -54,7 +56,9 @@ class MetaOrchestrator:
         self.ai_utils = self._initialize_ai_utils()
         self.memory_config = self._initialize_memory_config()
         self.db_conn = self._initialize_database()
-        self.embedder = MemoryEmbedder(config=self.memory_config)
+        self.embedder = get_embedder(self.memory_config)
+        if self.embedder.cache is not None:
+            self.ai_utils.metrics.register_collector(self.embedder.cache.to_prometheus_text)
         self.data_inserter = self._initialize_data_inserter()
         self.logger = orchestration_logger
         self.environment_order = environment_order or config.environment_order
@@ -77,9 +81,30 @@ class MetaOrchestrator:
         anthropic_request_limits = RequestLimits(max_requests_per_minute=20000, max_tokens_per_minute=2000000)
         ai_utils = ParallelAIUtilities(
             oai_request_limits=oai_request_limits,
-            anthropic_request_limits=anthropic_request_limits
+            anthropic_request_limits=anthropic_request_limits,
+            request_timeout=self.config.inference_deadlines.request_timeout,
+            hedge_requests=self.config.inference_deadlines.hedge_requests,
+            inference_mode=self.config.inference_mode,
+            batch_poll_interval=self.config.batch_poll_interval,
+            batch_max_wait=self.config.batch_max_wait,
+            vllm_prefix_batching=self.config.vllm_prefix_batching,
+            local_backend=self._initialize_offline_backend()
+        )
+        # agents calling execute() directly share the orchestrator's limiters and caches
+        return register_ai_utilities(ai_utils)
+
+    def _initialize_offline_backend(self) -> Optional[LocalBackend]:
+        offline = self.config.offline_backend
+        if offline is None:
+            return None
+        self.logger.info(f"Running inference offline with the {offline.backend} backend")
+        return create_local_backend(
+            offline.backend,
+            model_path=offline.model_path,
+            latency=LatencyModel(distribution=offline.latency_distribution, mean=offline.latency_mean, stddev=offline.latency_stddev),
+            seed=offline.seed,
+            error_rate=offline.error_rate,
         )
-        return ai_utils
 
     def _initialize_data_inserter(self):
         db_config = self.config.database_config
@@ -167,9 +192,9 @@ class MetaOrchestrator:
         self.db_conn.init_agent_episodic_memory(agent_ids)
 
         for i, persona in enumerate(personas):
-            agent_uuid = str(uuid.uuid4())
+            agent_uuid = agent_ids[i]
             # Randomly assign an LLM config if there are multiple configs
-            llm_config = random.choice(self.config.llm_configs).dict() if len(self.config.llm_configs) > 1 else self.config.llm_configs[0].dict()
+            llm_config = self._resolve_llm_config(random.choice(self.config.llm_configs) if len(self.config.llm_configs) > 1 else self.config.llm_configs[0])
             # Assign roles explicitly based on index
             if i < num_buyers:
                 is_buyer = True
@@ -259,6 +284,22 @@ class MetaOrchestrator:
             self.agents.append(agent)
             log_agent_init(self.logger, agent.index, is_buyer, persona)
 
+    def _resolve_llm_config(self, llm_config_model: LLMConfigModel) -> Dict[str, Any]:
+        # Expand the fallback pool names into the configs the router can choose from
+        llm_config = llm_config_model.dict()
+        configs_by_name = {c.name: c for c in self.config.llm_configs}
+        fallback_pool = []
+        for name in llm_config.pop('fallback_pool', []):
+            if name not in configs_by_name:
+                self.logger.warning(f"Unknown llm_config '{name}' in fallback_pool of '{llm_config_model.name}'")
+                continue
+            fallback_config = configs_by_name[name].dict()
+            fallback_config.pop('fallback_pool', None)
+            fallback_pool.append(fallback_config)
+        if fallback_pool:
+            llm_config['fallback_pool'] = fallback_pool
+        return llm_config
+
     def _initialize_environment_orchestrators(self) -> Dict[str, BaseEnvironmentOrchestrator]:
         orchestrators = {}
         
@@ -336,21 +377,57 @@ class MetaOrchestrator:
                     await orchestrator.process_round_results(round_num)
                     
                     self.logger.info(f"Completed {env_name} environment for round {round_num}")
+                    self.log_inference_usage()
                 except Exception as e:
                     self.logger.error(f"Error running {env_name} environment: {str(e)}")
                     raise e
+            self.record_inference_metrics(round_num)
 
         # Print summaries for each environment
         for orchestrator in self.environment_orchestrators.values():
             orchestrator.print_summary()
+        self.log_inference_usage()
+
+    def log_inference_usage(self):
+        usage = self.ai_utils.usage_summary()
+        self.logger.info(
+            f"Inference usage: {usage['requests']} requests, {usage['input_tokens']} input tokens "
+            f"({usage['cache_read_input_tokens']} cache reads, {usage['cache_creation_input_tokens']} cache writes, "
+            f"hit rate {usage['cache_hit_rate']:.1%}), {usage['output_tokens']} output tokens"
+            + (f", usage estimated for {usage['estimated_requests']} early-resolved requests" if usage['estimated_requests'] else "")
+        )
+
+    def record_inference_metrics(self, round_num: int):
+        """Store the round's per phase and model inference aggregates and refresh the Prometheus file."""
+        metrics = self.ai_utils.metrics
+        rows = metrics.phase_breakdown(round_num)
+        self.data_inserter.insert_inference_metrics(rows)
+        for env_name in self.environment_order:
+            dominant_phase = metrics.dominant_phase(round_num, env_name)
+            if dominant_phase:
+                self.logger.info(f"Round {round_num} {env_name}: inference time dominated by the {dominant_phase} phase")
+        if self.config.metrics_file:
+            metrics.write_prometheus_file(self.config.metrics_file)
 
     async def start(self):
         print_ascii_art()
         log_section(self.logger, "Simulation Starting")
+        metrics_runner = None
+        if self.config.metrics_port:
+            metrics_runner = await self.ai_utils.metrics.serve(port=self.config.metrics_port)
         try:
             await self.run_simulation()
             log_completion(self.logger, "Simulation completed successfully")
         finally:
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+            # short-term memories written behind the local index
+            agents = [agent for agent in self.agents if agent.short_term_memory]
+            results = await asyncio.gather(*(agent.short_term_memory.flush() for agent in agents), return_exceptions=True)
+            for agent, result in zip(agents, results):
+                if isinstance(result, BaseException):
+                    self.logger.error(f"Error flushing short-term memory of agent {agent.id}: {str(result)}")
+            await close_async_sessions()
             # Clean up database connection
             self.db_conn.close()
 